@@ -0,0 +1,158 @@
+"""Comment anchors: the elements comments point at within a page.
+
+Many comments anchor to the same element with selectors that differ only in
+spacing (``div>p`` and ``div > p``).  Comments store a ``selector_key``, a
+hash of the normalized selector, so a page's comments can be grouped by
+anchor through the ``(cospace_id, page_url, selector_key)`` index and the
+extension resolves each distinct selector once.
+
+Once a page has rendered, the extension resolves the page's anchors and
+reports which selectors it could not find.  ``anchor_status`` counts the
+distinct users and days an anchor failed on since it last resolved (one
+``anchor_failure`` row each), so a client repeating its report adds nothing.
+Anchors that keep failing can be flagged for review; their comments are kept.
+"""
+import hashlib
+from datetime import datetime
+from sqlalchemy import bindparam, delete, event, select, update
+from .db import db
+from .models import AnchorFailure, AnchorStatus, Comment
+
+MAX_SELECTOR_LENGTH = 512
+COMBINATORS = '>+~,'
+
+
+def normalize_selector(selector):
+    """Collapse whitespace and space combinators evenly, outside of strings,
+    attribute brackets and parentheses."""
+    if not selector or not isinstance(selector, str):
+        return None
+    out = []
+    quote = None
+    depth = 0
+    space = False
+    for ch in selector.strip():
+        if quote:
+            out.append(ch)
+            if ch == quote:
+                quote = None
+            continue
+        if depth == 0 and ch.isspace():
+            space = True
+            continue
+        if depth == 0 and ch in COMBINATORS:
+            out.append(', ' if ch == ',' else f' {ch} ')
+            space = False
+            continue
+        if space and out and not out[-1].endswith(' '):
+            out.append(' ')
+        space = False
+        if ch in '"\'':
+            quote = ch
+        elif ch in '[(':
+            depth += 1
+        elif ch in '])':
+            depth = max(0, depth - 1)
+        out.append(ch)
+    normalized = ''.join(out).strip()
+    return normalized[:MAX_SELECTOR_LENGTH] or None
+
+
+def selector_key(selector):
+    normalized = normalize_selector(selector)
+    if normalized is None:
+        return None
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+@event.listens_for(Comment.selector, 'set')
+def _set_selector_key(comment, value, oldvalue, initiator):
+    comment.selector_key = selector_key(value)
+
+
+def group(rows):
+    """Group id-ordered comment rows by anchor, in order of each anchor's first
+    comment; comments without a selector form an anchor keyed None."""
+    anchors = {}
+    for row in rows:
+        anchor = anchors.get(row.selector_key)
+        if anchor is None:
+            anchor = anchors[row.selector_key] = {
+                'key': row.selector_key, 'selector': normalize_selector(row.selector), 'rows': []}
+        anchor['rows'].append(row)
+    return list(anchors.values())
+
+
+def record_report(cospace_id, page_url, user_id, resolved, unresolved, now=None):
+    """Record which anchors of a page ``user_id``'s extension found; returns
+    how many known anchors the report covered.
+
+    ``resolved`` and ``unresolved`` are selectors as the client has them.
+    Selectors of no live comment on the page are ignored.  A failure counts
+    once per user and day; resolving an anchor forgets its failures.
+    """
+    now = now or datetime.utcnow()
+    reported = {}
+    for found, selectors in ((True, resolved), (False, unresolved)):
+        for selector in selectors:
+            key = selector_key(selector)
+            if key is not None:
+                # a failure anywhere in the report wins over a success
+                reported[key] = reported.get(key, True) and found
+    if not reported:
+        return 0
+    known = set(db.session.scalars(
+        select(Comment.selector_key).distinct()
+        .where(Comment.cospace_id == cospace_id, Comment.page_url == page_url,
+               Comment.deleted_at.is_(None), Comment.selector_key.in_(reported))))
+    statuses = {s.selector_key: s for s in AnchorStatus.query.filter(
+        AnchorStatus.cospace_id == cospace_id, AnchorStatus.page_url == page_url,
+        AnchorStatus.selector_key.in_(known))}
+    found = [statuses[key].id for key in known if reported[key] and key in statuses]
+    if found:
+        db.session.execute(delete(AnchorFailure).where(AnchorFailure.status_id.in_(found)))
+        db.session.execute(delete(AnchorStatus).where(AnchorStatus.id.in_(found)))
+    failed = []
+    for key in known:
+        if reported[key]:
+            continue
+        status = statuses.get(key)
+        if status is None:
+            status = AnchorStatus(cospace_id=cospace_id, page_url=page_url, selector_key=key,
+                                  failures=0, first_failed_at=now, last_failed_at=now)
+            db.session.add(status)
+        failed.append(status)
+    if not failed:
+        return len(known)
+    db.session.flush()
+    day = now.date()
+    counted = set(db.session.scalars(
+        select(AnchorFailure.status_id)
+        .where(AnchorFailure.status_id.in_([s.id for s in failed]),
+               AnchorFailure.user_id == user_id, AnchorFailure.day == day)))
+    for status in failed:
+        if status.id in counted:
+            continue
+        db.session.add(AnchorFailure(status_id=status.id, user_id=user_id, day=day))
+        status.failures += 1
+        status.last_failed_at = now
+    return len(known)
+
+
+def backfill_selector_keys(connection, batch_size=1000):
+    """Compute ``selector_key`` for comments saved before it existed."""
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(Comment.id, Comment.selector)
+            .where(Comment.id > last_id, Comment.selector.is_not(None), Comment.selector_key.is_(None))
+            .order_by(Comment.id).limit(batch_size)).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        changes = [{'comment_id': r.id, 'key': selector_key(r.selector)} for r in rows]
+        connection.execute(
+            update(Comment.__table__)
+            .where(Comment.__table__.c.id == bindparam('comment_id'))
+            .values(selector_key=bindparam('key')),
+            changes)
@@ -1,38 +1,91 @@
 from flask import Blueprint, request, jsonify, session, current_app
-from .models import User, Team, CoSpace, Comment, TeamMember
+from .models import AnchorFailure, AnchorStatus, User, Team, CoSpace, CoSpaceAuthor, Comment, TeamMember
 from .db import db
-from .socketio import socketio
+from sqlalchemy import and_, exists, func, or_, select
+from sqlalchemy.exc import IntegrityError
 from itsdangerous import URLSafeSerializer
-import json, requests
+import hashlib
+import json
 import time
-try:
-    import eventlet
-except Exception:
-    eventlet = None
+from datetime import datetime, timedelta
+from .notify import hub
+from .serializers import (COMMENT_FIELDS, COUNTER_COLUMNS, comment_rows, compact_comment, serialize_change,
+                          serialize_comment, serialize_counters)
+from . import anchors, broadcast, retention, search
+from .changes import tombstone
+from .pages import normalize_page_url, page_url_from_metadata
+from .authz import current_user, cospace_team_id, team_role, require_roles, invalidate_team
 
 api_bp = Blueprint('api', __name__)
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+MAX_BATCH_SIZE = 500
 
-def current_user():
-    uid = session.get('user_id')
-    if not uid:
-        return None
-    return User.query.get(uid)
 
+def page_limit():
+    limit = request.args.get('limit', type=int, default=DEFAULT_PAGE_SIZE)
+    return max(1, min(limit, MAX_PAGE_SIZE))
 
-def get_membership(user, team):
-    if not user or not team:
-        return None
-    return TeamMember.query.filter_by(team_id=team.id, user_id=user.id).first()
 
+def etag_for(*parts):
+    """Strong validator for a listing; the query string is part of it because
+    every page or filter of a listing is a separate representation."""
+    raw = '|'.join(str(p) for p in parts + (request.query_string.decode(),))
+    return hashlib.sha1(raw.encode()).hexdigest()
 
-def require_roles(user, team, roles):
-    if team.owner_id == user.id:
-        return True
-    m = get_membership(user, team)
-    if not m:
-        return False
-    return m.role in roles
+
+def not_modified(etag):
+    """A 304 response if the client already holds ``etag``, otherwise None."""
+    # weak comparison: compressed responses carry the ETag as weak (see compress.py)
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        return with_etag(response, etag)
+    return None
+
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # responses depend on the session, so shared caches must not store them
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def compact_format():
+    """Whether the client asked for comments as arrays of ``COMMENT_FIELDS``."""
+    return request.args.get('format') == 'compact'
+
+
+def keyset_page(query, limit):
+    """Fetch one page of an id-ordered query; returns (rows, next_cursor)."""
+    return split_page(query.limit(limit + 1).all(), limit)
+
+
+def split_page(rows, limit):
+    """Cut up to ``limit + 1`` id-ordered rows into (rows, next_cursor)."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+
+def park(cospace_id, timeout, fetch):
+    """Call ``fetch()`` until it returns something truthy or ``timeout`` seconds
+    pass, parking on the notification hub between attempts."""
+    deadline = time.time() + timeout
+    # register before querying so a commit between the query and the wait still wakes us
+    with hub.listen(cospace_id) as waiter:
+        while True:
+            result = fetch()
+            if result:
+                return result
+            remaining = deadline - time.time()
+            # end the read transaction before parking: it returns the connection to
+            # the pool and lets the next query see newly committed rows
+            db.session.rollback()
+            if remaining <= 0 or not waiter.wait(remaining):
+                return result
+            waiter.event.clear()
 
 
 @api_bp.route('/me')
@@ -50,9 +103,9 @@ def create_team():
         return jsonify({'error': 'not authenticated'}), 401
     data = request.json or {}
     name = data.get('name')
-    team = Team(name=name, owner=user)
+    team = Team(name=name, owner_id=user.id)
     # add TeamMember record with owner role
-    tm = TeamMember(team=team, user=user, role='owner')
+    tm = TeamMember(team=team, user_id=user.id, role='owner')
     team.memberships.append(tm)
     db.session.add(team)
     db.session.commit()
@@ -64,9 +117,22 @@ def list_teams():
     user = current_user()
     if not user:
         return jsonify({'error': 'not authenticated'}), 401
-    # return teams where user is a member
-    out = [{'id': t.id, 'name': t.name} for t in user.teams]
-    return jsonify(out)
+    # joining or leaving a team adds or removes one of the user's membership rows
+    count, max_id = (db.session.query(func.count(TeamMember.id), func.max(TeamMember.id))
+                     .filter(TeamMember.user_id == user.id).one())
+    etag = etag_for('teams', user.id, count, max_id)
+    response = not_modified(etag)
+    if response:
+        return response
+    # return teams where user is a member, one page at a time
+    q = (db.session.query(Team.id, Team.name)
+         .join(TeamMember, TeamMember.team_id == Team.id)
+         .filter(TeamMember.user_id == user.id))
+    after_id = request.args.get('after_id', type=int)
+    if after_id:
+        q = q.filter(Team.id > after_id)
+    teams, next_cursor = keyset_page(q.order_by(Team.id), page_limit())
+    return with_etag(jsonify({'teams': [{'id': t.id, 'name': t.name} for t in teams], 'next_cursor': next_cursor}), etag)
 
 
 @api_bp.route('/cospaces', methods=['POST'])
@@ -91,57 +157,505 @@ def list_cospaces():
     user = current_user()
     if not user:
         return jsonify({'error': 'not authenticated'}), 401
-    # return cospaces from teams the user belongs to
-    teams = [t.id for t in user.teams]
-    cospaces = CoSpace.query.filter(CoSpace.team_id.in_(teams)).all()
-    return jsonify([{'id': c.id, 'name': c.name, 'team_id': c.team_id} for c in cospaces])
-
-
-@api_bp.route('/comments', methods=['POST'])
-def post_comment():
+    # return cospaces from teams the user belongs to, one page at a time
+    q = (db.session.query(CoSpace.id, CoSpace.name, CoSpace.team_id, *COUNTER_COLUMNS)
+         .join(TeamMember, TeamMember.team_id == CoSpace.team_id)
+         .filter(TeamMember.user_id == user.id))
+    after_id = request.args.get('after_id', type=int)
+    if after_id:
+        q = q.filter(CoSpace.id > after_id)
+    cospaces, next_cursor = keyset_page(q.order_by(CoSpace.id), page_limit())
+    out = [dict(serialize_counters(c), id=c.id, name=c.name, team_id=c.team_id) for c in cospaces]
+    return jsonify({'cospaces': out, 'next_cursor': next_cursor})
+
+
+@api_bp.route('/cospaces/<int:cospace_id>/summary')
+def cospace_summary(cospace_id):
+    """Comment counters of a cospace with per-author counts, most active first."""
     user = current_user()
     if not user:
         return jsonify({'error': 'not authenticated'}), 401
-    data = request.json or {}
-    cospace = CoSpace.query.get(data.get('cospace_id'))
+    error, status = member_cospace(user, cospace_id)
+    if error:
+        return jsonify({'error': error}), status
+    # one query: the cospace row once per author, or once with no authors
+    rows = (db.session.query(CoSpace.id, CoSpace.name, CoSpace.team_id, *COUNTER_COLUMNS,
+                             User.username, CoSpaceAuthor.comment_count.label('author_count'))
+            .outerjoin(CoSpaceAuthor, (CoSpaceAuthor.cospace_id == CoSpace.id) & (CoSpaceAuthor.comment_count > 0))
+            .outerjoin(User, User.id == CoSpaceAuthor.author_id)
+            .filter(CoSpace.id == cospace_id)
+            .order_by(CoSpaceAuthor.comment_count.desc(), User.username)
+            .all())
+    c = rows[0]
+    authors = [{'author': r.username, 'comment_count': r.author_count} for r in rows if r.author_count]
+    return jsonify(dict(serialize_counters(c), id=c.id, name=c.name, team_id=c.team_id, authors=authors))
+
+
+@api_bp.route('/cospaces/<int:cospace_id>/retention', methods=['PUT'])
+def set_retention(cospace_id):
+    """Set how many days comments are kept hot. Expects JSON: { retention_days }
+    (a positive integer, or null to keep them forever). Owners and admins only.
+    """
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    cospace = CoSpace.query.get(cospace_id)
     if not cospace:
         return jsonify({'error': 'cospace not found'}), 404
-    # check team membership & permissions: viewers may not comment
-    if not require_roles(user, cospace.team, ['owner', 'admin', 'member']):
-        return jsonify({'error': 'insufficient role to post comments'}), 403
-    comment = Comment(cospace=cospace, author=user, selector=data.get('selector'), text=data.get('text'), metadata=data.get('metadata'))
-    db.session.add(comment)
+    if not require_roles(user, cospace.team_id, ['owner', 'admin']):
+        return jsonify({'error': 'only owner/admin can change retention'}), 403
+    days = (request.json or {}).get('retention_days')
+    if days is not None and (not isinstance(days, int) or isinstance(days, bool) or days < 1):
+        return jsonify({'error': 'retention_days must be a positive integer or null'}), 400
+    cospace.retention_days = days
     db.session.commit()
-    # Broadcast via socket
-    socketio.emit('new_comment', {
+    return jsonify({'id': cospace.id, 'retention_days': days})
+
+
+def member_cospace(user, cospace_id, roles=None):
+    """Authorize access to a cospace; returns ``(error, status)`` or ``(None, None)``."""
+    team_id = cospace_team_id(cospace_id)
+    if team_id is None:
+        return 'cospace not found', 404
+    role = team_role(user.id, team_id)
+    if role is None:
+        return 'not a team member', 403
+    if roles and role not in roles:
+        return 'insufficient role', 403
+    return None, None
+
+
+def comment_target(user, raw_cospace_id):
+    """Resolve and authorize the cospace a comment is posted to.
+
+    Returns ``(cospace_id, error, status)``; ``cospace_id`` is None on error.
+    """
+    try:
+        cospace_id = int(raw_cospace_id)
+    except (TypeError, ValueError):
+        return None, 'cospace not found', 404
+    team_id = cospace_team_id(cospace_id)
+    if team_id is None:
+        return None, 'cospace not found', 404
+    # check team membership & permissions: viewers may not comment
+    if not require_roles(user, team_id, ['owner', 'admin', 'member']):
+        return None, 'insufficient role to post comments', 403
+    return cospace_id, None, None
+
+
+def new_comment(user, cospace_id, data):
+    meta = data.get('metadata')
+    page_url = normalize_page_url(data.get('url')) or page_url_from_metadata(meta)
+    if isinstance(meta, (dict, list)):
+        meta = json.dumps(meta)
+    return Comment(cospace_id=cospace_id, author_id=user.id, selector=data.get('selector'), text=data.get('text'), meta=meta, page_url=page_url)
+
+
+def comment_event(comment, user):
+    # called after flush, so nothing needs reloading once commit expires the instance
+    return {
         'id': comment.id,
-        'cospace_id': cospace.id,
+        'cospace_id': comment.cospace_id,
         'author': user.username,
         'selector': comment.selector,
+        'page_url': comment.page_url,
         'text': comment.text,
-        'created_at': comment.created_at.isoformat()
-    }, room=f'cospace_{cospace.id}')
-    return jsonify({'id': comment.id})
+        'created_at': comment.created_at.isoformat(),
+        'updated_at': comment.updated_at.isoformat() if comment.updated_at else None,
+        'seq': comment.seq,
+    }
+
+
+@api_bp.route('/comments', methods=['POST'])
+def post_comment():
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    data = request.json or {}
+    cospace_id, error, status = comment_target(user, data.get('cospace_id'))
+    if error:
+        return jsonify({'error': error}), status
+    comment = new_comment(user, cospace_id, data)
+    db.session.add(comment)
+    db.session.flush()
+    payload = comment_event(comment, user)
+    db.session.commit()
+    broadcast.send(cospace_id, [payload])
+    return jsonify({'id': payload['id']})
+
+
+@api_bp.route('/comments/batch', methods=['POST'])
+def post_comments_batch():
+    """Insert many comments in one transaction.
+    Expects JSON: { comments: [{ cospace_id, selector, text, metadata }, ...] }
+    Returns one result per item, in order: { id } or { error, status }.
+    Accepted comments are broadcast to their rooms together.
+    """
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    items = (request.json or {}).get('comments')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'missing comments'}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'at most {MAX_BATCH_SIZE} comments per batch'}), 400
+    results = []
+    accepted = []
+    for data in items:
+        if not isinstance(data, dict):
+            results.append({'error': 'invalid comment', 'status': 400})
+            continue
+        cospace_id, error, status = comment_target(user, data.get('cospace_id'))
+        if error:
+            results.append({'error': error, 'status': status})
+            continue
+        comment = new_comment(user, cospace_id, data)
+        results.append(comment)
+        accepted.append(comment)
+    rooms = {}
+    if accepted:
+        db.session.add_all(accepted)
+        db.session.flush()
+        for comment in accepted:
+            rooms.setdefault(comment.cospace_id, []).append(comment_event(comment, user))
+        results = [{'id': r.id} if isinstance(r, Comment) else r for r in results]
+        db.session.commit()
+    for cospace_id, payloads in rooms.items():
+        broadcast.send(cospace_id, payloads)
+    return jsonify({'results': results})
+
+
+@api_bp.route('/comments/search')
+def search_comments():
+    """Full-text search over comment text and selectors, best matches first.
+    Query args: q, optional cospace_id or team_id scope, limit, cursor.
+    Without a scope, searches every cospace of the user's teams.
+    """
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    words = search.terms(request.args.get('q'))
+    if not words:
+        return jsonify({'error': 'missing search query'}), 400
+    cospace_id = request.args.get('cospace_id', type=int)
+    team_id = request.args.get('team_id', type=int)
+    if cospace_id:
+        cospace_team = cospace_team_id(cospace_id)
+        if cospace_team is None:
+            return jsonify({'error': 'cospace not found'}), 404
+        if team_role(user.id, cospace_team) is None:
+            return jsonify({'error': 'not a team member'}), 403
+        scope = Comment.cospace_id == cospace_id
+    elif team_id:
+        if team_role(user.id, team_id) is None:
+            return jsonify({'error': 'not a team member'}), 403
+        scope = Comment.cospace_id.in_(select(CoSpace.id).where(CoSpace.team_id == team_id))
+    else:
+        scope = Comment.cospace_id.in_(
+            select(CoSpace.id)
+            .join(TeamMember, TeamMember.team_id == CoSpace.team_id)
+            .where(TeamMember.user_id == user.id))
+    rows, next_cursor = search.search(current_app, words, scope, request.args.get('cursor'), page_limit())
+    out = [dict(serialize_comment(r), cospace_id=r.cospace_id) for r in rows]
+    return jsonify({'comments': out, 'next_cursor': next_cursor})
 
 
 @api_bp.route('/comments/<int:cospace_id>')
 def get_comments(cospace_id):
-    since_id = request.args.get('since_id', type=int)
-    q = Comment.query.filter_by(cospace_id=cospace_id)
-    if since_id:
-        q = q.filter(Comment.id > since_id)
-    comments = q.order_by(Comment.created_at.desc()).all()
-    out = []
-    for c in comments:
-        out.append({'id': c.id, 'author': c.author.username if c.author else None, 'selector': c.selector, 'text': c.text, 'created_at': c.created_at.isoformat()})
-    return jsonify(out)
+    """Keyset-paginated comments for a cospace.
+
+    Without a cursor, pages walk backwards from the newest comment (pass the
+    returned ``next_cursor`` as ``before_id``). With ``after_id`` (or the older
+    ``since_id``) pages walk forwards in id order (pass it back as ``after_id``).
+    ``url`` restricts the listing to comments anchored to that page or to no
+    page, and ``archived=1`` reads through to comments moved out by retention.
+    ``format=compact`` sends each comment as an array of ``fields``.
+    """
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    error, status = member_cospace(user, cospace_id)
+    if error:
+        return jsonify({'error': error}), status
+    url = request.args.get('url')
+    page_url = normalize_page_url(url)
+    if url and not page_url:
+        return jsonify({'error': 'invalid url'}), 400
+    after_id = request.args.get('after_id', type=int)
+    if after_id is None:
+        after_id = request.args.get('since_id', type=int)
+    before_id = request.args.get('before_id', type=int)
+    # every insert, edit and delete advances the cospace change sequence
+    change_seq = db.session.query(CoSpace.change_seq).filter(CoSpace.id == cospace_id).scalar()
+    etag = etag_for('comments', cospace_id, change_seq)
+    response = not_modified(etag)
+    if response:
+        return response
+    q = Comment.query.filter_by(cospace_id=cospace_id, deleted_at=None)
+    if page_url:
+        # comments saved without a page show on every page
+        q = q.filter(or_(Comment.page_url == page_url, Comment.page_url.is_(None)))
+    if after_id is not None:
+        q = q.filter(Comment.id > after_id).order_by(Comment.id.asc())
+    else:
+        if before_id:
+            q = q.filter(Comment.id < before_id)
+        q = q.order_by(Comment.id.desc())
+    limit = page_limit()
+    rows = comment_rows(q).limit(limit + 1).all()
+    if request.args.get('archived') == '1':
+        rows = retention.with_archived(rows, cospace_id, page_url, after_id, before_id, limit + 1)
+    rows, next_cursor = split_page(rows, limit)
+    if compact_format():
+        body = {'fields': COMMENT_FIELDS, 'comments': [compact_comment(r) for r in rows], 'next_cursor': next_cursor}
+    else:
+        body = {'comments': [serialize_comment(r) for r in rows], 'next_cursor': next_cursor}
+    return with_etag(jsonify(body), etag)
+
+
+def live_comment(cospace_id, comment_id):
+    return Comment.query.filter_by(id=comment_id, cospace_id=cospace_id, deleted_at=None).first()
+
+
+@api_bp.route('/comments/<int:cospace_id>/<int:comment_id>', methods=['PUT'])
+def edit_comment(cospace_id, comment_id):
+    """Edit a comment. Expects JSON: { text, selector } (either may be omitted).
+    Only the author may edit, and only while they may still post to the cospace.
+    """
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    comment = live_comment(cospace_id, comment_id)
+    if comment is None:
+        return jsonify({'error': 'comment not found'}), 404
+    if comment.author_id != user.id or not require_roles(user, cospace_team_id(cospace_id), ['owner', 'admin', 'member']):
+        return jsonify({'error': 'only the author may edit a comment'}), 403
+    data = request.json or {}
+    if 'text' in data:
+        comment.text = data['text']
+    if 'selector' in data:
+        comment.selector = data['selector']
+    comment.updated_at = datetime.utcnow()
+    db.session.flush()
+    payload = comment_event(comment, user)
+    db.session.commit()
+    broadcast.send(cospace_id, [payload])
+    return jsonify({'id': payload['id'], 'seq': payload['seq']})
+
+
+@api_bp.route('/comments/<int:cospace_id>/<int:comment_id>', methods=['DELETE'])
+def delete_comment(cospace_id, comment_id):
+    """Soft-delete a comment, leaving a tombstone for delta sync.
+    Authors may delete their own comments; team owners and admins any comment.
+    """
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    comment = live_comment(cospace_id, comment_id)
+    if comment is None:
+        return jsonify({'error': 'comment not found'}), 404
+    role = team_role(user.id, cospace_team_id(cospace_id))
+    if not (role in ('owner', 'admin') or (role == 'member' and comment.author_id == user.id)):
+        return jsonify({'error': 'insufficient role to delete this comment'}), 403
+    tombstone(comment)
+    db.session.flush()
+    payload = {'id': comment.id, 'seq': comment.seq, 'deleted': True}
+    db.session.commit()
+    broadcast.send(cospace_id, [payload])
+    return jsonify({'id': payload['id'], 'seq': payload['seq']})
+
+
+@api_bp.route('/cospaces/<int:cospace_id>/changes')
+def get_changes(cospace_id):
+    """Delta sync: comments inserted, edited or deleted after ``since_seq``.
+
+    Changes come in ``seq`` order; a comment changed several times appears
+    once, at its latest ``seq``, and deletions are tombstones
+    ``{seq, id, deleted: true}``. Pass the returned ``seq`` back as
+    ``since_seq``; ``has_more`` means another page is ready. With ``timeout``
+    (seconds) the request long-polls until something changes. A ``since_seq``
+    older than purged tombstones gets 410: start over from 0.
+    """
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    error, status = member_cospace(user, cospace_id)
+    if error:
+        return jsonify({'error': error}), status
+    since_seq = request.args.get('since_seq', type=int, default=0)
+    timeout = request.args.get('timeout', type=int, default=0)
+    if since_seq:
+        pruned_seq = db.session.query(CoSpace.pruned_seq).filter(CoSpace.id == cospace_id).scalar()
+        if since_seq < pruned_seq:
+            return jsonify({'error': 'deletions after since_seq were purged; sync again from since_seq=0',
+                            'pruned_seq': pruned_seq}), 410
+    limit = page_limit()
+
+    def fetch():
+        q = Comment.query.filter(Comment.cospace_id == cospace_id, Comment.seq > since_seq)
+        return (comment_rows(q).add_columns(Comment.seq, Comment.deleted_at)
+                .order_by(Comment.seq).limit(limit + 1).all())
+
+    rows = park(cospace_id, timeout, fetch) if timeout > 0 else fetch()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        'changes': [serialize_change(r) for r in rows],
+        'seq': rows[-1].seq if rows else since_seq,
+        'has_more': has_more,
+    })
+
+
+@api_bp.route('/cospaces/<int:cospace_id>/anchors')
+def get_anchors(cospace_id):
+    """Live comments of one page (``url``) grouped by anchor: ``{anchors:
+    [{key, selector, count, comments}]}`` in order of each anchor's first
+    comment, so every distinct selector is resolved once. Comments without a
+    selector form an anchor with a null key.
+    """
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    page_url = normalize_page_url(request.args.get('url'))
+    if not page_url:
+        return jsonify({'error': 'missing or invalid url'}), 400
+    error, status = member_cospace(user, cospace_id)
+    if error:
+        return jsonify({'error': error}), status
+    change_seq = db.session.query(CoSpace.change_seq).filter(CoSpace.id == cospace_id).scalar()
+    etag = etag_for('anchors', cospace_id, change_seq)
+    response = not_modified(etag)
+    if response:
+        return response
+    q = Comment.query.filter_by(cospace_id=cospace_id, page_url=page_url, deleted_at=None)
+    rows = comment_rows(q).add_columns(Comment.selector_key).order_by(Comment.id).all()
+    out = [{'key': a['key'], 'selector': a['selector'], 'count': len(a['rows']),
+            'comments': [serialize_comment(r) for r in a['rows']]} for a in anchors.group(rows)]
+    return with_etag(jsonify({'anchors': out}), etag)
+
+
+@api_bp.route('/cospaces/<int:cospace_id>/anchors/report', methods=['POST'])
+def report_anchors(cospace_id):
+    """Record which selectors of a page the extension could resolve.
+    Expects JSON: { url, resolved: [selector, ...], unresolved: [selector, ...] }
+    """
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    data = request.json or {}
+    page_url = normalize_page_url(data.get('url'))
+    if not page_url:
+        return jsonify({'error': 'missing or invalid url'}), 400
+    resolved, unresolved = data.get('resolved') or [], data.get('unresolved') or []
+    if not isinstance(resolved, list) or not isinstance(unresolved, list):
+        return jsonify({'error': 'resolved and unresolved must be lists'}), 400
+    if len(resolved) + len(unresolved) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'at most {MAX_BATCH_SIZE} selectors per report'}), 400
+    error, status = member_cospace(user, cospace_id)
+    if error:
+        return jsonify({'error': error}), status
+    recorded = anchors.record_report(cospace_id, page_url, user.id, resolved, unresolved)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # a concurrent report created the same status or failure row; this one is dropped
+        db.session.rollback()
+        recorded = 0
+    return jsonify({'recorded': recorded})
+
+
+def stale_anchor_comments(cospace_id, min_failures):
+    """Live comments joined to their anchor's status, for anchors that failed
+    for at least ``min_failures`` distinct users and days since they last
+    resolved."""
+    return (db.session.query(AnchorStatus)
+            .join(Comment, and_(Comment.cospace_id == AnchorStatus.cospace_id,
+                                Comment.page_url == AnchorStatus.page_url,
+                                Comment.selector_key == AnchorStatus.selector_key,
+                                Comment.deleted_at.is_(None)))
+            .filter(AnchorStatus.cospace_id == cospace_id, AnchorStatus.failures >= min_failures))
+
+
+@api_bp.route('/cospaces/<int:cospace_id>/anchors/unresolved')
+def unresolved_anchors(cospace_id):
+    """Anchors that failed to resolve for at least ``min_failures`` users and
+    days (default 1), most failures first, with their live comment counts.
+    ``flagged=1`` lists only anchors flagged by ``anchors/prune``."""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    error, status = member_cospace(user, cospace_id)
+    if error:
+        return jsonify({'error': error}), status
+    min_failures = request.args.get('min_failures', type=int, default=1)
+    q = stale_anchor_comments(cospace_id, min_failures)
+    if request.args.get('flagged') == '1':
+        q = q.filter(AnchorStatus.flagged_at.is_not(None))
+    rows = (q.with_entities(AnchorStatus.page_url, AnchorStatus.selector_key, AnchorStatus.failures,
+                            AnchorStatus.first_failed_at, AnchorStatus.last_failed_at, AnchorStatus.flagged_at,
+                            func.min(Comment.selector).label('selector'), func.count(Comment.id).label('count'))
+            .group_by(AnchorStatus.id)
+            .order_by(AnchorStatus.failures.desc(), AnchorStatus.id)
+            .limit(page_limit()))
+    return jsonify({'anchors': [{
+        'url': r.page_url,
+        'key': r.selector_key,
+        'selector': anchors.normalize_selector(r.selector),
+        'failures': r.failures,
+        'first_failed_at': r.first_failed_at.isoformat(),
+        'last_failed_at': r.last_failed_at.isoformat(),
+        'flagged_at': r.flagged_at.isoformat() if r.flagged_at else None,
+        'count': r.count,
+    } for r in rows]})
+
+
+@api_bp.route('/cospaces/<int:cospace_id>/anchors/prune', methods=['POST'])
+def prune_anchors(cospace_id):
+    """Flag anchors that keep failing to resolve for review.
+    Expects JSON: { min_failures (default 3), min_days (default 7) }; an anchor
+    qualifies once that many distinct users or days failed to resolve it, the
+    first at least that many days ago. Owners and admins only. Comments are
+    not deleted: failures are reported by clients, so a flagged anchor is
+    listed by ``anchors/unresolved?flagged=1`` until it resolves again.
+    """
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    error, status = member_cospace(user, cospace_id, ['owner', 'admin'])
+    if error:
+        return jsonify({'error': error}), status
+    data = request.json or {}
+    try:
+        min_failures = max(1, int(data.get('min_failures', 3)))
+        cutoff = datetime.utcnow() - timedelta(days=max(0, int(data.get('min_days', 7))))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'min_failures and min_days must be integers'}), 400
+    live = exists().where(Comment.cospace_id == AnchorStatus.cospace_id, Comment.page_url == AnchorStatus.page_url,
+                          Comment.selector_key == AnchorStatus.selector_key, Comment.deleted_at.is_(None))
+    # forget anchors left without live comments
+    AnchorFailure.query.filter(AnchorFailure.status_id.in_(
+        select(AnchorStatus.id).where(AnchorStatus.cospace_id == cospace_id, ~live))).delete(synchronize_session=False)
+    AnchorStatus.query.filter(AnchorStatus.cospace_id == cospace_id, ~live).delete(synchronize_session=False)
+    flagged = (AnchorStatus.query
+               .filter(AnchorStatus.cospace_id == cospace_id, AnchorStatus.flagged_at.is_(None),
+                       AnchorStatus.failures >= min_failures, AnchorStatus.first_failed_at <= cutoff)
+               .update({AnchorStatus.flagged_at: datetime.utcnow()}, synchronize_session=False))
+    db.session.commit()
+    return jsonify({'flagged': flagged})
 
 
 @api_bp.route('/export/github', methods=['POST'])
 def export_github():
-    """Create a GitHub Gist containing all comments for a given cospace.
+    """Start a background export of all comments for a given cospace to a GitHub Gist.
     Expects JSON: { cospace_id: int, github_token: str, public: bool }
+    Returns 202 with a job id; the same user polls /api/export/jobs/<job_id>
+    for the result.
     """
+    # export-only dependencies are loaded on first use to keep worker boot fast
+    from . import export
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
     data = request.json or {}
     cospace_id = data.get('cospace_id')
     token = data.get('github_token')
@@ -149,33 +663,32 @@ def export_github():
     cospace = CoSpace.query.get(cospace_id)
     if not cospace:
         return jsonify({'error': 'cospace not found'}), 404
-    comments = Comment.query.filter_by(cospace_id=cospace_id).all()
-    body = json.dumps([{'id': c.id, 'author': c.author.username if c.author else None, 'selector': c.selector, 'text': c.text, 'created_at': c.created_at.isoformat()} for c in comments], indent=2)
-    gist = {
-        'description': f'CoSpace comments export: {cospace.name}',
-        'public': bool(public),
-        'files': {
-            f'cospace_{cospace_id}_comments.json': { 'content': body }
-        }
-    }
-    # if no token provided in request, look up stored encrypted token for current user
+    error, status = member_cospace(user, cospace.id)
+    if error:
+        return jsonify({'error': error}), status
+    # if no token provided in request, use the token stored on the current user
     if not token:
-        uid = session.get('user_id')
-        if not uid:
-            return jsonify({'error': 'missing github token and not authenticated'}), 400
-        user = User.query.get(uid)
-        if not user or not user.github_token_encrypted:
+        if not user.github_token_encrypted:
             return jsonify({'error': 'no stored github token; either pass token or connect via /auth/github_export_login'}), 400
         s = URLSafeSerializer(current_app.config['SECRET_KEY'], salt='github-token')
         try:
             token = s.loads(user.github_token_encrypted)
         except Exception as e:
             return jsonify({'error': 'failed to decrypt stored token'}), 500
-    headers = {'Authorization': f'token {token}', 'Accept':'application/vnd.github+json'}
-    r = requests.post('https://api.github.com/gists', json=gist, headers=headers)
-    if r.status_code >= 400:
-        return jsonify({'error': 'github API error', 'details': r.json()}), r.status_code
-    return jsonify(r.json())
+    job = export.create_job(cospace.id, user.id)
+    export.start_export(current_app._get_current_object(), job, cospace.name, token, public)
+    return jsonify({'job_id': job['id'], 'status': job['status']}), 202
+
+
+@api_bp.route('/export/jobs/<job_id>')
+def export_job_status(job_id):
+    from . import export
+    job = export.get_job(job_id, session.get('user_id'))
+    if not job:
+        return jsonify({'error': 'export job not found'}), 404
+    job.pop('user_id')
+    job.pop('expires_at')
+    return jsonify(job)
 
 
 @api_bp.route('/teams/<int:team_id>/members')
@@ -187,12 +700,18 @@ def get_team_members(team_id):
     if not team:
         return jsonify({'error': 'team not found'}), 404
     # membership required to view members
-    if not get_membership(user, team) and team.owner_id != user.id:
+    if team_role(user.id, team.id) is None:
         return jsonify({'error': 'not a team member'}), 403
-    out = []
-    for m in team.memberships:
-        out.append({'user_id': m.user.id, 'username': m.user.username, 'role': m.role})
-    return jsonify(out)
+    etag = etag_for('members', team.id, team.members_version)
+    response = not_modified(etag)
+    if response:
+        return response
+    members = (db.session.query(User.id, User.username, TeamMember.role)
+               .join(TeamMember, TeamMember.user_id == User.id)
+               .filter(TeamMember.team_id == team.id)
+               .order_by(TeamMember.id))
+    out = [{'user_id': m.id, 'username': m.username, 'role': m.role} for m in members]
+    return with_etag(jsonify(out), etag)
 
 
 @api_bp.route('/teams/<int:team_id>/members', methods=['POST'])
@@ -204,7 +723,7 @@ def add_team_member(team_id):
     if not team:
         return jsonify({'error': 'team not found'}), 404
     # only owner or admin can add members
-    if not require_roles(user, team, ['owner', 'admin']):
+    if not require_roles(user, team.id, ['owner', 'admin']):
         return jsonify({'error': 'only owner/admin can add members'}), 403
     data = request.json or {}
     github_username = data.get('github_username')
@@ -214,12 +733,18 @@ def add_team_member(team_id):
     u = User.query.filter_by(username=github_username).first()
     if not u:
         return jsonify({'error': 'user not found'}), 404
-    existing = TeamMember.query.filter_by(team_id=team.id, user_id=u.id).first()
-    if existing:
+    if team_role(u.id, team.id) is not None:
         return jsonify({'error': 'user already a member'}), 400
     tm = TeamMember(team=team, user=u, role=role)
     db.session.add(tm)
-    db.session.commit()
+    team.members_version = Team.members_version + 1
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # lost a race with a concurrent add of the same user
+        db.session.rollback()
+        return jsonify({'error': 'user already a member'}), 400
+    invalidate_team(team_id)
     return jsonify({'ok': True})
 
 
@@ -232,7 +757,7 @@ def set_team_member_role(team_id, user_id):
     if not team:
         return jsonify({'error': 'team not found'}), 404
     # only owner or admin can change roles, but only owner can assign 'owner'
-    if not require_roles(user, team, ['owner', 'admin']):
+    if not require_roles(user, team.id, ['owner', 'admin']):
         return jsonify({'error': 'not allowed'}), 403
     data = request.json or {}
     role = data.get('role')
@@ -247,7 +772,9 @@ def set_team_member_role(team_id, user_id):
     # if transferring ownership, update team.owner_id
     if role == 'owner':
         team.owner_id = user_id
+    team.members_version = Team.members_version + 1
     db.session.commit()
+    invalidate_team(team_id)
     return jsonify({'ok': True})
 
 
@@ -259,35 +786,48 @@ def remove_team_member(team_id, user_id):
     team = Team.query.get(team_id)
     if not team:
         return jsonify({'error': 'team not found'}), 404
-    if not require_roles(user, team, ['owner', 'admin']):
+    if not require_roles(user, team.id, ['owner', 'admin']):
         return jsonify({'error': 'only owner/admin can remove members'}), 403
     tm = TeamMember.query.filter_by(team_id=team.id, user_id=user_id).first()
     if tm:
         db.session.delete(tm)
+        team.members_version = Team.members_version + 1
         db.session.commit()
+        invalidate_team(team_id)
     return jsonify({'ok': True})
 
 
 @api_bp.route('/comments/longpoll/<int:cospace_id>')
 def longpoll_comments(cospace_id):
-    """Long-poll for new comments since a given id. Returns immediately if new comments are present, otherwise waits up to timeout seconds."""
+    """Long-poll for new comments since a given id. Returns immediately if new comments are present, otherwise parks on the notification hub for up to timeout seconds.
+    ``url`` limits it to comments of that page and comments without one.
+    With ``format=compact`` the result is ``{fields, comments}`` with each comment as an array."""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'not authenticated'}), 401
+    error, status = member_cospace(user, cospace_id)
+    if error:
+        return jsonify({'error': error}), status
+    url = request.args.get('url')
+    page_url = normalize_page_url(url)
+    if url and not page_url:
+        return jsonify({'error': 'invalid url'}), 400
     since_id = request.args.get('since_id', type=int, default=0)
     timeout = request.args.get('timeout', type=int, default=25)
-    deadline = time.time() + timeout
-    while time.time() < deadline:
-        q = Comment.query.filter(Comment.cospace_id == cospace_id)
+    serialize = compact_comment if compact_format() else serialize_comment
+
+    def fetch():
+        q = Comment.query.filter(Comment.cospace_id == cospace_id, Comment.deleted_at.is_(None))
+        if page_url:
+            # comments saved without a page show on every page
+            q = q.filter(or_(Comment.page_url == page_url, Comment.page_url.is_(None)))
         if since_id:
             q = q.filter(Comment.id > since_id)
-        new_comments = q.order_by(Comment.created_at.asc()).all()
-        if new_comments:
-            out = []
-            for c in new_comments:
-                out.append({'id': c.id, 'author': c.author.username if c.author else None, 'selector': c.selector, 'text': c.text, 'created_at': c.created_at.isoformat()})
-            return jsonify(out)
-        # sleep for a short period; prefer eventlet.sleep when available to avoid blocking
-        if eventlet:
-            eventlet.sleep(1)
-        else:
-            time.sleep(1)
-    # timeout, return empty
-    return jsonify([])
+        rows = comment_rows(q).order_by(Comment.id.asc()).limit(page_limit())
+        return [serialize(r) for r in rows]
+
+    # an empty list on timeout
+    comments = park(cospace_id, timeout, fetch)
+    if compact_format():
+        return jsonify({'fields': COMMENT_FIELDS, 'comments': comments})
+    return jsonify(comments)
@@ -1,27 +1,112 @@
 import os
+import weakref
 from flask import Flask
-from .db import db
-from .socketio import socketio
+from .db import db, init_db
+from .socketio import socketio, queue_options
+from .notify import hub
+# imported up front so rooms registers its socket handlers before any init_app
+from . import (anchors, authz, broadcast, changes, compress, counters, jsonprovider, metrics, migrations,
+               outbound, pages, retention, rooms, search)
 
+# apps built in this process; a forked worker resets each of them
+_apps = weakref.WeakSet()
 
-def create_app():
+
+def create_app(test_config=None):
     app = Flask(__name__, instance_relative_config=False)
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev'),
         SQLALCHEMY_DATABASE_URI=os.environ.get('DATABASE_URL', 'sqlite:///codocs.db'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        DB_POOL_SIZE=int(os.environ.get('DB_POOL_SIZE', 10)),
+        DB_MAX_OVERFLOW=int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        DB_POOL_TIMEOUT=int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        DB_POOL_RECYCLE=int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        DB_BUSY_TIMEOUT_MS=int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000)),
+        DB_SQLITE_WAL=os.environ.get('DB_SQLITE_WAL', '1') == '1',
+        GITHUB_API_URL=os.environ.get('GITHUB_API_URL', 'https://api.github.com'),
+        EXPORT_BATCH_SIZE=500,
+        # seconds a finished export job stays readable
+        EXPORT_JOB_TTL=3600,
+        # GitHub truncates gist file contents above 1 MB
+        GIST_FILE_MAX_BYTES=1_000_000,
+        NOTIFY_URL=os.environ.get('NOTIFY_URL', 'memory://'),
+        SOCKETIO_MESSAGE_QUEUE=os.environ.get('SOCKETIO_MESSAGE_QUEUE'),
+        # None picks eventlet when it is installed; 'threading' skips importing it
+        SOCKETIO_ASYNC_MODE=os.environ.get('SOCKETIO_ASYNC_MODE'),
+        METRICS_ENABLED=os.environ.get('METRICS_ENABLED', '') == '1',
+        PROFILE_SLOW_REQUEST_MS=float(os.environ['PROFILE_SLOW_REQUEST_MS']) if os.environ.get('PROFILE_SLOW_REQUEST_MS') else None,
     )
-    db.init_app(app)
-    socketio.init_app(app)
+    if test_config:
+        app.config.update(test_config)
+    init_db(app)
+    jsonprovider.init_app(app)
+    socketio.init_app(app, async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+                      **queue_options(app.config['SOCKETIO_MESSAGE_QUEUE']))
+    hub.init_app(app)
+    broadcast.init_app(app)
+    authz.init_app(app)
+    outbound.init_app(app)
+    search.init_app(app)
+    pages.init_app(app)
+    changes.init_app(app)
+    counters.init_app(app)
+    retention.init_app(app)
+    migrations.init_app(app)
 
     # register blueprints
     from .api import api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
+    metrics.init_app(app)
+    # after metrics, so that its latency includes compression
+    compress.init_app(app)
 
+    # workers forked from a preloaded app must not share its connections
+    _apps.add(app)
     return app
 
 
+def after_fork(app):
+    """Reset per-process state of an app in a worker forked from a booted one."""
+    with app.app_context():
+        db.engine.dispose(close=False)
+    outbound.after_fork(app)
+
+
+def _after_fork_in_child():
+    hub.after_fork()
+    for app in list(_apps):
+        after_fork(app)
+
+
+# once per process: fork hooks cannot be unregistered
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def serve(app, port, workers=1):
+    """Serve on ``port`` and fork ``workers - 1`` more processes, each on the
+    next port, that share the booted app instead of importing and building
+    their own (see "Running several workers" in the README)."""
+    for i in range(1, workers):
+        if os.fork() == 0:
+            port += i
+            break
+    socketio.run(app, host='0.0.0.0', port=port)
+
+
 if __name__ == '__main__':
+    # long-poll waiters park on threading primitives; make them green under eventlet
+    try:
+        import eventlet
+        eventlet.monkey_patch()
+    except ImportError:
+        pass
+    # psycopg2 blocks in C; let its waits yield to other greenlets
+    try:
+        from psycogreen.eventlet import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
     app = create_app()
     # Run with socketio so emits work in production as well
-    socketio.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
+    serve(app, int(os.environ.get('PORT', 5000)), int(os.environ.get('WORKERS', 1)))
@@ -0,0 +1,133 @@
+"""Authorization lookups with request-scoped and optional process-wide caching.
+
+Every lookup is memoized on ``flask.g`` for the rest of the request.  When
+``AUTHZ_CACHE_TTL`` is set (seconds), results are also kept in a size-bounded
+process cache for that long; endpoints that change memberships call
+``invalidate_team`` after committing.  Other worker processes only notice
+such changes once their entries expire, so keep the TTL short.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import current_app, g, session
+from sqlalchemy import and_
+from .db import db
+from .models import User, Team, TeamMember, CoSpace
+
+Principal = namedtuple('Principal', 'id username')
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ``ttl`` seconds after insertion."""
+
+    def __init__(self, maxsize=4096, ttl=5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def init_app(app):
+    app.config.setdefault('AUTHZ_CACHE_TTL', 0)
+    app.config.setdefault('AUTHZ_CACHE_SIZE', 4096)
+    ttl = app.config['AUTHZ_CACHE_TTL']
+    app.extensions['authz_cache'] = TTLCache(app.config['AUTHZ_CACHE_SIZE'], ttl) if ttl else None
+
+
+def _cached(key, load):
+    """Return ``load()`` memoized per request and, if enabled, per process.
+
+    ``None`` results are only memoized for the request, so objects created
+    by another process are picked up immediately.
+    """
+    local = g.setdefault('authz', {})
+    value = local.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    shared = current_app.extensions.get('authz_cache')
+    value = shared.get(key, _MISSING) if shared is not None else _MISSING
+    if value is _MISSING:
+        value = load()
+        if shared is not None and value is not None:
+            shared.set(key, value)
+    local[key] = value
+    return value
+
+
+def invalidate_team(team_id):
+    """Drop cached roles for every member of a team after a membership change."""
+    def stale(key):
+        return key[0] == 'role' and key[2] == team_id
+    for key in [k for k in g.get('authz', {}) if stale(k)]:
+        del g.authz[key]
+    shared = current_app.extensions.get('authz_cache')
+    if shared is not None:
+        shared.discard_where(stale)
+
+
+def current_user():
+    uid = session.get('user_id')
+    if not uid:
+        return None
+    def load():
+        row = db.session.query(User.id, User.username).filter(User.id == uid).first()
+        return Principal(*row) if row else None
+    return _cached(('user', uid), load)
+
+
+def cospace_team_id(cospace_id):
+    """Team owning a cospace, or ``None`` if the cospace does not exist."""
+    return _cached(('cospace', cospace_id),
+                   lambda: db.session.query(CoSpace.team_id).filter(CoSpace.id == cospace_id).scalar())
+
+
+def team_role(user_id, team_id):
+    """Role of a user in a team ('owner' for the team owner), or ``None``."""
+    def load():
+        row = (db.session.query(Team.owner_id, TeamMember.role)
+               .outerjoin(TeamMember, and_(TeamMember.team_id == Team.id, TeamMember.user_id == user_id))
+               .filter(Team.id == team_id)
+               .first())
+        if row is None:
+            return None
+        if row.owner_id == user_id:
+            return 'owner'
+        return row.role
+    return _cached(('role', user_id, team_id), load)
+
+
+def require_roles(user, team_id, roles):
+    return team_role(user.id, team_id) in roles
@@ -0,0 +1,263 @@
+"""Reproducible load benchmark for the API hot paths.
+
+Seeds a throwaway SQLite database, then drives ``create_app()`` through
+Flask test clients from a thread pool:
+
+- ``listing``: walk every page of the busiest cospace
+- ``post_burst``: concurrent single-comment posts
+- ``longpoll``: park many long-polls, then wake them with a burst of posts
+
+Each scenario reports throughput, p50/p99 latency and the number of SQL
+statements it issued; the run also records peak RSS.  Output is JSON so two
+runs can be diffed::
+
+    python -m backend.bench --comments 20000 --out before.json
+    python -m backend.bench --comments 20000 --out after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import event, insert, update
+from . import counters
+from .anchors import selector_key
+from .app import create_app
+from .db import db
+from .models import User, Team, TeamMember, CoSpace, Comment
+
+DEFAULTS = {
+    'users': 20,
+    'teams': 5,
+    'cospaces': 10,
+    'comments': 5000,
+    'page_size': 500,
+    'posts': 200,
+    'longpolls': 50,
+    'concurrency': 16,
+}
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+def summarize(latencies, duration, queries, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'duration_s': round(duration, 4),
+        'throughput_rps': round(len(latencies) / duration, 2) if duration else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'queries': queries,
+    }
+
+
+def seed(app, cfg):
+    """Bulk-insert users, teams, memberships, cospaces and comments.
+
+    Every user is a member of every team; comments are spread round-robin
+    over users, with half of them in the first ("busy") cospace.
+    """
+    with app.app_context():
+        db.create_all()
+        now = datetime.utcnow()
+        db.session.execute(insert(User), [{'id': i + 1, 'username': f'user{i}'} for i in range(cfg['users'])])
+        db.session.execute(insert(Team), [{'id': i + 1, 'name': f'team{i}', 'owner_id': 1} for i in range(cfg['teams'])])
+        db.session.execute(insert(TeamMember), [
+            {'team_id': t + 1, 'user_id': u + 1, 'role': 'owner' if u == 0 else 'member'}
+            for t in range(cfg['teams']) for u in range(cfg['users'])])
+        db.session.execute(insert(CoSpace), [
+            {'id': i + 1, 'name': f'cospace{i}', 'team_id': i % cfg['teams'] + 1} for i in range(cfg['cospaces'])])
+        busy = cfg['comments'] // 2
+        seqs = {}
+        rows = []
+        for i in range(cfg['comments']):
+            cospace_id = 1 if i < busy else (i % cfg['cospaces']) + 1
+            seqs[cospace_id] = seqs.get(cospace_id, 0) + 1
+            selector = f'div:nth-of-type({i % 50})'
+            rows.append({'cospace_id': cospace_id, 'author_id': i % cfg['users'] + 1, 'seq': seqs[cospace_id],
+                         'selector': selector, 'selector_key': selector_key(selector),
+                         'text': f'comment {i}', 'created_at': now})
+            if len(rows) == 5000:
+                db.session.execute(insert(Comment), rows)
+                rows = []
+        if rows:
+            db.session.execute(insert(Comment), rows)
+        db.session.execute(update(CoSpace), [{'id': c, 'change_seq': n} for c, n in seqs.items()])
+        counters.recount(db.session.connection())
+        db.session.commit()
+
+
+def client_for(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+
+def timed(fn):
+    start = time.perf_counter()
+    res = fn()
+    return time.perf_counter() - start, res
+
+
+def run_listing(app, cfg, counter):
+    client = client_for(app, 1)
+    latencies, errors = [], 0
+    before, start = counter.count, time.perf_counter()
+    cursor = None
+    while True:
+        url = f"/api/comments/1?limit={cfg['page_size']}" + (f'&before_id={cursor}' if cursor else '')
+        elapsed, res = timed(lambda: client.get(url))
+        latencies.append(elapsed)
+        if res.status_code != 200:
+            errors += 1
+            break
+        cursor = res.get_json()['next_cursor']
+        if not cursor:
+            break
+    return summarize(latencies, time.perf_counter() - start, counter.count - before, errors)
+
+
+def run_post_burst(app, cfg, counter):
+    clients = [client_for(app, u + 1) for u in range(cfg['users'])]
+
+    def post(i):
+        client = clients[i % len(clients)]
+        return timed(lambda: client.post('/api/comments', json={
+            'cospace_id': i % cfg['cospaces'] + 1, 'selector': 'body', 'text': f'burst {i}'}))
+
+    before, start = counter.count, time.perf_counter()
+    with ThreadPoolExecutor(cfg['concurrency']) as pool:
+        results = list(pool.map(post, range(cfg['posts'])))
+    errors = sum(1 for _, res in results if res.status_code != 200)
+    return summarize([e for e, _ in results], time.perf_counter() - start, counter.count - before, errors)
+
+
+def run_longpoll(app, cfg, counter):
+    """Park ``longpolls`` requests, then post one comment to each cospace.
+
+    Latency is measured from the post that wakes a waiter to its response.
+    """
+    from .notify import hub
+    with app.app_context():
+        since = db.session.query(db.func.max(Comment.id)).scalar() or 0
+    n = cfg['longpolls']
+    parked = hub.waiting()
+    posted_at = {}
+    done = []
+    lock = threading.Lock()
+
+    def poll(i):
+        cospace_id = i % cfg['cospaces'] + 1
+        res = client_for(app, 1).get(f'/api/comments/longpoll/{cospace_id}?since_id={since}&timeout=30')
+        with lock:
+            done.append((cospace_id, time.perf_counter(), res.status_code, len(res.get_json() or [])))
+
+    before, start = counter.count, time.perf_counter()
+    threads = [threading.Thread(target=poll, args=(i,), daemon=True) for i in range(n)]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 30
+    while hub.waiting() - parked < n and time.time() < deadline:
+        time.sleep(0.005)
+    # waiters register before their first query; let those finish
+    time.sleep(0.1)
+    parked_queries = counter.count
+    time.sleep(0.2)
+    idle_queries = counter.count - parked_queries
+    poster = client_for(app, 1)
+    for cospace_id in range(1, min(n, cfg['cospaces']) + 1):
+        posted_at[cospace_id] = time.perf_counter()
+        poster.post('/api/comments', json={'cospace_id': cospace_id, 'text': 'wake'})
+    for t in threads:
+        t.join(35)
+    latencies = [finished - posted_at[c] for c, finished, status, _ in done if c in posted_at]
+    errors = sum(1 for _, _, status, count in done if status != 200 or not count)
+    result = summarize(latencies, time.perf_counter() - start, counter.count - before, errors)
+    result['idle_queries'] = idle_queries
+    return result
+
+
+SCENARIOS = {
+    'listing': run_listing,
+    'post_burst': run_post_burst,
+    'longpoll': run_longpoll,
+}
+
+
+def run(cfg, scenarios=None):
+    cfg = dict(DEFAULTS, **cfg)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}"})
+        seed_time, _ = timed(lambda: seed(app, cfg))
+        with app.app_context():
+            counter = QueryCounter(db.engine)
+        results = {name: SCENARIOS[name](app, cfg, counter) for name in scenarios or SCENARIOS}
+        with app.app_context():
+            db.engine.dispose()
+    return {
+        'config': cfg,
+        'seed_s': round(seed_time, 4),
+        'scenarios': results,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == 'darwin' else 1),
+        'python': platform.python_version(),
+    }
+
+
+def compare(old, new):
+    """Relative change (new / old - 1) of every numeric scenario metric."""
+    out = {}
+    for name, metrics in new['scenarios'].items():
+        base = old.get('scenarios', {}).get(name, {})
+        out[name] = {k: round(v / base[k] - 1, 4) for k, v in metrics.items()
+                     if isinstance(v, (int, float)) and isinstance(base.get(k), (int, float)) and base[k]}
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    for key, value in DEFAULTS.items():
+        parser.add_argument('--' + key.replace('_', '-'), type=int, default=value)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='run only these scenarios')
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='previous JSON report to diff against')
+    args = parser.parse_args(argv)
+    report = run({k: getattr(args, k) for k in DEFAULTS}, args.scenario)
+    if args.compare:
+        with open(args.compare) as f:
+            report['compare'] = compare(json.load(f), report)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Coalesced realtime broadcasts of comment changes.
+
+API handlers pass every committed insert, edit and delete to ``send``.
+Changes for a cospace are buffered for
+``SOCKETIO_COALESCE_MS`` and then go out as one ``comment_changes`` frame to
+the cospace's room; a comment changed several times inside the window is
+sent once, in its latest state.  A frame is flushed early once it holds
+``SOCKETIO_MAX_BATCH`` comments, and a window of 0 sends every change
+immediately.
+
+Frames are positional to keep them small::
+
+    {"cospace_id": 3, "seq": 42,
+     "comments": [[id, seq, author, selector, page_url, text, created_at, updated_at], ...],
+     "deleted": [[id, seq], ...]}
+
+Clients whose outgoing queue holds more than ``SOCKETIO_MAX_CLIENT_QUEUE``
+packets are skipped instead of being buffered further; each gets a single
+``resync`` event (``{"cospace_id", "seq"}``) and should catch up through
+``GET /api/cospaces/<id>/changes``.  Only clients connected to the process
+that flushes are checked.
+
+The flush timer uses ``threading`` looked up at call time, so it is green
+when eventlet has monkey-patched the stdlib.
+"""
+import threading
+import weakref
+from flask import current_app
+from .rooms import room_for
+from .socketio import socketio
+
+FRAME_FIELDS = ('id', 'seq', 'author', 'selector', 'page_url', 'text', 'created_at', 'updated_at')
+
+
+def encode_frame(cospace_id, changes):
+    """Compact frame for change dicts (``comment_event`` payloads or
+    ``{id, seq, deleted: True}`` tombstones)."""
+    comments, deleted, seq = [], [], 0
+    for change in changes:
+        seq = max(seq, change['seq'] or 0)
+        if change.get('deleted'):
+            deleted.append([change['id'], change['seq']])
+        else:
+            comments.append([change.get(f) for f in FRAME_FIELDS])
+    return {'cospace_id': cospace_id, 'seq': seq, 'comments': comments, 'deleted': deleted}
+
+
+class Broadcaster:
+    def __init__(self, window=0.05, max_batch=500, max_client_queue=100):
+        self.window = window
+        self.max_batch = max_batch
+        self.max_client_queue = max_client_queue
+        self._lock = threading.Lock()
+        self._pending = {}
+        # engine.io sockets already told to resync, skipped until their queue drains
+        self._lagging = weakref.WeakSet()
+
+    def send(self, cospace_id, changes):
+        """Queue changes for a cospace's room; call after they are committed."""
+        with self._lock:
+            pending = self._pending.get(cospace_id)
+            first = pending is None
+            if first:
+                pending = self._pending[cospace_id] = {}
+            for change in changes:
+                # re-insert so a comment sits at the position of its latest change
+                pending.pop(change['id'], None)
+                pending[change['id']] = change
+            full = len(pending) >= self.max_batch
+        if self.window <= 0 or full:
+            self.flush(cospace_id)
+        elif first:
+            timer = threading.Timer(self.window, self.flush, args=(cospace_id,))
+            timer.daemon = True
+            timer.start()
+
+    def flush(self, cospace_id):
+        with self._lock:
+            pending = self._pending.pop(cospace_id, None)
+        if not pending:
+            return
+        frame = encode_frame(cospace_id, pending.values())
+        room = room_for(cospace_id)
+        slow = self._slow_clients(room)
+        socketio.emit('comment_changes', frame, room=room, skip_sid=[sid for sid, _ in slow] or None)
+        for sid, sock in slow:
+            if sock not in self._lagging:
+                self._lagging.add(sock)
+                socketio.emit('resync', {'cospace_id': cospace_id, 'seq': frame['seq']}, to=sid)
+
+    def _slow_clients(self, room):
+        server = socketio.server
+        if server is None or not self.max_client_queue:
+            return []
+        slow = []
+        for sid, eio_sid in server.manager.get_participants('/', room):
+            sock = server.eio.sockets.get(eio_sid)
+            if sock is None:
+                continue
+            if sock.queue.qsize() > self.max_client_queue:
+                slow.append((sid, sock))
+            else:
+                self._lagging.discard(sock)
+        return slow
+
+
+def init_app(app):
+    app.config.setdefault('SOCKETIO_COALESCE_MS', 50)
+    app.config.setdefault('SOCKETIO_MAX_BATCH', 500)
+    app.config.setdefault('SOCKETIO_MAX_CLIENT_QUEUE', 100)
+    app.extensions['broadcast'] = Broadcaster(app.config['SOCKETIO_COALESCE_MS'] / 1000,
+                                              app.config['SOCKETIO_MAX_BATCH'],
+                                              app.config['SOCKETIO_MAX_CLIENT_QUEUE'])
+
+
+def send(cospace_id, changes):
+    """Broadcast committed changes to a cospace's room through the app's broadcaster."""
+    current_app.extensions['broadcast'].send(cospace_id, changes)
@@ -0,0 +1,101 @@
+"""Per-cospace change sequence for delta sync.
+
+Every insert, edit and soft-delete of a comment takes the next number of its
+cospace's ``change_seq`` and stores it in ``Comment.seq``, so a client that
+has seen everything up to ``since_seq`` only needs rows with a larger
+``seq``.  Deleted comments stay behind as tombstones (``deleted_at`` set,
+content cleared) so their deletion can be synced too.
+
+Numbers are reserved in ``before_flush`` by incrementing the cospace row.
+That row stays locked until the transaction ends, so writers to one cospace
+commit in sequence order and a client can never skip a number that becomes
+visible later (autoincrement ids give no such guarantee).
+"""
+from datetime import datetime
+from sqlalchemy import event, select, update
+from .db import db
+from .models import CoSpace, Comment
+
+
+def reserve(session, cospace, n):
+    """Reserve ``n`` consecutive sequence numbers of a cospace; returns the first.
+
+    ``cospace`` is an id, or a ``CoSpace`` that has not been inserted yet.
+    """
+    if isinstance(cospace, CoSpace):
+        first = (cospace.change_seq or 0) + 1
+        cospace.change_seq = first + n - 1
+        return first
+    stmt = (update(CoSpace).where(CoSpace.id == cospace)
+            .values(change_seq=CoSpace.change_seq + n)
+            .execution_options(synchronize_session=False))
+    if session.get_bind().dialect.update_returning:
+        last = session.execute(stmt.returning(CoSpace.change_seq)).scalar_one()
+    else:
+        session.execute(stmt)
+        last = session.execute(select(CoSpace.change_seq).where(CoSpace.id == cospace)).scalar_one()
+    return last - n + 1
+
+
+def _cospace_key(comment):
+    if comment.cospace_id is not None:
+        return comment.cospace_id
+    cospace = comment.cospace
+    if cospace is None:
+        return None
+    return cospace.id if cospace.id is not None else cospace
+
+
+@event.listens_for(db.session, 'before_flush')
+def _assign_seqs(session, flush_context, instances):
+    changed = {}
+    for obj in session.new:
+        if isinstance(obj, Comment):
+            changed.setdefault(_cospace_key(obj), []).append(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Comment) and session.is_modified(obj):
+            changed.setdefault(_cospace_key(obj), []).append(obj)
+    changed.pop(None, None)
+    for cospace, comments in changed.items():
+        first = reserve(session, cospace, len(comments))
+        for offset, comment in enumerate(comments):
+            comment.seq = first + offset
+
+
+def tombstone(comment):
+    """Soft-delete a comment, keeping only what delta sync needs."""
+    comment.deleted_at = datetime.utcnow()
+    comment.text = None
+    comment.selector = None
+    comment.meta = None
+
+
+def backfill_seqs(batch_size=1000):
+    """Number comments saved before sequences existed, oldest first.
+
+    Returns the number of comments updated.
+    """
+    updated = 0
+    cospace_ids = db.session.scalars(
+        select(Comment.cospace_id).where(Comment.seq.is_(None)).distinct()).all()
+    for cospace_id in cospace_ids:
+        while True:
+            ids = db.session.scalars(
+                select(Comment.id)
+                .where(Comment.cospace_id == cospace_id, Comment.seq.is_(None))
+                .order_by(Comment.id)
+                .limit(batch_size)).all()
+            if not ids:
+                break
+            first = reserve(db.session, cospace_id, len(ids))
+            db.session.execute(update(Comment), [{'id': i, 'seq': first + n} for n, i in enumerate(ids)])
+            db.session.commit()
+            updated += len(ids)
+    return updated
+
+
+def init_app(app):
+    @app.cli.command('backfill-change-seqs')
+    def backfill_change_seqs_command():
+        """Assign change sequence numbers to comments that have none."""
+        print(f'updated {backfill_seqs()} comments')
@@ -0,0 +1,60 @@
+"""Negotiated response compression.
+
+Responses of at least ``COMPRESS_MIN_SIZE`` bytes (1024) with a compressible
+mimetype are compressed with brotli when the client accepts it and the
+optional ``brotli`` package is installed, otherwise with gzip.  Smaller
+bodies are sent as they are: the saving would not pay for the CPU.
+
+A compressed body is a different representation, so its ETag is made weak;
+``If-None-Match`` still matches it because validators are compared weakly.
+"""
+import gzip
+from flask import request
+
+COMPRESSIBLE = {'application/json', 'text/plain', 'text/html', 'text/css', 'application/javascript'}
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def choose_encoding(accept_encoding, brotli_available):
+    """The available coding the client prefers, ``br`` on a tie, or None."""
+    return accept_encoding.best_match(['br', 'gzip'] if brotli_available else ['gzip'])
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+    # brotli's middle qualities compress better than gzip at similar speed
+    app.config.setdefault('COMPRESS_BR_QUALITY', 4)
+    brotli = _brotli()
+
+    @app.after_request
+    def compress(response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings, brotli is not None)
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        if encoding == 'br':
+            body = brotli.compress(body, quality=app.config['COMPRESS_BR_QUALITY'])
+        else:
+            body = gzip.compress(body, compresslevel=app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
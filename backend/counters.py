@@ -0,0 +1,156 @@
+"""Denormalized per-cospace comment counters.
+
+``CoSpace.comment_count`` (live comments, archived ones included),
+``last_comment_id``/``last_comment_at`` and the per-author counts in
+``co_space_author`` are kept up to date in the transaction that changes
+them: an ``after_flush`` listener adds the comments a flush inserted and
+subtracts the ones it soft-deleted.  Overview screens read them instead of
+counting comment rows.
+
+Writers to a cospace already hold its row lock from reserving change
+sequence numbers (see changes.py), so the read-modify-write of the author
+rows below cannot race.  Comments archived to ``comment_archive`` still
+count and purged tombstones were subtracted when deleted; comments archived
+to segment files leave the database, so retention subtracts them with
+``forget`` and ``recount`` agrees.
+``flask --app backend.app recount-comments`` rebuilds them from the rows.
+"""
+from sqlalchemy import delete, event, func, inspect, insert, literal, select, union_all, update
+from .db import db
+from .models import CoSpace, CoSpaceAuthor, Comment, CommentArchive
+
+
+class _Delta:
+    def __init__(self):
+        self.count = 0
+        self.last = None
+        self.removed = set()
+        self.authors = {}
+
+    def add(self, comment):
+        self.count += 1
+        if self.last is None or comment.id > self.last.id:
+            self.last = comment
+        if comment.author_id is not None:
+            self.authors[comment.author_id] = self.authors.get(comment.author_id, 0) + 1
+
+    def remove(self, comment):
+        self.count -= 1
+        self.removed.add(comment.id)
+        if comment.author_id is not None:
+            self.authors[comment.author_id] = self.authors.get(comment.author_id, 0) - 1
+
+
+def _soft_deleted(comment):
+    history = inspect(comment).attrs.deleted_at.history
+    return bool(history.added) and history.added[0] is not None and not any(history.deleted)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _count_comments(session, flush_context):
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, Comment) and obj.deleted_at is None:
+            deltas.setdefault(obj.cospace_id, _Delta()).add(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Comment) and _soft_deleted(obj):
+            deltas.setdefault(obj.cospace_id, _Delta()).remove(obj)
+    connection = session.connection()
+    for cospace_id, delta in deltas.items():
+        apply_delta(connection, cospace_id, delta)
+
+
+def apply_delta(connection, cospace_id, delta):
+    values = {'comment_count': CoSpace.comment_count + delta.count}
+    if delta.last is not None:
+        # ids of one cospace grow in commit order under its row lock
+        values.update(last_comment_id=delta.last.id, last_comment_at=delta.last.created_at)
+    connection.execute(update(CoSpace).where(CoSpace.id == cospace_id).values(**values))
+    if delta.removed and delta.last is None:
+        last_id = connection.execute(
+            select(CoSpace.last_comment_id).where(CoSpace.id == cospace_id)).scalar()
+        if last_id in delta.removed:
+            _set_last(connection, cospace_id)
+    for author_id, n in delta.authors.items():
+        if n == 0:
+            continue
+        res = connection.execute(
+            update(CoSpaceAuthor)
+            .where(CoSpaceAuthor.cospace_id == cospace_id, CoSpaceAuthor.author_id == author_id)
+            .values(comment_count=CoSpaceAuthor.comment_count + n))
+        if res.rowcount == 0:
+            connection.execute(insert(CoSpaceAuthor).values(cospace_id=cospace_id, author_id=author_id, comment_count=n))
+
+
+def _live(cospace_id):
+    """Live and archived comments of a cospace."""
+    return union_all(
+        select(Comment.id, Comment.author_id, Comment.created_at)
+        .where(Comment.cospace_id == cospace_id, Comment.deleted_at.is_(None)),
+        select(CommentArchive.id, CommentArchive.author_id, CommentArchive.created_at)
+        .where(CommentArchive.cospace_id == cospace_id),
+    ).subquery()
+
+
+def _set_last(connection, cospace_id, exclude=()):
+    live = _live(cospace_id)
+    q = select(live.c.id, live.c.created_at).order_by(live.c.id.desc()).limit(1)
+    if exclude:
+        q = q.where(live.c.id.not_in(exclude))
+    last = connection.execute(q).first()
+    connection.execute(update(CoSpace).where(CoSpace.id == cospace_id).values(
+        last_comment_id=last.id if last else None, last_comment_at=last.created_at if last else None))
+
+
+def forget(connection, cospace_id, ids):
+    """Subtract the live comments ``ids`` of a cospace that are about to be
+    removed from the database without a tombstone."""
+    authors = connection.execute(
+        select(Comment.author_id, func.count())
+        .where(Comment.id.in_(ids), Comment.cospace_id == cospace_id, Comment.deleted_at.is_(None))
+        .group_by(Comment.author_id)).all()
+    total = sum(n for _, n in authors)
+    if not total:
+        return
+    connection.execute(update(CoSpace).where(CoSpace.id == cospace_id)
+                       .values(comment_count=CoSpace.comment_count - total))
+    for author_id, n in authors:
+        if author_id is not None:
+            connection.execute(
+                update(CoSpaceAuthor)
+                .where(CoSpaceAuthor.cospace_id == cospace_id, CoSpaceAuthor.author_id == author_id)
+                .values(comment_count=CoSpaceAuthor.comment_count - n))
+    # recount keeps no rows for authors without comments
+    connection.execute(delete(CoSpaceAuthor).where(CoSpaceAuthor.cospace_id == cospace_id,
+                                                   CoSpaceAuthor.comment_count <= 0))
+    last_id = connection.execute(select(CoSpace.last_comment_id).where(CoSpace.id == cospace_id)).scalar()
+    if last_id in ids:
+        _set_last(connection, cospace_id, exclude=ids)
+
+
+def recount(connection, cospace_id=None):
+    """Rebuild the counters of one cospace, or of all; returns how many."""
+    q = select(CoSpace.id).order_by(CoSpace.id)
+    if cospace_id is not None:
+        q = q.where(CoSpace.id == cospace_id)
+    cospace_ids = connection.execute(q).scalars().all()
+    for cid in cospace_ids:
+        live = _live(cid)
+        count = connection.execute(select(func.count()).select_from(live)).scalar()
+        connection.execute(update(CoSpace).where(CoSpace.id == cid).values(comment_count=count))
+        _set_last(connection, cid)
+        connection.execute(delete(CoSpaceAuthor).where(CoSpaceAuthor.cospace_id == cid))
+        connection.execute(insert(CoSpaceAuthor).from_select(
+            ['cospace_id', 'author_id', 'comment_count'],
+            select(literal(cid), live.c.author_id, func.count())
+            .where(live.c.author_id.is_not(None))
+            .group_by(live.c.author_id)))
+    return len(cospace_ids)
+
+
+def init_app(app):
+    @app.cli.command('recount-comments')
+    def recount_comments_command():
+        """Rebuild the per-cospace comment counters."""
+        print(f'recounted {recount(db.session.connection())} cospaces')
+        db.session.commit()
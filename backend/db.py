@@ -1,4 +1,66 @@
+"""Shared SQLAlchemy instance and engine configuration.
+
+``init_db`` derives the engine options from the ``DB_*`` settings (their
+defaults are set in ``create_app``) before Flask-SQLAlchemy creates the
+engine:
+
+- server databases (Postgres): a pool of ``DB_POOL_SIZE`` connections plus
+  ``DB_MAX_OVERFLOW`` more under load, waiting at most ``DB_POOL_TIMEOUT``
+  seconds for one, recycled after ``DB_POOL_RECYCLE`` seconds and pinged
+  before use so a database restart does not fail requests
+- SQLite files: WAL journaling (``DB_SQLITE_WAL``) and a busy timeout
+  (``DB_BUSY_TIMEOUT_MS``) set on every connection, so readers never block
+  the writer and concurrent writers queue for the lock instead of failing
+  with "database is locked"
+
+Options given explicitly in ``SQLALCHEMY_ENGINE_OPTIONS`` win.
+"""
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 
 # shared DB instance
 db = SQLAlchemy()
+
+
+def database_url(url):
+    # SQLAlchemy dropped the postgres:// alias that hosting providers still hand out
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(config):
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite':
+        return options
+    options.setdefault('pool_size', config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+    options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+    options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+    options.setdefault('pool_pre_ping', True)
+    return options
+
+
+def sqlite_pragmas(busy_timeout_ms, wal):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout = {int(busy_timeout_ms)}')
+        if wal:
+            # a no-op for in-memory databases, which report journal_mode "memory"
+            cursor.execute('PRAGMA journal_mode = WAL')
+            # WAL stays consistent with NORMAL; only the last commits can be lost on power failure
+            cursor.execute('PRAGMA synchronous = NORMAL')
+        cursor.close()
+    return on_connect
+
+
+def init_db(app):
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', sqlite_pragmas(app.config['DB_BUSY_TIMEOUT_MS'], app.config['DB_SQLITE_WAL']))
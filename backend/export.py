@@ -0,0 +1,157 @@
+"""Streaming GitHub Gist export of a cospace's comments.
+
+Comments, archived ones included, are read in keyset pages of
+``EXPORT_BATCH_SIZE`` and encoded one at a time into JSON arrays that are cut
+into gist files of at most ``GIST_FILE_MAX_BYTES``.  Each page is fetched
+whole and the read transaction ended before any upload, so no cursor or
+pooled connection is held while GitHub calls wait on retries.
+The gist is created with the first file and the remaining files are added
+with one PATCH each, so a worker only ever holds a single file in memory.
+Uploads run in a background thread through the app's shared outbound HTTP
+client (timeouts, retries, rate limits); the user who started the export
+polls the job for its status.  Finished jobs are forgotten after
+``EXPORT_JOB_TTL`` seconds.
+"""
+import json
+import threading
+import time
+import uuid
+from . import outbound, retention
+from .db import db
+from .models import Comment
+from .serializers import comment_rows, serialize_comment
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def comment_batches(cospace_id, batch_size):
+    """Yield the comments of the cospace, archived ones included, in id order
+    as lists of at most ``batch_size`` rows."""
+    last_id = 0
+    while True:
+        q = (Comment.query.filter(Comment.cospace_id == cospace_id, Comment.deleted_at.is_(None), Comment.id > last_id)
+             .order_by(Comment.id))
+        rows = comment_rows(q).limit(batch_size).all()
+        rows = retention.with_archived(rows, cospace_id, after_id=last_id, limit=batch_size)
+        # release the connection before the caller uploads anything
+        db.session.rollback()
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1].id
+
+
+def iter_comment_json(cospace_id, batch_size):
+    """Yield each comment of the cospace, archived ones included, as an
+    encoded JSON object in id order."""
+    for rows in comment_batches(cospace_id, batch_size):
+        for row in rows:
+            yield json.dumps(serialize_comment(row))
+
+
+def iter_gist_files(items, max_bytes):
+    """Group encoded items into JSON array documents of at most ``max_bytes``.
+
+    A single item larger than ``max_bytes`` still gets a file of its own.
+    """
+    parts, size = [], 2
+    for item in items:
+        item_size = len(item.encode()) + 2
+        if parts and size + item_size > max_bytes:
+            yield '[\n' + ',\n'.join(parts) + '\n]'
+            parts, size = [], 2
+        parts.append(item)
+        size += item_size
+    yield '[\n' + ',\n'.join(parts) + '\n]'
+
+
+def file_name(cospace_id, index):
+    suffix = f'_{index + 1}' if index else ''
+    return f'cospace_{cospace_id}_comments{suffix}.json'
+
+
+def _evict(now):
+    # callers hold _jobs_lock
+    for job_id in [i for i, job in _jobs.items() if job['expires_at'] is not None and job['expires_at'] <= now]:
+        del _jobs[job_id]
+
+
+def create_job(cospace_id, user_id):
+    job = {'id': uuid.uuid4().hex, 'status': 'pending', 'cospace_id': cospace_id,
+           'user_id': user_id, 'files': 0, 'gist': None, 'error': None, 'expires_at': None}
+    with _jobs_lock:
+        _evict(time.monotonic())
+        _jobs[job['id']] = job
+    return job
+
+
+def get_job(job_id, user_id):
+    """A copy of the job if ``user_id`` started it and it has not expired."""
+    with _jobs_lock:
+        _evict(time.monotonic())
+        job = _jobs.get(job_id)
+        if job is None or user_id is None or job['user_id'] != user_id:
+            return None
+        return dict(job)
+
+
+def _update(job, **fields):
+    with _jobs_lock:
+        job.update(fields)
+
+
+def _finish(app, job, **fields):
+    _update(job, expires_at=time.monotonic() + app.config['EXPORT_JOB_TTL'], **fields)
+
+
+def error_details(response):
+    try:
+        return response.json()
+    except ValueError:
+        return response.text[:500]
+
+
+def run_export(app, job, cospace_name, token, public):
+    cospace_id = job['cospace_id']
+    api = app.config['GITHUB_API_URL']
+    headers = {'Authorization': f'token {token}', 'Accept': 'application/vnd.github+json'}
+    http = outbound.client(app)
+    _update(job, status='running')
+    try:
+        with app.app_context():
+            items = iter_comment_json(cospace_id, app.config['EXPORT_BATCH_SIZE'])
+            files = iter_gist_files(items, app.config['GIST_FILE_MAX_BYTES'])
+            gist = None
+            for index, content in enumerate(files):
+                name = file_name(cospace_id, index)
+                if gist is None:
+                    r = http.post(api + '/gists', headers=headers, json={
+                        'description': f'CoSpace comments export: {cospace_name}',
+                        'public': bool(public),
+                        'files': {name: {'content': content}},
+                    })
+                else:
+                    # setting a file's content again is harmless, so PATCHes may be retried
+                    r = http.patch(f"{api}/gists/{gist['id']}", headers=headers, idempotent=True, json={
+                        'files': {name: {'content': content}},
+                    })
+                if r.status_code >= 400:
+                    _finish(app, job, status='error', error={'message': 'github API error', 'status': r.status_code, 'details': error_details(r)})
+                    return
+                gist = r.json()
+                _update(job, files=index + 1)
+            _finish(app, job, status='done', gist={'id': gist['id'], 'html_url': gist.get('html_url')})
+    except Exception as e:
+        _finish(app, job, status='error', error={'message': str(e)})
+    finally:
+        with app.app_context():
+            db.session.remove()
+
+
+def start_export(app, job, cospace_name, token, public):
+    # a plain thread is green once eventlet has monkey-patched the stdlib
+    t = threading.Thread(target=run_export, args=(app, job, cospace_name, token, public), daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,52 @@
+"""Fast JSON encoding for responses.
+
+With the optional ``orjson`` package installed (``JSON_ENCODER`` left at
+``auto``), ``jsonify`` encodes with orjson straight to bytes instead of the
+stdlib encoder and a str round trip.  The output is the same JSON apart from
+non-ASCII text, which is sent as UTF-8 rather than ``\\u`` escapes; dates and
+other types orjson would format differently still go through Flask's
+``default``.  Debug and ``compact = False`` output is still indented by the
+stdlib encoder.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def __init__(self, app):
+        import orjson
+        super().__init__(app)
+        self.orjson = orjson
+        self.option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def _dumpb(self, obj, option=0):
+        if self.sort_keys:
+            option |= self.orjson.OPT_SORT_KEYS
+        return self.orjson.dumps(obj, default=self.default, option=self.option | option)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._dumpb(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return self.orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = self._dumpb(obj, self.orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    app.config.setdefault('JSON_ENCODER', 'auto')
+    if app.config['JSON_ENCODER'] == 'default':
+        return
+    try:
+        app.json = OrjsonProvider(app)
+    except ImportError:
+        if app.config['JSON_ENCODER'] == 'orjson':
+            raise
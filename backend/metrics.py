@@ -0,0 +1,170 @@
+"""Opt-in request instrumentation exposed in Prometheus text format.
+
+Enabled with ``METRICS_ENABLED``.  Records, per endpoint:
+
+- request latency histograms
+- SQL statement counts and time spent in the database (SQLAlchemy engine events)
+
+plus a gauge of long-poll requests currently parked on the notification hub,
+all served from ``/metrics``.  Setting ``PROFILE_SLOW_REQUEST_MS`` profiles a
+``PROFILE_SAMPLE_RATE`` fraction of requests (1%) with cProfile and writes the
+stats of those slower than the threshold to ``PROFILE_DIR``.  One request is
+profiled at a time per process: greenlets share a thread, and with it the
+profiler hook.
+"""
+import os
+import random
+import threading
+import time
+from flask import Response, g, request
+from sqlalchemy import event
+from .db import db
+from .notify import hub
+
+# held by the request being profiled
+_profiling = threading.Lock()
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.requests = {}
+        self.sql_count = {}
+        self.sql_seconds = {}
+
+    def observe_request(self, endpoint, method, status, seconds, sql_count, sql_seconds):
+        with self._lock:
+            self.latency.setdefault((endpoint, method), Histogram()).observe(seconds)
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.sql_count[endpoint] = self.sql_count.get(endpoint, 0) + sql_count
+            self.sql_seconds[endpoint] = self.sql_seconds.get(endpoint, 0.0) + sql_seconds
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += ['# HELP codocs_requests_total Requests handled, by endpoint, method and status.',
+                      '# TYPE codocs_requests_total counter']
+            for (endpoint, method, status), n in sorted(self.requests.items()):
+                lines.append(f'codocs_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {n}')
+            lines += ['# HELP codocs_request_duration_seconds Request latency, by endpoint and method.',
+                      '# TYPE codocs_request_duration_seconds histogram']
+            for (endpoint, method), h in sorted(self.latency.items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                cumulative = 0
+                for bound, n in zip(BUCKETS + ('+Inf',), h.counts):
+                    cumulative += n
+                    lines.append(f'codocs_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'codocs_request_duration_seconds_sum{{{labels}}} {h.sum:.6f}')
+                lines.append(f'codocs_request_duration_seconds_count{{{labels}}} {cumulative}')
+            lines += ['# HELP codocs_db_statements_total SQL statements executed, by endpoint.',
+                      '# TYPE codocs_db_statements_total counter']
+            for endpoint, n in sorted(self.sql_count.items()):
+                lines.append(f'codocs_db_statements_total{{endpoint="{endpoint}"}} {n}')
+            lines += ['# HELP codocs_db_seconds_total Time spent executing SQL, by endpoint.',
+                      '# TYPE codocs_db_seconds_total counter']
+            for endpoint, seconds in sorted(self.sql_seconds.items()):
+                lines.append(f'codocs_db_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+        lines += ['# HELP codocs_longpoll_parked Long-poll requests currently waiting for comments.',
+                  '# TYPE codocs_longpoll_parked gauge',
+                  f'codocs_longpoll_parked {hub.waiting()}']
+        return '\n'.join(lines) + '\n'
+
+
+def _endpoint():
+    return request.endpoint or 'unknown'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    sql = g.get('metrics_sql') if g else None
+    if sql is not None:
+        sql[0] += 1
+        sql[1] += elapsed
+
+
+def init_app(app):
+    app.config.setdefault('METRICS_ENABLED', False)
+    app.config.setdefault('PROFILE_SLOW_REQUEST_MS', None)
+    # profiling slows a request several times over
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.01)
+    app.config.setdefault('PROFILE_DIR', 'profiles')
+    if not app.config['METRICS_ENABLED']:
+        return None
+    metrics = Metrics()
+    app.extensions['metrics'] = metrics
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql = [0, 0.0]
+        threshold = app.config['PROFILE_SLOW_REQUEST_MS']
+        if (threshold is not None and random.random() < app.config['PROFILE_SAMPLE_RATE']
+                and _profiling.acquire(blocking=False)):
+            # only sampled requests pay for importing the profiler
+            import cProfile
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _profiling.release()
+            if elapsed * 1000 >= app.config['PROFILE_SLOW_REQUEST_MS']:
+                dump_profile(app.config['PROFILE_DIR'], profiler, elapsed)
+        sql_count, sql_seconds = g.pop('metrics_sql')
+        metrics.observe_request(_endpoint(), request.method, response.status_code, elapsed, sql_count, sql_seconds)
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        # after_request is skipped when the view raised
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _profiling.release()
+
+    @app.route('/metrics')
+    def metrics_view():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
+
+
+def dump_profile(directory, profiler, elapsed):
+    os.makedirs(directory, exist_ok=True)
+    name = f'{_endpoint()}-{time.strftime("%Y%m%dT%H%M%S")}-{int(elapsed * 1000)}ms-{os.getpid()}.prof'
+    profiler.dump_stats(os.path.join(directory, name))
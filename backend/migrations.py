@@ -0,0 +1,230 @@
+"""Schema migrations.
+
+``flask --app backend.app db-upgrade`` applies pending revisions in order and
+records each in ``schema_version``.  A revision inspects the live schema and
+only adds what is missing, so the same path works for a fresh database
+(the first revision creates the tables of the first release), one created
+with ``db.create_all()``, and one created before migrations existed.
+
+To change the schema, update the models and append a revision that brings
+an existing database to the same shape.  A revision that creates a table
+later revisions alter declares the table as it was at that revision, not
+from the models.  Migrations are forward-only: there are no downgrades, so
+back up the database before upgrading.
+"""
+from datetime import datetime
+from sqlalchemy import (Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, UniqueConstraint,
+                        inspect, select, text)
+from . import anchors, counters, search
+from .db import db
+
+version_table = Table(
+    'schema_version', MetaData(),
+    Column('version', String(64), primary_key=True),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+# tables as the revision that created them declared them, so each later
+# revision runs against the schema it was written for
+frozen = MetaData()
+# the first release, created with db.create_all()
+Table('user', frozen,
+      Column('id', Integer, primary_key=True),
+      Column('username', String(80), unique=True, nullable=False),
+      Column('github_id', String(80), unique=True, nullable=True),
+      Column('github_token_encrypted', String(1024), nullable=True))
+Table('team', frozen,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(120), nullable=False),
+      Column('owner_id', Integer, ForeignKey('user.id'), nullable=True))
+Table('team_member', frozen,
+      Column('id', Integer, primary_key=True),
+      Column('team_id', Integer, ForeignKey('team.id'), nullable=False),
+      Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+      Column('role', String(32)))
+Table('co_space', frozen,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(120), nullable=False),
+      Column('team_id', Integer, ForeignKey('team.id'), nullable=False),
+      Column('description', Text, nullable=True))
+Table('comment', frozen,
+      Column('id', Integer, primary_key=True),
+      Column('cospace_id', Integer, ForeignKey('co_space.id'), nullable=False),
+      Column('author_id', Integer, ForeignKey('user.id'), nullable=True),
+      Column('selector', String(512), nullable=True),
+      Column('text', Text, nullable=True),
+      Column('metadata', Text, nullable=True),
+      Column('created_at', DateTime))
+
+INITIAL_TABLES = ('user', 'team', 'team_member', 'co_space', 'comment')
+
+# revision 0007; 0008 adds flagged_at
+Table('anchor_status', frozen,
+      Column('id', Integer, primary_key=True),
+      Column('cospace_id', Integer, ForeignKey('co_space.id'), nullable=False),
+      Column('page_url', String(2048), nullable=False),
+      Column('selector_key', String(40), nullable=False),
+      Column('failures', Integer, nullable=False, default=0),
+      Column('first_failed_at', DateTime, nullable=False),
+      Column('last_failed_at', DateTime, nullable=False),
+      UniqueConstraint('cospace_id', 'page_url', 'selector_key', name='uq_anchor_status_anchor'))
+
+REVISIONS = []
+
+
+def revision(version):
+    def register(upgrade):
+        REVISIONS.append((version, upgrade))
+        return upgrade
+    return register
+
+
+def _columns(connection, table):
+    return {c['name'] for c in inspect(connection).get_columns(table)}
+
+
+def _indexes(connection, table):
+    inspector = inspect(connection)
+    return ({i['name'] for i in inspector.get_indexes(table)}
+            | {u['name'] for u in inspector.get_unique_constraints(table)})
+
+
+def add_column(connection, table, name, ddl):
+    """Add a column unless it exists; returns whether it was added."""
+    if name in _columns(connection, table):
+        return False
+    connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+    return True
+
+
+def create_index(connection, table, name):
+    """Create an index declared on a model table unless it exists."""
+    if name not in _indexes(connection, table):
+        index = next(i for i in db.metadata.tables[table].indexes if i.name == name)
+        index.create(connection)
+
+
+@revision('0001_initial')
+def _initial(connection):
+    frozen.create_all(connection, tables=[frozen.tables[name] for name in INITIAL_TABLES])
+
+
+@revision('0002_listing_indexes')
+def _listing_indexes(connection):
+    add_column(connection, 'team', 'members_version', 'INTEGER NOT NULL DEFAULT 0')
+    if 'uq_team_member_team_id_user_id' not in _indexes(connection, 'team_member'):
+        # keep the oldest of duplicated memberships before making them unique
+        connection.execute(text('DELETE FROM team_member WHERE id NOT IN '
+                                '(SELECT MIN(id) FROM team_member GROUP BY team_id, user_id)'))
+        connection.execute(text('CREATE UNIQUE INDEX uq_team_member_team_id_user_id ON team_member (team_id, user_id)'))
+    create_index(connection, 'team_member', 'ix_team_member_user_id')
+    add_column(connection, 'comment', 'page_url', 'VARCHAR(2048)')
+    create_index(connection, 'comment', 'ix_comment_cospace_id_id')
+    create_index(connection, 'comment', 'ix_comment_cospace_id_page_url_id')
+
+
+@revision('0003_search_index')
+def _search_index(connection):
+    search.install(connection)
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("INSERT INTO comment_fts(comment_fts) VALUES ('rebuild')"))
+
+
+def _number_comments(connection, batch_size=1000):
+    """Number existing comments per cospace in id order, in one pass."""
+    dialect = connection.dialect
+    if dialect.name == 'postgresql' or (dialect.name == 'sqlite' and dialect.dbapi.sqlite_version_info >= (3, 33)):
+        connection.execute(text(
+            'UPDATE comment SET seq = numbered.seq FROM '
+            '(SELECT id, ROW_NUMBER() OVER (PARTITION BY cospace_id ORDER BY id) AS seq FROM comment) AS numbered '
+            'WHERE comment.id = numbered.id'))
+        return
+    # no UPDATE ... FROM: walk the comments in order and number them here
+    rows = connection.execute(text('SELECT id, cospace_id FROM comment ORDER BY cospace_id, id')).all()
+    seqs, cospace_id, seq = [], None, 0
+    for row in rows:
+        seq = seq + 1 if row.cospace_id == cospace_id else 1
+        cospace_id = row.cospace_id
+        seqs.append({'comment_id': row.id, 'seq': seq})
+    for start in range(0, len(seqs), batch_size):
+        connection.execute(text('UPDATE comment SET seq = :seq WHERE id = :comment_id'), seqs[start:start + batch_size])
+
+
+@revision('0004_change_seq')
+def _change_seq(connection):
+    add_column(connection, 'co_space', 'change_seq', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(connection, 'comment', 'updated_at', 'TIMESTAMP')
+    add_column(connection, 'comment', 'deleted_at', 'TIMESTAMP')
+    if add_column(connection, 'comment', 'seq', 'INTEGER'):
+        _number_comments(connection)
+        connection.execute(text(
+            'UPDATE co_space SET change_seq = '
+            '(SELECT COALESCE(MAX(seq), 0) FROM comment WHERE comment.cospace_id = co_space.id)'))
+    create_index(connection, 'comment', 'ix_comment_cospace_id_seq')
+
+
+@revision('0005_retention')
+def _retention(connection):
+    add_column(connection, 'co_space', 'retention_days', 'INTEGER')
+    add_column(connection, 'co_space', 'pruned_seq', 'INTEGER NOT NULL DEFAULT 0')
+    db.metadata.tables['comment_archive'].create(connection, checkfirst=True)
+
+
+@revision('0006_comment_counters')
+def _comment_counters(connection):
+    add_column(connection, 'co_space', 'comment_count', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(connection, 'co_space', 'last_comment_id', 'INTEGER')
+    add_column(connection, 'co_space', 'last_comment_at', 'TIMESTAMP')
+    db.metadata.tables['co_space_author'].create(connection, checkfirst=True)
+    counters.recount(connection)
+
+
+@revision('0007_anchors')
+def _anchors(connection):
+    if add_column(connection, 'comment', 'selector_key', 'VARCHAR(40)'):
+        anchors.backfill_selector_keys(connection)
+    create_index(connection, 'comment', 'ix_comment_cospace_id_page_url_selector_key')
+    frozen.tables['anchor_status'].create(connection, checkfirst=True)
+
+
+@revision('0008_anchor_failures')
+def _anchor_failures(connection):
+    if add_column(connection, 'anchor_status', 'flagged_at', 'TIMESTAMP'):
+        # failures used to count reports, not distinct users and days; start over
+        connection.execute(text('DELETE FROM anchor_status'))
+    db.metadata.tables['anchor_failure'].create(connection, checkfirst=True)
+
+
+def applied(connection):
+    if not inspect(connection).has_table(version_table.name):
+        return []
+    return list(connection.execute(select(version_table.c.version).order_by(version_table.c.version)).scalars())
+
+
+def upgrade(connection):
+    """Apply pending revisions in order; returns the versions applied."""
+    version_table.create(connection, checkfirst=True)
+    done = set(applied(connection))
+    new = []
+    for version, upgrade_revision in REVISIONS:
+        if version in done:
+            continue
+        upgrade_revision(connection)
+        connection.execute(version_table.insert().values(version=version, applied_at=datetime.utcnow()))
+        new.append(version)
+    return new
+
+
+def init_app(app):
+    @app.cli.command('db-upgrade')
+    def db_upgrade():
+        """Create or upgrade the database schema."""
+        with db.engine.begin() as connection:
+            new = upgrade(connection)
+        print('applied ' + ', '.join(new) if new else 'already up to date')
+
+    @app.cli.command('db-version')
+    def db_version():
+        """Show the applied schema revisions."""
+        with db.engine.connect() as connection:
+            print('\n'.join(applied(connection)) or 'no revisions applied')
@@ -9,11 +9,6 @@ class User(db.Model):
     github_id = db.Column(db.String(80), unique=True, nullable=True)
     github_token_encrypted = db.Column(db.String(1024), nullable=True)
 
-    # helper to list teams via memberships
-    @property
-    def teams(self):
-        return [m.team for m in getattr(self, 'memberships', [])]
-
 
 class Team(db.Model):
     __tablename__ = 'team'
@@ -21,11 +16,18 @@ class Team(db.Model):
     name = db.Column(db.String(120), nullable=False)
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     owner = db.relationship('User', backref='owned_teams')
+    # bumped on every membership change; backs the members listing ETag
+    members_version = db.Column(db.Integer, nullable=False, default=0)
     memberships = db.relationship('TeamMember', back_populates='team', cascade='all, delete-orphan')
 
 
 class TeamMember(db.Model):
     __tablename__ = 'team_member'
+    __table_args__ = (
+        db.UniqueConstraint('team_id', 'user_id', name='uq_team_member_team_id_user_id'),
+        # team and cospace listings start from the user's memberships
+        db.Index('ix_team_member_user_id', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -41,16 +43,100 @@ class CoSpace(db.Model):
     team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
     team = db.relationship('Team')
     description = db.Column(db.Text, nullable=True)
+    # last comment change sequence number handed out (see changes.py)
+    change_seq = db.Column(db.Integer, nullable=False, default=0)
+    # archive comments untouched for this many days (see retention.py); None keeps them
+    retention_days = db.Column(db.Integer, nullable=True)
+    # highest seq of a purged tombstone; delta syncs from before it must start over
+    pruned_seq = db.Column(db.Integer, nullable=False, default=0)
+    # maintained by counters.py; archived comments count, deleted ones do not
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    last_comment_id = db.Column(db.Integer, nullable=True)
+    last_comment_at = db.Column(db.DateTime, nullable=True)
+
+
+class CoSpaceAuthor(db.Model):
+    """Live comments per author and cospace (see counters.py)."""
+    __tablename__ = 'co_space_author'
+    cospace_id = db.Column(db.Integer, db.ForeignKey('co_space.id'), primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
 
 
 class Comment(db.Model):
     __tablename__ = 'comment'
+    __table_args__ = (
+        # keyset pagination, long-poll and since_id scans all walk (cospace_id, id)
+        db.Index('ix_comment_cospace_id_id', 'cospace_id', 'id'),
+        # per-page listings and long-polls from the extension
+        db.Index('ix_comment_cospace_id_page_url_id', 'cospace_id', 'page_url', 'id'),
+        # delta sync reads changes in sequence order
+        db.Index('ix_comment_cospace_id_seq', 'cospace_id', 'seq', unique=True),
+        # a page's comments grouped by anchor
+        db.Index('ix_comment_cospace_id_page_url_selector_key', 'cospace_id', 'page_url', 'selector_key'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     cospace_id = db.Column(db.Integer, db.ForeignKey('co_space.id'), nullable=False)
     cospace = db.relationship('CoSpace')
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     author = db.relationship('User')
     selector = db.Column(db.String(512), nullable=True)
+    # hash of the normalized selector, set whenever it changes (see anchors.py)
+    selector_key = db.Column(db.String(40), nullable=True)
     text = db.Column(db.Text, nullable=True)
-    metadata = db.Column(db.Text, nullable=True)
+    meta = db.Column('metadata', db.Text, nullable=True)
+    # normalized URL of the page the comment is anchored to (see pages.normalize_page_url)
+    page_url = db.Column(db.String(2048), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    # set on soft-delete; the row stays as a tombstone for delta sync
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # cospace change sequence number of the latest insert, edit or delete
+    seq = db.Column(db.Integer, nullable=True)
+
+
+class CommentArchive(db.Model):
+    """Comments moved out of the hot ``comment`` table by retention."""
+    __tablename__ = 'comment_archive'
+    __table_args__ = (
+        db.Index('ix_comment_archive_cospace_id_id', 'cospace_id', 'id'),
+    )
+    # keeps the id the comment had in ``comment``
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    cospace_id = db.Column(db.Integer, db.ForeignKey('co_space.id'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    selector = db.Column(db.String(512), nullable=True)
+    text = db.Column(db.Text, nullable=True)
+    meta = db.Column('metadata', db.Text, nullable=True)
+    page_url = db.Column(db.String(2048), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    seq = db.Column(db.Integer, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+
+class AnchorStatus(db.Model):
+    """An anchor the extension failed to find in its page (see anchors.py)."""
+    __tablename__ = 'anchor_status'
+    __table_args__ = (
+        db.UniqueConstraint('cospace_id', 'page_url', 'selector_key', name='uq_anchor_status_anchor'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    cospace_id = db.Column(db.Integer, db.ForeignKey('co_space.id'), nullable=False)
+    page_url = db.Column(db.String(2048), nullable=False)
+    selector_key = db.Column(db.String(40), nullable=False)
+    # distinct (user, day) failures since it last resolved; see AnchorFailure
+    failures = db.Column(db.Integer, nullable=False, default=0)
+    first_failed_at = db.Column(db.DateTime, nullable=False)
+    last_failed_at = db.Column(db.DateTime, nullable=False)
+    # set by an owner or admin pruning stale anchors; the comments are kept
+    flagged_at = db.Column(db.DateTime, nullable=True)
+
+
+class AnchorFailure(db.Model):
+    """A user who could not resolve an anchor on a given day; an anchor's
+    ``failures`` counts these, so repeated reports add nothing."""
+    __tablename__ = 'anchor_failure'
+    status_id = db.Column(db.Integer, db.ForeignKey('anchor_status.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
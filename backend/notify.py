@@ -0,0 +1,209 @@
+"""In-process notification hub used to wake parked long-poll requests.
+
+Long-poll handlers register a waiter for a cospace *before* they query for
+new comments, then block on it.  Committing a session that added or changed
+comments publishes the affected cospace ids through a fan-out backend, which
+wakes every waiter for those cospaces (in this process, or in every process when a
+pub/sub broker is configured).
+
+Waiters use ``threading`` primitives looked up at call time, so they are
+green when eventlet has monkey-patched the stdlib.
+"""
+import itertools
+import threading
+from sqlalchemy import event
+from .db import db
+
+CHANNEL = 'codocs-notify'
+
+
+class Waiter:
+    """A single parked request waiting for activity on one cospace."""
+
+    def __init__(self, hub, key):
+        self.hub = hub
+        self.key = key
+        self.event = threading.Event()
+
+    def wait(self, timeout=None):
+        return self.event.wait(timeout)
+
+    def __enter__(self):
+        self.hub._add(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.hub._discard(self)
+        return False
+
+
+class MemoryBackend:
+    """Default backend: wakeups only reach waiters in this process."""
+
+    def start(self, hub):
+        self.hub = hub
+
+    def publish(self, key):
+        self.hub._wake(key)
+
+    def listen(self):
+        pass
+
+
+class LocalBroker:
+    """Minimal in-process pub/sub broker.
+
+    Stands in for Redis in tests and single-host setups: several hubs sharing
+    one broker behave like several worker processes sharing a Redis server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, ()))
+        for cb in callbacks:
+            cb(message)
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+
+class RedisBroker:
+    """Redis pub/sub broker; requires the optional ``redis`` package."""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self.client.publish(channel, message)
+
+    def subscribe(self, channel, callback):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{channel: lambda msg: callback(msg['data'])})
+        pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+
+class BrokerBackend:
+    """Fan wakeups out to every process subscribed to the same broker."""
+
+    def __init__(self, broker, channel=CHANNEL):
+        self.broker = broker
+        self.channel = channel
+        self.subscribed = False
+        self._lock = threading.Lock()
+
+    def start(self, hub):
+        self.hub = hub
+
+    def listen(self):
+        # subscribe once the first waiter parks, so a preloaded parent process
+        # never opens a connection that its forked workers would share
+        if self.subscribed:
+            return
+        with self._lock:
+            if not self.subscribed:
+                self.broker.subscribe(self.channel, lambda msg: self.hub._wake(_decode(msg)))
+                self.subscribed = True
+
+    def publish(self, key):
+        self.broker.publish(self.channel, str(key))
+
+
+def _decode(message):
+    if isinstance(message, bytes):
+        message = message.decode()
+    return int(message)
+
+
+def backend_from_url(url):
+    if not url or url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith('local://'):
+        return BrokerBackend(LocalBroker())
+    if url.startswith(('redis://', 'rediss://')):
+        return BrokerBackend(RedisBroker(url))
+    raise ValueError(f'unsupported NOTIFY_URL: {url}')
+
+
+class NotificationHub:
+    def __init__(self, backend=None):
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self.url = None
+        self.set_backend(backend or MemoryBackend())
+
+    def init_app(self, app):
+        app.config.setdefault('NOTIFY_URL', 'memory://')
+        self.url = app.config['NOTIFY_URL']
+        self.set_backend(backend_from_url(self.url))
+        app.extensions['notify'] = self
+
+    def after_fork(self):
+        """Start over in a forked worker: no waiters and a broker connection of its own."""
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self.set_backend(backend_from_url(self.url))
+
+    def set_backend(self, backend):
+        self.backend = backend
+        backend.start(self)
+
+    def listen(self, key):
+        """Return a context manager that parks a waiter on ``key``."""
+        return Waiter(self, key)
+
+    def publish(self, key):
+        self.backend.publish(key)
+
+    def waiting(self):
+        with self._lock:
+            return sum(len(w) for w in self._waiters.values())
+
+    def _add(self, waiter):
+        # subscribing may go over the network; don't hold up other waiters or wakeups
+        self.backend.listen()
+        with self._lock:
+            self._waiters.setdefault(waiter.key, set()).add(waiter)
+
+    def _discard(self, waiter):
+        with self._lock:
+            waiters = self._waiters.get(waiter.key)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[waiter.key]
+
+    def _wake(self, key):
+        with self._lock:
+            waiters = list(self._waiters.get(key, ()))
+        for w in waiters:
+            w.event.set()
+
+
+# shared hub instance (initialized by app)
+hub = NotificationHub()
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changed_comments(session, flush_context):
+    from .models import Comment
+    keys = session.info.setdefault('notify_cospaces', set())
+    for obj in itertools.chain(session.new, session.dirty):
+        if isinstance(obj, Comment):
+            keys.add(obj.cospace_id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_new_comments(session):
+    for key in session.info.pop('notify_cospaces', ()):
+        hub.publish(key)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_new_comments(session):
+    session.info.pop('notify_cospaces', None)
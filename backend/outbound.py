@@ -0,0 +1,190 @@
+"""Shared client for outbound HTTP calls (the GitHub API).
+
+Each app gets one ``HTTPClient`` holding a keep-alive ``requests.Session``,
+so repeated calls reuse pooled connections and TLS sessions.  Every request:
+
+- has connect and read timeouts (``HTTP_CONNECT_TIMEOUT``, ``HTTP_READ_TIMEOUT``)
+- is retried up to ``HTTP_MAX_RETRIES`` times when rate limited (429, or
+  GitHub's 403 with ``Retry-After`` or an exhausted ``X-RateLimit-Remaining``)
+  and, for idempotent requests, on 5xx and network errors.  The client waits
+  for ``Retry-After``/``X-RateLimit-Reset`` when sent, otherwise backs off
+  exponentially with jitter; a server asking for more than
+  ``HTTP_MAX_RETRY_WAIT`` seconds gets its response returned instead
+- takes one of ``HTTP_MAX_CONCURRENCY`` slots while it is in flight, so a
+  burst of exports queues (for at most ``HTTP_QUEUE_TIMEOUT`` seconds)
+  instead of tying up every worker greenlet
+
+Non-idempotent requests (POST) are only retried when the server cannot have
+acted on them: rate limits and failures to connect.
+
+``requests`` is imported and the client built on first use, so processes that
+never export don't pay for them, and a worker forked from a preloaded app
+opens its own connections.
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from flask import current_app
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class ClientBusy(Exception):
+    """No request slot became free within the queue timeout."""
+
+
+def server_wait(headers, now=None):
+    """Seconds the server asked us to wait, or None."""
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - (now or time.time()))
+            except (TypeError, ValueError):
+                return None
+    if headers.get('X-RateLimit-Remaining') == '0' and headers.get('X-RateLimit-Reset'):
+        try:
+            return max(0.0, float(headers['X-RateLimit-Reset']) - (now or time.time()))
+        except ValueError:
+            return None
+    return None
+
+
+def never_sent(error):
+    """Whether a request failed before reaching the server (connect refused or timed out)."""
+    import requests
+    from urllib3.exceptions import NewConnectionError
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    return isinstance(getattr(error.args[0] if error.args else None, 'reason', None), NewConnectionError)
+
+
+def rate_limited(response):
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and (
+        'Retry-After' in response.headers or response.headers.get('X-RateLimit-Remaining') == '0')
+
+
+class HTTPClient:
+    def __init__(self, connect_timeout=3.05, read_timeout=30, max_retries=3, backoff=0.5, max_backoff=30,
+                 max_retry_wait=60, max_concurrency=8, queue_timeout=30, pool_size=10, sleep=time.sleep):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_wait = max_retry_wait
+        self.queue_timeout = queue_timeout
+        self.sleep = sleep
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.session = requests.Session()
+        # retries are handled here, where rate limit headers are understood
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        """Send a request, retrying as described above; returns the last response.
+
+        ``idempotent`` defaults from the method; pass True for requests that
+        are safe to repeat although their method is not (e.g. a PATCH that
+        sets a value). Raises the last network error, or ``ClientBusy``.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            response, error = self._send(method, url, **kwargs)
+            delay = self._retry_delay(attempt, response, error, idempotent)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            self.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def _send(self, method, url, **kwargs):
+        import requests
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise ClientBusy(f'no outbound HTTP slot free after {self.queue_timeout}s')
+        try:
+            return self.session.request(method, url, **kwargs), None
+        except (requests.ConnectionError, requests.Timeout) as e:
+            return None, e
+        finally:
+            self._slots.release()
+
+    def _retry_delay(self, attempt, response, error, idempotent):
+        if attempt >= self.max_retries:
+            return None
+        if error is not None:
+            # a failed connect never reached the server, so even a POST is safe to repeat
+            if idempotent or never_sent(error):
+                return self._backoff(attempt)
+            return None
+        if not (rate_limited(response) or (idempotent and response.status_code in RETRY_STATUSES)):
+            return None
+        wait = server_wait(response.headers)
+        if wait is None:
+            return self._backoff(attempt)
+        return wait if wait <= self.max_retry_wait else None
+
+    def _backoff(self, attempt):
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def close(self):
+        self.session.close()
+
+
+def init_app(app):
+    app.config.setdefault('HTTP_CONNECT_TIMEOUT', 3.05)
+    app.config.setdefault('HTTP_READ_TIMEOUT', 30)
+    app.config.setdefault('HTTP_MAX_RETRIES', 3)
+    app.config.setdefault('HTTP_BACKOFF', 0.5)
+    app.config.setdefault('HTTP_MAX_RETRY_WAIT', 60)
+    app.config.setdefault('HTTP_MAX_CONCURRENCY', 8)
+    app.config.setdefault('HTTP_QUEUE_TIMEOUT', 30)
+    app.extensions['http'] = None
+
+
+_client_lock = threading.Lock()
+
+
+def client(app=None):
+    """The app's shared ``HTTPClient``, built on first use."""
+    app = app or current_app
+    with _client_lock:
+        if app.extensions.get('http') is None:
+            app.extensions['http'] = HTTPClient(
+                connect_timeout=app.config['HTTP_CONNECT_TIMEOUT'],
+                read_timeout=app.config['HTTP_READ_TIMEOUT'],
+                max_retries=app.config['HTTP_MAX_RETRIES'],
+                backoff=app.config['HTTP_BACKOFF'],
+                max_retry_wait=app.config['HTTP_MAX_RETRY_WAIT'],
+                max_concurrency=app.config['HTTP_MAX_CONCURRENCY'],
+                queue_timeout=app.config['HTTP_QUEUE_TIMEOUT'],
+            )
+        return app.extensions['http']
+
+
+def after_fork(app):
+    """Drop a client inherited from the parent; its pooled sockets are shared."""
+    global _client_lock
+    _client_lock = threading.Lock()
+    app.extensions['http'] = None
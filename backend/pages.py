@@ -0,0 +1,89 @@
+"""Page URLs that comments are anchored to.
+
+Comments store a normalized ``page_url`` so the extension can fetch only the
+comments for the page a tab shows.  Normalization drops what does not change
+the page: the fragment, default ports, case of scheme and host, tracking
+parameters and query parameter order.
+"""
+import json
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from sqlalchemy import update
+from .changes import reserve
+from .db import db
+from .models import Comment
+
+MAX_URL_LENGTH = 2048
+TRACKING_PARAMS = {'fbclid', 'gclid', 'mc_cid', 'mc_eid'}
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_page_url(url):
+    if not url or not isinstance(url, str):
+        return None
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in ('http', 'https', 'file') or not (parts.hostname or scheme == 'file'):
+        return None
+    host = parts.hostname or ''
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{port}'
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not k.startswith('utm_') and k not in TRACKING_PARAMS)
+    normalized = urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+    return normalized[:MAX_URL_LENGTH]
+
+
+def page_url_from_metadata(meta):
+    """Page URL recorded in a comment's metadata (a dict or its JSON text)."""
+    if isinstance(meta, str):
+        try:
+            meta = json.loads(meta)
+        except ValueError:
+            return None
+    if not isinstance(meta, dict):
+        return None
+    return normalize_page_url(meta.get('url') or meta.get('href'))
+
+
+def backfill_page_urls(batch_size=1000):
+    """Fill ``page_url`` for comments saved before the column existed.
+
+    Returns the number of comments updated.  Rows without a usable URL in
+    their metadata are left ``NULL`` and are not revisited within one run.
+    Updated comments take new change sequence numbers, so delta sync picks
+    them up and url-filtered listing ETags change.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        rows = (db.session.query(Comment.id, Comment.cospace_id, Comment.meta)
+                .filter(Comment.id > last_id, Comment.page_url.is_(None), Comment.meta.isnot(None))
+                .order_by(Comment.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            return updated
+        last_id = rows[-1].id
+        by_cospace = {}
+        for r in rows:
+            url = page_url_from_metadata(r.meta)
+            if url:
+                by_cospace.setdefault(r.cospace_id, []).append({'id': r.id, 'page_url': url})
+        for cospace_id, changes in by_cospace.items():
+            first = reserve(db.session, cospace_id, len(changes))
+            for offset, change in enumerate(changes):
+                change['seq'] = first + offset
+            db.session.execute(update(Comment), changes)
+            updated += len(changes)
+        db.session.commit()
+
+
+def init_app(app):
+    @app.cli.command('backfill-page-urls')
+    def backfill_page_urls_command():
+        """Populate comment page URLs from their stored metadata."""
+        print(f'updated {backfill_page_urls()} comments')
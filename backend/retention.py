@@ -0,0 +1,190 @@
+"""Comment retention: keeps the hot ``comment`` table small.
+
+``flask --app backend.app archive-comments`` applies two policies:
+
+- a cospace with ``retention_days`` set has its live comments that were not
+  created or edited within that many days moved to ``comment_archive`` (or,
+  with ``--segments DIR``, to gzipped JSONL files in ``DIR``)
+- tombstones older than ``RETENTION_TOMBSTONE_DAYS`` are deleted outright.
+  The cospace remembers the highest purged ``seq`` in ``pruned_seq``; a delta
+  sync from before it can no longer learn of those deletions and has to
+  start over
+
+Comments move in batches of ``RETENTION_BATCH_SIZE``, one transaction each.
+Listings read through to the archive table on request (see
+``with_archived``); archived comments are read-only and not searchable.
+JSONL segments are cold storage and are not read back, so comments moved
+there stop counting towards the cospace counters (see counters.py).
+"""
+import heapq
+import os
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import case, delete, func, insert, literal, or_, select, text, update
+from sqlalchemy.types import DateTime
+from . import counters
+from .changes import reserve
+from .db import db
+from .models import CoSpace, Comment, CommentArchive, User
+
+# columns copied as they are from ``comment`` to ``comment_archive``
+ARCHIVE_COLUMNS = ('id', 'cospace_id', 'author_id', 'selector', 'text', 'metadata',
+                   'page_url', 'created_at', 'updated_at', 'seq')
+
+# the archive's ``COMMENT_COLUMNS``
+ARCHIVE_ROW_COLUMNS = (
+    CommentArchive.id,
+    User.username.label('author'),
+    CommentArchive.selector,
+    CommentArchive.page_url,
+    CommentArchive.text,
+    CommentArchive.created_at,
+    CommentArchive.updated_at,
+)
+
+
+def archive_query(cospace_id):
+    """Archived comments of a cospace as rows of ``ARCHIVE_ROW_COLUMNS``."""
+    return (select(*ARCHIVE_ROW_COLUMNS)
+            .outerjoin(User, CommentArchive.author_id == User.id)
+            .where(CommentArchive.cospace_id == cospace_id))
+
+
+def archived_rows(cospace_id, page_url=None, after_id=None, before_id=None, limit=100):
+    """One page of archived comments, ordered and bounded like a hot listing."""
+    q = archive_query(cospace_id)
+    if page_url:
+        q = q.where(or_(CommentArchive.page_url == page_url, CommentArchive.page_url.is_(None)))
+    if after_id is not None:
+        q = q.where(CommentArchive.id > after_id).order_by(CommentArchive.id.asc())
+    else:
+        if before_id:
+            q = q.where(CommentArchive.id < before_id)
+        q = q.order_by(CommentArchive.id.desc())
+    return db.session.execute(q.limit(limit)).all()
+
+
+def with_archived(rows, cospace_id, page_url=None, after_id=None, before_id=None, limit=100):
+    """Merge a page of hot rows with the matching archived rows.
+
+    An old comment edited recently stays hot while newer ones are archived,
+    so the two interleave by id and both sides are read for every page.
+    """
+    descending = after_id is None
+    archived = archived_rows(cospace_id, page_url, after_id, before_id, limit)
+    merged = heapq.merge(rows, archived, key=lambda r: r.id, reverse=descending)
+    return list(merged)[:limit]
+
+
+def _stale(cospace_id, cutoff):
+    return (select(Comment.id)
+            .where(Comment.cospace_id == cospace_id, Comment.deleted_at.is_(None),
+                   func.coalesce(Comment.updated_at, Comment.created_at) < cutoff)
+            .order_by(Comment.id))
+
+
+def _dump(row):
+    return {k: v.isoformat() if isinstance(v, datetime) else v for k, v in row._mapping.items()}
+
+
+def write_segment(directory, cospace_id, ids):
+    """Write the comments ``ids`` to a gzipped JSONL file; returns its path."""
+    import gzip
+    import json
+    columns = [Comment.__table__.c[name] for name in ARCHIVE_COLUMNS]
+    rows = db.session.execute(select(*columns).where(Comment.id.in_(ids)).order_by(Comment.id))
+    path = os.path.join(directory, f'cospace_{cospace_id}_{ids[0]}-{ids[-1]}.jsonl.gz')
+    # written aside and renamed so a crash never leaves a truncated segment
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(_dump(row)) + '\n')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def archive_cospace(cospace_id, cutoff, batch_size=1000, segment_dir=None, now=None):
+    """Move live comments of a cospace last changed before ``cutoff`` out of
+    ``comment``; returns how many were moved."""
+    now = now or datetime.utcnow()
+    columns = [Comment.__table__.c[name] for name in ARCHIVE_COLUMNS]
+    moved = 0
+    while True:
+        ids = db.session.scalars(_stale(cospace_id, cutoff).limit(batch_size)).all()
+        if not ids:
+            return moved
+        if segment_dir:
+            write_segment(segment_dir, cospace_id, ids)
+            # segments are outside the database, so they no longer count
+            counters.forget(db.session.connection(), cospace_id, ids)
+        else:
+            db.session.execute(insert(CommentArchive.__table__).from_select(
+                ARCHIVE_COLUMNS + ('archived_at',),
+                select(*columns, literal(now, DateTime)).where(Comment.id.in_(ids))))
+        db.session.execute(delete(Comment.__table__).where(Comment.id.in_(ids)))
+        # listings changed, so their ETags (built from change_seq) have to as well
+        reserve(db.session, cospace_id, 1)
+        db.session.commit()
+        moved += len(ids)
+
+
+def purge_tombstones(cutoff, cospace_id=None):
+    """Delete tombstones older than ``cutoff``; returns how many were deleted."""
+    q = (select(Comment.cospace_id, func.max(Comment.seq), func.count())
+         .where(Comment.deleted_at < cutoff)
+         .group_by(Comment.cospace_id))
+    if cospace_id is not None:
+        q = q.where(Comment.cospace_id == cospace_id)
+    purged = 0
+    for cospace, max_seq, count in db.session.execute(q).all():
+        db.session.execute(delete(Comment.__table__).where(
+            Comment.cospace_id == cospace, Comment.deleted_at < cutoff))
+        db.session.execute(update(CoSpace).where(CoSpace.id == cospace).values(
+            pruned_seq=case((CoSpace.pruned_seq < max_seq, max_seq), else_=CoSpace.pruned_seq)))
+        db.session.commit()
+        purged += count
+    return purged
+
+
+def apply_policies(config, cospace_id=None, segment_dir=None, now=None):
+    """Archive and purge according to each cospace's policy.
+
+    Returns ``{'archived': n, 'purged': n}``.
+    """
+    now = now or datetime.utcnow()
+    q = select(CoSpace.id, CoSpace.retention_days).where(CoSpace.retention_days.is_not(None))
+    if cospace_id is not None:
+        q = q.where(CoSpace.id == cospace_id)
+    archived = 0
+    for cospace, days in db.session.execute(q).all():
+        archived += archive_cospace(cospace, now - timedelta(days=days),
+                                    config['RETENTION_BATCH_SIZE'], segment_dir, now)
+    purged = purge_tombstones(now - timedelta(days=config['RETENTION_TOMBSTONE_DAYS']), cospace_id)
+    return {'archived': archived, 'purged': purged}
+
+
+def compact(engine):
+    """Give the space freed by archiving back to the file system (SQLite) or
+    refresh planner statistics (Postgres)."""
+    statement = 'VACUUM' if engine.dialect.name == 'sqlite' else 'VACUUM ANALYZE comment'
+    # VACUUM cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text(statement))
+
+
+def init_app(app):
+    app.config.setdefault('RETENTION_TOMBSTONE_DAYS', 30)
+    app.config.setdefault('RETENTION_BATCH_SIZE', 1000)
+
+    @app.cli.command('archive-comments')
+    @click.option('--cospace-id', type=int, help='Only apply the policy of this cospace.')
+    @click.option('--segments', type=click.Path(file_okay=False, writable=True),
+                  help='Write archived comments to gzipped JSONL files here instead of comment_archive.')
+    @click.option('--vacuum', is_flag=True, help='Compact the database afterwards.')
+    def archive_comments_command(cospace_id, segments, vacuum):
+        """Archive old comments and purge old tombstones."""
+        if segments:
+            os.makedirs(segments, exist_ok=True)
+        stats = apply_policies(app.config, cospace_id, segments)
+        print(f"archived {stats['archived']} comments, purged {stats['purged']} tombstones")
+        if vacuum:
+            compact(db.engine)
@@ -0,0 +1,47 @@
+"""Socket.IO room membership.
+
+Clients receive a cospace's comment events by joining its room,
+``cospace_<id>``.  Joining takes the same check as reading the cospace: the
+session user must hold a role in the owning team.
+"""
+from flask_socketio import join_room, leave_room
+from .authz import current_user, cospace_team_id, team_role
+from .socketio import socketio
+
+
+def room_for(cospace_id):
+    return f'cospace_{cospace_id}'
+
+
+def _cospace_id(data):
+    if isinstance(data, dict):
+        data = data.get('cospace_id')
+    try:
+        return int(data)
+    except (TypeError, ValueError):
+        return None
+
+
+@socketio.on('join_cospace')
+def join_cospace(data):
+    """Join a cospace room. Expects { cospace_id }; acks { ok } or { error }."""
+    user = current_user()
+    if not user:
+        return {'error': 'not authenticated'}
+    cospace_id = _cospace_id(data)
+    team_id = cospace_team_id(cospace_id) if cospace_id is not None else None
+    if team_id is None:
+        return {'error': 'cospace not found'}
+    if team_role(user.id, team_id) is None:
+        return {'error': 'not a team member'}
+    join_room(room_for(cospace_id))
+    return {'ok': True}
+
+
+@socketio.on('leave_cospace')
+def leave_cospace(data):
+    cospace_id = _cospace_id(data)
+    if cospace_id is None:
+        return {'error': 'cospace not found'}
+    leave_room(room_for(cospace_id))
+    return {'ok': True}
@@ -0,0 +1,162 @@
+"""Full-text search over comment text and selectors.
+
+Backends are chosen by ``SEARCH_BACKEND`` (``auto`` picks one from the
+database dialect):
+
+- ``sqlite``: an external-content FTS5 table, ``comment_fts``, kept in sync
+  with ``comment`` by triggers and ranked with bm25
+- ``postgres``: a GIN expression index over ``to_tsvector`` ranked with
+  ``ts_rank``
+- ``like``: unindexed ``LIKE`` matching for other databases
+
+Every backend yields rows of ``COMMENT_COLUMNS`` plus ``cospace_id`` and a
+``rank`` where lower is better, so results page with a (rank, id) cursor.
+"""
+import re
+from sqlalchemy import DDL, Index, and_, column, event, func, literal, literal_column, or_, table, text
+from .db import db
+from .models import Comment, User
+from .serializers import COMMENT_COLUMNS
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS comment_fts USING fts5(text, selector, content='comment', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_ai AFTER INSERT ON comment BEGIN
+        INSERT INTO comment_fts(rowid, text, selector) VALUES (new.id, new.text, new.selector);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_ad AFTER DELETE ON comment BEGIN
+        INSERT INTO comment_fts(comment_fts, rowid, text, selector) VALUES ('delete', old.id, old.text, old.selector);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_au AFTER UPDATE OF text, selector ON comment BEGIN
+        INSERT INTO comment_fts(comment_fts, rowid, text, selector) VALUES ('delete', old.id, old.text, old.selector);
+        INSERT INTO comment_fts(rowid, text, selector) VALUES (new.id, new.text, new.selector);
+    END""",
+]
+
+
+def terms(query):
+    return _TERM.findall(query or '')
+
+
+class SqliteBackend:
+    fts = table('comment_fts', column('rowid'))
+
+    def match(self, q, words):
+        # quote every term so user input is never parsed as FTS5 query syntax
+        match = ' '.join('"%s"' % w for w in words)
+        rank = literal_column('bm25(comment_fts)')
+        q = (q.add_columns(rank.label('rank'))
+             .select_from(self.fts)
+             .join(Comment, Comment.id == self.fts.c.rowid)
+             .filter(text('comment_fts MATCH :fts_match').bindparams(fts_match=match)))
+        return q, rank
+
+    def rebuild(self, session):
+        session.execute(text("INSERT INTO comment_fts(comment_fts) VALUES ('rebuild')"))
+
+
+class PostgresBackend:
+    document = func.to_tsvector('simple', func.coalesce(Comment.text, '') + ' ' + func.coalesce(Comment.selector, ''))
+
+    def match(self, q, words):
+        query = func.plainto_tsquery('simple', ' '.join(words))
+        rank = -func.ts_rank(self.document, query)
+        q = q.add_columns(rank.label('rank')).select_from(Comment).filter(self.document.op('@@')(query))
+        return q, rank
+
+    def rebuild(self, session):
+        pass
+
+
+class LikeBackend:
+    def match(self, q, words):
+        rank = literal(0.0)
+        conditions = [or_(Comment.text.ilike(f'%{w}%'), Comment.selector.ilike(f'%{w}%')) for w in words]
+        q = q.add_columns(rank.label('rank')).select_from(Comment).filter(and_(*conditions))
+        return q, rank
+
+    def rebuild(self, session):
+        pass
+
+
+BACKENDS = {
+    'sqlite': SqliteBackend,
+    'postgres': PostgresBackend,
+    'like': LikeBackend,
+}
+
+
+def backend_for(app):
+    name = app.config.get('SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        dialect = db.engine.dialect.name
+        name = {'sqlite': 'sqlite', 'postgresql': 'postgres'}.get(dialect, 'like')
+    return BACKENDS[name]()
+
+
+def search(app, words, scope, cursor=None, limit=50):
+    """Ranked page of comments matching all ``words`` inside ``scope``.
+
+    ``scope`` is a SQL condition on ``Comment.cospace_id``; ``cursor`` is the
+    opaque ``next_cursor`` returned with the previous page.
+    Returns ``(rows, next_cursor)``.
+    """
+    q = db.session.query(*COMMENT_COLUMNS, Comment.cospace_id)
+    q, rank = backend_for(app).match(q, words)
+    q = q.outerjoin(User, Comment.author_id == User.id).filter(scope, Comment.deleted_at.is_(None))
+    after = decode_cursor(cursor)
+    if after:
+        last_rank, last_id = after
+        q = q.filter(or_(rank > last_rank, and_(rank == last_rank, Comment.id > last_id)))
+    rows = q.order_by(rank, Comment.id).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def encode_cursor(row):
+    return f'{row.rank!r}:{row.id}'
+
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        rank, last_id = value.rsplit(':', 1)
+        return float(rank), int(last_id)
+    except ValueError:
+        return None
+
+
+def install(connection):
+    """Create the search index for the connection's dialect if it is missing."""
+    if connection.dialect.name == 'sqlite':
+        for statement in SQLITE_DDL:
+            connection.execute(DDL(statement))
+    elif connection.dialect.name == 'postgresql':
+        Index('ix_comment_fts', PostgresBackend.document, postgresql_using='gin').create(connection, checkfirst=True)
+
+
+def init_app(app):
+    app.config.setdefault('SEARCH_BACKEND', 'auto')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        """Create the full-text index if needed and reindex every comment."""
+        with db.engine.begin() as connection:
+            install(connection)
+        backend_for(app).rebuild(db.session)
+        db.session.commit()
+
+
+@event.listens_for(Comment.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    install(connection)
+
+
+@event.listens_for(Comment.__table__, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(DDL('DROP TABLE IF EXISTS comment_fts'))
@@ -0,0 +1,65 @@
+from .models import CoSpace, Comment, User
+
+# columns needed to serialize a comment; the author is resolved by a join
+# instead of lazy-loading one User per row
+COMMENT_COLUMNS = (
+    Comment.id,
+    User.username.label('author'),
+    Comment.selector,
+    Comment.page_url,
+    Comment.text,
+    Comment.created_at,
+    Comment.updated_at,
+)
+
+# denormalized counters shown with a cospace (see counters.py)
+COUNTER_COLUMNS = (CoSpace.comment_count, CoSpace.last_comment_id, CoSpace.last_comment_at)
+
+
+def comment_rows(query):
+    """Narrow a ``Comment`` query to plain tuples of ``COMMENT_COLUMNS``."""
+    return query.outerjoin(User, Comment.author_id == User.id).with_entities(*COMMENT_COLUMNS)
+
+
+def serialize_comment(row):
+    return {
+        'id': row.id,
+        'author': row.author,
+        'selector': row.selector,
+        'page_url': row.page_url,
+        'text': row.text,
+        'created_at': row.created_at.isoformat(),
+        'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+    }
+
+
+# ``format=compact`` listings send each comment as an array in this order
+COMMENT_FIELDS = ('id', 'author', 'selector', 'page_url', 'text', 'created_at', 'updated_at')
+
+
+def compact_comment(row):
+    return [
+        row.id,
+        row.author,
+        row.selector,
+        row.page_url,
+        row.text,
+        row.created_at.isoformat(),
+        row.updated_at.isoformat() if row.updated_at else None,
+    ]
+
+
+def serialize_change(row):
+    """Delta sync entry for a row of ``COMMENT_COLUMNS`` plus ``seq`` and
+    ``deleted_at``; deleted comments become bare tombstones."""
+    if row.deleted_at is not None:
+        return {'seq': row.seq, 'id': row.id, 'deleted': True}
+    return dict(serialize_comment(row), seq=row.seq)
+
+
+def serialize_counters(row):
+    return {
+        'comment_count': row.comment_count,
+        'last_comment_id': row.last_comment_id,
+        'last_comment_at': row.last_comment_at.isoformat() if row.last_comment_at else None,
+    }
@@ -1,4 +1,72 @@
+"""Shared Socket.IO server and its fan-out across worker processes.
+
+``SOCKETIO_MESSAGE_QUEUE`` selects how an emit reaches clients connected to
+other processes:
+
+- unset (default): a single process; emits only reach its own clients
+- ``redis://``, ``rediss://``, ``amqp://``, ``kafka://``: Flask-SocketIO's
+  message queue managers (install the matching client package)
+- ``local://<name>``: an in-process broker shared by every server configured
+  with the same URL; stands in for a real queue in tests
+"""
+import copy
+import threading
 from flask_socketio import SocketIO
+from socketio import Manager, PubSubManager
+from .notify import LocalBroker
 
 # shared SocketIO instance (initialized by app)
 socketio = SocketIO()
+
+_local_brokers = {}
+_local_lock = threading.Lock()
+
+
+def local_broker(url):
+    with _local_lock:
+        return _local_brokers.setdefault(url, LocalBroker())
+
+
+class LocalManager(PubSubManager):
+    """Client manager publishing through an in-process ``LocalBroker``.
+
+    The broker calls subscribers synchronously, so unlike the Redis or Kombu
+    managers this needs no listener thread.
+    """
+    name = 'local'
+
+    def __init__(self, broker, channel='flask-socketio', write_only=False):
+        super().__init__(channel=channel, write_only=write_only)
+        self.broker = broker
+
+    def initialize(self):
+        Manager.initialize(self)
+        if not self.write_only:
+            self.broker.subscribe(self.channel, self._deliver)
+
+    def _publish(self, data):
+        self.broker.publish(self.channel, data)
+
+    def _deliver(self, data):
+        # every subscriber gets the same object; handlers may modify it
+        data = copy.deepcopy(data)
+        if data.get('method') == 'callback':
+            self._handle_callback(data)
+        elif data.get('host_id') != self.host_id:
+            handler = getattr(self, '_handle_' + data.get('method', ''), None)
+            if handler is not None:
+                handler(data)
+
+
+def queue_options(url, write_only=False):
+    """``SocketIO.init_app`` options for a ``SOCKETIO_MESSAGE_QUEUE`` URL.
+
+    Always sets both ``message_queue`` and ``client_manager`` when it picks
+    the manager itself, because ``init_app`` keeps options from earlier calls
+    on the shared instance.
+    """
+    if not url:
+        return {'message_queue': None, 'client_manager': None}
+    if url.startswith('local://'):
+        return {'message_queue': None, 'client_manager': LocalManager(local_broker(url), write_only=write_only)}
+    return {'message_queue': url}
@@ -1,12 +1,28 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import pytest
+from sqlalchemy import event
+# the suite runs on plain threads; skip importing eventlet in every app
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'threading')
 from backend.app import create_app
 from backend.db import db as _db
+from backend.models import CoSpace, Team, TeamMember, User
+
+TeamIds = namedtuple('TeamIds', 'owner_id writer_id outsider_id team_id cos_id cos_ids')
 
 @pytest.fixture(scope='session')
 def app():
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        # broadcast every change as soon as it is committed
+        'SOCKETIO_COALESCE_MS': 0,
+    })
     with app.app_context():
         _db.create_all()
     yield app
@@ -22,3 +38,114 @@ def client(app):
 def session(app):
     with app.app_context():
         yield _db
+
+
+@pytest.fixture(scope='function')
+def count_queries(app):
+    """Context manager collecting the SQL statements executed inside it."""
+    @contextmanager
+    def counter():
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        with app.app_context():
+            engine = _db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+    return counter
+
+
+class GitHubStub(BaseHTTPRequestHandler):
+    """Local stand-in for the GitHub gists API."""
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'null')
+        self.server.calls.append({'method': self.command, 'path': self.path, 'headers': dict(self.headers), 'json': body})
+        with self.server.lock:
+            self.server.active += 1
+            self.server.peak = max(self.server.peak, self.server.active)
+            # entries are (status, payload) or (status, payload, headers)
+            reply = self.server.responses.pop(0) if self.server.responses else (201, {'id': 'gist1', 'html_url': 'http://gist.local/gist1'})
+        time.sleep(self.server.delay)
+        status, payload, headers = (reply + ({},))[:3]
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        with self.server.lock:
+            self.server.active -= 1
+
+    do_GET = do_POST = do_PATCH = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='function')
+def github_stub(app):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GitHubStub)
+    server.calls = []
+    server.responses = []
+    # seconds to stall before replying, and the most requests seen in flight at once
+    server.delay = 0
+    server.lock = threading.Lock()
+    server.active = server.peak = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    previous = app.config['GITHUB_API_URL']
+    app.config['GITHUB_API_URL'] = f'http://127.0.0.1:{server.server_port}'
+    yield server
+    app.config['GITHUB_API_URL'] = previous
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='function')
+def wait_for_job(client):
+    """Poll an export job until it leaves the pending/running states."""
+    def wait(job_id, timeout=5):
+        deadline = time.time() + timeout
+        while True:
+            job = client.get(f'/api/export/jobs/{job_id}').get_json()
+            if job['status'] not in ('pending', 'running') or time.time() > deadline:
+                return job
+            time.sleep(0.01)
+    return wait
+
+
+@pytest.fixture(scope='function')
+def login():
+    """Log a test client in as a user."""
+    def login(client, user_id):
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+    return login
+
+
+@pytest.fixture(scope='function')
+def make_team(app):
+    """Create a team named ``name`` with ``cospaces`` cospaces, owned by
+    ``<name>_owner`` with ``<name>_writer`` as a member, plus a user
+    ``<name>_outsider`` in no team; returns their ``TeamIds``."""
+    def make(name, cospaces=1):
+        with app.app_context():
+            owner = User(username=f'{name}_owner', github_id=f'{name}_o')
+            writer = User(username=f'{name}_writer', github_id=f'{name}_w')
+            outsider = User(username=f'{name}_outsider', github_id=f'{name}_x')
+            team = Team(name=name, owner=owner)
+            cos = [CoSpace(name=f'{name}_cos' + (f'{i}' if i else ''), team=team) for i in range(cospaces)]
+            _db.session.add_all([owner, writer, outsider, team, *cos,
+                                 TeamMember(team=team, user=owner, role='owner'),
+                                 TeamMember(team=team, user=writer, role='member')])
+            _db.session.commit()
+            cos_ids = [c.id for c in cos]
+            return TeamIds(owner.id, writer.id, outsider.id, team.id, cos_ids[0] if cos_ids else None, cos_ids)
+    return make
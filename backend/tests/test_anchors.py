@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+from backend.anchors import normalize_selector, record_report, selector_key
+from backend.db import db
+from backend.models import AnchorFailure, AnchorStatus
+
+PAGE = 'https://example.com/doc'
+
+
+def post(client, cos_id, selector, url=PAGE):
+    return client.post('/api/comments', json={'cospace_id': cos_id, 'selector': selector, 'text': 'x', 'url': url}).get_json()['id']
+
+
+def test_normalize_selector():
+    assert normalize_selector('  div>p  ') == normalize_selector('div  >\n p') == 'div > p'
+    assert normalize_selector('ul li+li~ a') == 'ul li + li ~ a'
+    assert normalize_selector('h1,h2 ,h3') == 'h1, h2, h3'
+    assert normalize_selector('a[title="x  > y"]:not(b>c)') == 'a[title="x  > y"]:not(b>c)'
+    assert normalize_selector('   ') is None and selector_key(None) is None
+    assert selector_key('div>p') == selector_key('div > p') != selector_key('div p')
+
+
+def test_page_comments_are_grouped_by_anchor(client, login, make_team):
+    _, writer_id, outsider_id, _, cos_id, _ = make_team('anchor_group')
+    login(client, writer_id)
+    first = post(client, cos_id, 'main>p:nth-of-type(2)')
+    span = post(client, cos_id, 'span#note')
+    second = post(client, cos_id, 'main > p:nth-of-type(2)')
+    page_level = post(client, cos_id, None)
+    post(client, cos_id, 'span#note', url='https://example.com/other')
+
+    res = client.get(f'/api/cospaces/{cos_id}/anchors?url={PAGE}#section')
+    anchors = res.get_json()['anchors']
+    assert [(a['selector'], a['count'], [c['id'] for c in a['comments']]) for a in anchors] == [
+        ('main > p:nth-of-type(2)', 2, [first, second]), ('span#note', 1, [span]), (None, 1, [page_level])]
+    assert anchors[0]['key'] == selector_key('main>p:nth-of-type(2)') and anchors[2]['key'] is None
+    assert client.get(f'/api/cospaces/{cos_id}/anchors?url={PAGE}',
+                      headers={'If-None-Match': res.headers['ETag']}).status_code == 304
+
+    # moving a comment to another element regroups it
+    client.put(f'/api/comments/{cos_id}/{second}', json={'selector': 'span#note'})
+    anchors = client.get(f'/api/cospaces/{cos_id}/anchors?url={PAGE}').get_json()['anchors']
+    assert [(a['selector'], a['count']) for a in anchors] == [
+        ('main > p:nth-of-type(2)', 1), ('span#note', 2), (None, 1)]
+
+    assert client.get(f'/api/cospaces/{cos_id}/anchors').status_code == 400
+    login(client, outsider_id)
+    assert client.get(f'/api/cospaces/{cos_id}/anchors?url={PAGE}').status_code == 403
+
+
+def test_unresolved_anchors_count_users_and_days(client, app, login, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('anchor_count')
+    login(client, writer_id)
+    post(client, cos_id, 'div>p.gone')
+    post(client, cos_id, 'h1')
+
+    def failures():
+        return [(a['selector'], a['failures']) for a in
+                client.get(f'/api/cospaces/{cos_id}/anchors/unresolved').get_json()['anchors']]
+
+    report = {'url': PAGE, 'resolved': ['h1'], 'unresolved': ['div > p.gone', 'never.commented']}
+    assert client.post(f'/api/cospaces/{cos_id}/anchors/report', json=report).get_json() == {'recorded': 2}
+    # the same user again on the same day adds nothing
+    client.post(f'/api/cospaces/{cos_id}/anchors/report', json=report)
+    client.post(f'/api/cospaces/{cos_id}/anchors/report', json=report)
+    assert failures() == [('div > p.gone', 1)]
+
+    login(client, owner_id)
+    client.post(f'/api/cospaces/{cos_id}/anchors/report', json=report)
+    assert failures() == [('div > p.gone', 2)]
+    with app.app_context():
+        tomorrow = datetime.utcnow() + timedelta(days=1)
+        record_report(cos_id, PAGE, owner_id, [], ['div>p.gone'], now=tomorrow)
+        db.session.commit()
+    assert failures() == [('div > p.gone', 3)]
+
+    # resolving it anywhere starts the count over
+    client.post(f'/api/cospaces/{cos_id}/anchors/report', json={'url': PAGE, 'resolved': ['div>p.gone']})
+    assert failures() == []
+    with app.app_context():
+        assert AnchorFailure.query.count() == 0
+
+
+def test_prune_flags_stale_anchors_and_keeps_comments(client, app, login, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('anchor_prune')
+    login(client, writer_id)
+    stale = [post(client, cos_id, 'div>p.gone'), post(client, cos_id, 'div > p.gone')]
+    gone = post(client, cos_id, 'span.deleted')
+    with app.app_context():
+        long_ago = datetime.utcnow() - timedelta(days=10)
+        for day in range(3):
+            record_report(cos_id, PAGE, writer_id, [], ['div>p.gone', 'span.deleted'],
+                          now=long_ago + timedelta(days=day))
+        db.session.commit()
+    client.delete(f'/api/comments/{cos_id}/{gone}')
+
+    prune = {'min_failures': 3, 'min_days': 7}
+    assert client.post(f'/api/cospaces/{cos_id}/anchors/prune', json=prune).status_code == 403
+    login(client, owner_id)
+    assert client.post(f'/api/cospaces/{cos_id}/anchors/prune', json={'min_days': 'soon'}).status_code == 400
+    assert client.post(f'/api/cospaces/{cos_id}/anchors/prune', json={'min_failures': 4}).get_json() == {'flagged': 0}
+    assert client.post(f'/api/cospaces/{cos_id}/anchors/prune', json=prune).get_json() == {'flagged': 1}
+    assert client.post(f'/api/cospaces/{cos_id}/anchors/prune', json=prune).get_json() == {'flagged': 0}
+
+    flagged = client.get(f'/api/cospaces/{cos_id}/anchors/unresolved?flagged=1').get_json()['anchors']
+    assert [(a['selector'], a['count']) for a in flagged] == [('div > p.gone', 2)] and flagged[0]['flagged_at']
+    anchors = client.get(f'/api/cospaces/{cos_id}/anchors?url={PAGE}').get_json()['anchors']
+    assert [c['id'] for a in anchors for c in a['comments']] == stale
+    with app.app_context():
+        # the anchor of the deleted comment is forgotten
+        assert AnchorStatus.query.filter_by(cospace_id=cos_id).count() == 1
@@ -0,0 +1,61 @@
+import time
+import pytest
+from backend.authz import TTLCache
+
+
+@pytest.fixture
+def process_cache(app):
+    previous = app.extensions['authz_cache']
+    app.extensions['authz_cache'] = TTLCache(maxsize=100, ttl=60)
+    yield app.extensions['authz_cache']
+    app.extensions['authz_cache'] = previous
+
+
+def test_ttl_cache_expires_and_bounds_size():
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('c', 3)
+    assert cache.get('a') is None and len(cache) == 2
+    assert cache.get('c') == 3
+    time.sleep(0.06)
+    assert cache.get('c') is None
+
+
+def test_warm_comment_post_only_writes(client, count_queries, process_cache, login, make_team):
+    owner_id, writer_id, _, team_id, cos_id, _ = make_team('authz_post')
+    login(client, writer_id)
+    assert client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'first'}).status_code == 200
+    with count_queries() as statements:
+        res = client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'second'})
+    assert res.status_code == 200
+    # reserve the change sequence number, insert, then bump the counters
+    assert [s.split(' SET')[0].split(' (')[0] for s in statements] == [
+        'UPDATE co_space', 'INSERT INTO comment', 'UPDATE co_space', 'UPDATE co_space_author']
+
+
+def test_role_checks_query_once_per_request(client, count_queries, login, make_team):
+    owner_id, writer_id, _, team_id, cos_id, _ = make_team('authz_req')
+    login(client, owner_id)
+    with count_queries() as statements:
+        res = client.post(f'/api/teams/{team_id}/members', json={'github_username': 'authz_req_writer'})
+    assert res.status_code == 400
+    # user, team, caller role, target user, target role
+    assert len(statements) == 5
+
+
+def test_role_change_and_removal_invalidate_cache(client, app, process_cache, login, make_team):
+    owner_id, writer_id, _, team_id, cos_id, _ = make_team('authz_inv')
+    writer = app.test_client()
+    login(writer, writer_id)
+    login(client, owner_id)
+    assert writer.post('/api/comments', json={'cospace_id': cos_id, 'text': 'ok'}).status_code == 200
+
+    assert client.put(f'/api/teams/{team_id}/members/{writer_id}', json={'role': 'viewer'}).status_code == 200
+    assert writer.post('/api/comments', json={'cospace_id': cos_id, 'text': 'no'}).status_code == 403
+
+    assert client.put(f'/api/teams/{team_id}/members/{writer_id}', json={'role': 'member'}).status_code == 200
+    assert writer.post('/api/comments', json={'cospace_id': cos_id, 'text': 'ok'}).status_code == 200
+
+    assert client.delete(f'/api/teams/{team_id}/members/{writer_id}').status_code == 200
+    assert writer.post('/api/comments', json={'cospace_id': cos_id, 'text': 'no'}).status_code == 403
@@ -0,0 +1,50 @@
+from sqlalchemy.sql.compiler import InsertmanyvaluesSentinelOpts
+from backend.db import db
+from backend.models import Comment
+from backend.socketio import socketio
+
+
+def test_batch_inserts_in_one_transaction_and_emits_once_per_room(client, app, count_queries, monkeypatch, login, make_team):
+    team = make_team('batch', cospaces=2)
+    cos_a, cos_b = team.cos_ids
+    foreign = make_team('batch_foreign').cos_id
+    login(client, team.writer_id)
+    emitted = []
+    monkeypatch.setattr(socketio, 'emit', lambda event, data, room=None, **kwargs: emitted.append((event, room, data)))
+    items = ([{'cospace_id': cos_a, 'text': f'a{i}'} for i in range(20)]
+             + [{'cospace_id': foreign, 'text': 'nope'}, {'cospace_id': 999999, 'text': 'gone'}, 'junk']
+             + [{'cospace_id': cos_b, 'text': 'b0'}])
+    with count_queries() as statements:
+        res = client.post('/api/comments/batch', json={'comments': items})
+    assert res.status_code == 200
+    results = res.get_json()['results']
+    assert len(results) == len(items)
+    assert all('id' in r for r in results[:20]) and 'id' in results[-1]
+    assert [r.get('status') for r in results[20:23]] == [403, 404, 400]
+    # user, then one team lookup and one role check per distinct cospace
+    reads = [s for s in statements if s.startswith('SELECT')]
+    assert len(reads) == 1 + 2 * 3
+    # one change sequence reservation and one counter update per cospace written to
+    assert len([s for s in statements if s.startswith('UPDATE co_space ')]) == 4
+    # the accepted rows go out in a single flush as one multi-row INSERT .. RETURNING
+    # where the dialect can hand the new ids back in row order; SQLite cannot for an
+    # autoincrement key, so SQLAlchemy issues one statement per row in that transaction
+    with app.app_context():
+        dialect = db.engine.dialect
+    batched = (dialect.insert_executemany_returning_sort_by_parameter_order
+               and dialect.insertmanyvalues_implicit_sentinel & InsertmanyvaluesSentinelOpts.ANY_AUTOINCREMENT)
+    assert len([s for s in statements if s.startswith('INSERT INTO comment ')]) == (1 if batched else 21)
+    assert sorted((e, r, len(d['comments'])) for e, r, d in emitted) == [
+        ('comment_changes', f'cospace_{cos_a}', 20), ('comment_changes', f'cospace_{cos_b}', 1)]
+    with app.app_context():
+        assert Comment.query.filter_by(cospace_id=cos_a).count() == 20
+        assert Comment.query.filter_by(cospace_id=foreign).count() == 0
+
+
+def test_batch_rejects_empty_and_oversized_requests(client, login, make_team):
+    team = make_team('batch_limits')
+    cos_a = team.cos_id
+    login(client, team.writer_id)
+    assert client.post('/api/comments/batch', json={'comments': []}).status_code == 400
+    too_many = [{'cospace_id': cos_a, 'text': 'x'}] * 501
+    assert client.post('/api/comments/batch', json={'comments': too_many}).status_code == 400
@@ -0,0 +1,21 @@
+import json
+from backend import bench
+
+
+def test_bench_smoke_run_reports_every_scenario(tmp_path):
+    out = tmp_path / 'bench.json'
+    bench.main(['--users', '3', '--teams', '2', '--cospaces', '3', '--comments', '120',
+                '--page-size', '50', '--posts', '10', '--longpolls', '4', '--concurrency', '2',
+                '--out', str(out)])
+    report = json.loads(out.read_text())
+    assert set(report['scenarios']) == {'listing', 'post_burst', 'longpoll'}
+    for metrics in report['scenarios'].values():
+        assert metrics['errors'] == 0
+        assert {'throughput_rps', 'p50_ms', 'p99_ms', 'queries'} <= set(metrics)
+    assert report['scenarios']['listing']['requests'] == 2
+    # parked long-polls must not touch the database
+    assert report['scenarios']['longpoll']['idle_queries'] == 0
+    assert report['peak_rss_kb'] > 0
+
+    diff = bench.compare(report, report)
+    assert diff['listing']['queries'] == 0
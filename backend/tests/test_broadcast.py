@@ -0,0 +1,83 @@
+import time
+from types import SimpleNamespace
+import pytest
+from backend.broadcast import Broadcaster, encode_frame
+from backend.socketio import socketio
+
+
+class FakeQueue:
+    def __init__(self, size):
+        self.size = size
+
+    def qsize(self):
+        return self.size
+
+
+class FakeSocket:
+    def __init__(self, backlog):
+        self.queue = FakeQueue(backlog)
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    # only record the rooms used here: timers of other tests' apps may still fire
+    frames = []
+
+    def emit(event, data, room=None, to=None, skip_sid=None):
+        if (room or to).startswith(('cospace_90', 'sid-')):
+            frames.append((event, room or to, data, skip_sid))
+    monkeypatch.setattr(socketio, 'emit', emit)
+    return frames
+
+
+def change(id, seq, text='t'):
+    return {'id': id, 'seq': seq, 'author': 'a', 'selector': None, 'page_url': None, 'text': text,
+            'created_at': '2024-01-01T00:00:00', 'updated_at': None, 'cospace_id': 1}
+
+
+def test_encode_frame_is_positional():
+    frame = encode_frame(7, [change(1, 3, 'x'), {'id': 2, 'seq': 4, 'deleted': True}])
+    assert frame == {'cospace_id': 7, 'seq': 4, 'deleted': [[2, 4]],
+                     'comments': [[1, 3, 'a', None, None, 'x', '2024-01-01T00:00:00', None]]}
+
+
+def test_changes_inside_the_window_share_one_frame(emitted):
+    broadcaster = Broadcaster(window=0.05)
+    broadcaster.send(9001, [change(1, 1, 'first')])
+    broadcaster.send(9001, [change(2, 2)])
+    broadcaster.send(9001, [change(1, 3, 'edited')])
+    broadcaster.send(9001, [{'id': 2, 'seq': 4, 'deleted': True}])
+    broadcaster.send(9002, [change(5, 1)])
+    assert emitted == []
+    time.sleep(0.2)
+    frames = {room: data for event, room, data, _ in emitted}
+    assert len(emitted) == 2 and {e[0] for e in emitted} == {'comment_changes'}
+    assert [c[:2] + [c[5]] for c in frames['cospace_9001']['comments']] == [[1, 3, 'edited']]
+    assert frames['cospace_9001']['deleted'] == [[2, 4]] and frames['cospace_9001']['seq'] == 4
+
+
+def test_full_batch_flushes_early(emitted):
+    broadcaster = Broadcaster(window=10, max_batch=3)
+    broadcaster.send(9001, [change(i, i) for i in range(1, 4)])
+    assert len(emitted) == 1 and len(emitted[0][2]['comments']) == 3
+
+
+def test_slow_clients_are_skipped_and_told_to_resync(emitted, monkeypatch):
+    sockets = {'eio-fast': FakeSocket(0), 'eio-slow': FakeSocket(500)}
+    participants = [('sid-fast', 'eio-fast'), ('sid-slow', 'eio-slow')]
+    server = SimpleNamespace(manager=SimpleNamespace(get_participants=lambda ns, room: iter(participants)),
+                             eio=SimpleNamespace(sockets=sockets))
+    monkeypatch.setattr(socketio, 'server', server)
+    broadcaster = Broadcaster(window=0, max_client_queue=100)
+    broadcaster.send(9001, [change(1, 1)])
+    broadcaster.send(9001, [change(2, 2)])
+    assert [(e[0], e[1], e[3]) for e in emitted] == [
+        ('comment_changes', 'cospace_9001', ['sid-slow']),
+        ('resync', 'sid-slow', None),
+        ('comment_changes', 'cospace_9001', ['sid-slow']),
+    ]
+    assert emitted[1][2] == {'cospace_id': 9001, 'seq': 1}
+
+    sockets['eio-slow'].queue.size = 0
+    broadcaster.send(9001, [change(3, 3)])
+    assert emitted[-1][3] is None
@@ -0,0 +1,71 @@
+import threading
+import time
+from sqlalchemy import insert
+from backend.changes import backfill_seqs
+from backend.db import db
+from backend.models import CoSpace, Comment
+
+
+def test_changes_cover_inserts_edits_and_deletes(client, login, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('changes_ops')
+    login(client, writer_id)
+    ids = [client.post('/api/comments', json={'cospace_id': cos_id, 'text': t}).get_json()['id'] for t in 'abc']
+
+    full = client.get(f'/api/cospaces/{cos_id}/changes').get_json()
+    assert [(c['id'], c['seq']) for c in full['changes']] == [(ids[0], 1), (ids[1], 2), (ids[2], 3)]
+    assert full['seq'] == 3 and not full['has_more']
+
+    assert client.put(f'/api/comments/{cos_id}/{ids[0]}', json={'text': 'a2'}).get_json()['seq'] == 4
+    login(client, owner_id)
+    assert client.put(f'/api/comments/{cos_id}/{ids[1]}', json={'text': 'hijack'}).status_code == 403
+    assert client.delete(f'/api/comments/{cos_id}/{ids[1]}').get_json()['seq'] == 5
+
+    delta = client.get(f'/api/cospaces/{cos_id}/changes?since_seq=3').get_json()
+    assert delta['changes'][0]['text'] == 'a2' and delta['changes'][0]['updated_at']
+    assert delta['changes'][1] == {'seq': 5, 'id': ids[1], 'deleted': True}
+    assert delta['seq'] == 5
+
+    listing = client.get(f'/api/comments/{cos_id}').get_json()
+    assert [c['text'] for c in listing['comments']] == ['c', 'a2']
+    assert client.delete(f'/api/comments/{cos_id}/{ids[1]}').status_code == 404
+
+
+def test_changes_page_and_require_membership(client, login, make_team):
+    owner_id, writer_id, outsider_id, _, cos_id, _ = make_team('changes_page')
+    login(client, writer_id)
+    client.post('/api/comments/batch', json={'comments': [{'cospace_id': cos_id, 'text': str(i)} for i in range(5)]})
+    first = client.get(f'/api/cospaces/{cos_id}/changes?limit=3').get_json()
+    assert [c['text'] for c in first['changes']] == ['0', '1', '2'] and first['has_more']
+    rest = client.get(f"/api/cospaces/{cos_id}/changes?limit=3&since_seq={first['seq']}").get_json()
+    assert [c['text'] for c in rest['changes']] == ['3', '4'] and not rest['has_more']
+
+    login(client, outsider_id)
+    assert client.get(f'/api/cospaces/{cos_id}/changes').status_code == 403
+
+
+def test_changes_long_poll_wakes_on_edit(client, app, login, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('changes_wait')
+    login(client, writer_id)
+    comment_id = client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'x'}).get_json()['id']
+    editor = app.test_client()
+    login(editor, writer_id)
+
+    def edit_later():
+        time.sleep(0.2)
+        editor.put(f'/api/comments/{cos_id}/{comment_id}', json={'text': 'y'})
+
+    threading.Thread(target=edit_later, daemon=True).start()
+    start = time.time()
+    res = client.get(f'/api/cospaces/{cos_id}/changes?since_seq=1&timeout=5').get_json()
+    assert time.time() - start < 4
+    assert [c['text'] for c in res['changes']] == ['y']
+
+
+def test_backfill_numbers_legacy_comments(app, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('changes_backfill')
+    with app.app_context():
+        db.session.execute(insert(Comment), [{'cospace_id': cos_id, 'text': t} for t in ('old1', 'old2')])
+        db.session.commit()
+        backfill_seqs()
+        assert [c.seq for c in Comment.query.filter_by(cospace_id=cos_id).order_by(Comment.id)] == [1, 2]
+        assert db.session.get(CoSpace, cos_id).change_seq == 2
@@ -0,0 +1,98 @@
+import json
+from sqlalchemy import text
+from backend.db import db
+from backend.models import User, Team, CoSpace, Comment
+
+
+def make_cospace(app, name, n_comments):
+    with app.app_context():
+        user = User(username=f'{name}_user', github_id=f'{name}_gh')
+        team = Team(name=f'{name}_team', owner=user)
+        cos = CoSpace(name=name, team=team)
+        db.session.add_all([user, team, cos])
+        db.session.add_all([Comment(cospace=cos, author=user, selector='body', text=f'c{i}') for i in range(n_comments)])
+        db.session.commit()
+        return cos.id, user.id
+
+
+def test_comments_paginate_backwards_from_newest(client, app, login):
+    cos_id, user_id = make_cospace(app, 'page_desc', 5)
+    login(client, user_id)
+    res = client.get(f'/api/comments/{cos_id}?limit=2')
+    page = res.get_json()
+    assert [c['text'] for c in page['comments']] == ['c4', 'c3']
+    seen = [c['text'] for c in page['comments']]
+    while page['next_cursor']:
+        page = client.get(f"/api/comments/{cos_id}?limit=2&before_id={page['next_cursor']}").get_json()
+        seen += [c['text'] for c in page['comments']]
+    assert seen == ['c4', 'c3', 'c2', 'c1', 'c0']
+
+
+def test_comments_paginate_forwards_after_id(client, app, login):
+    cos_id, user_id = make_cospace(app, 'page_asc', 3)
+    login(client, user_id)
+    first = client.get(f'/api/comments/{cos_id}?after_id=0&limit=100').get_json()
+    ids = [c['id'] for c in first['comments']]
+    page = client.get(f'/api/comments/{cos_id}?after_id={ids[0]}&limit=1').get_json()
+    assert [c['id'] for c in page['comments']] == [ids[1]]
+    assert page['next_cursor'] == ids[1]
+    # since_id is still accepted as an alias for after_id
+    page = client.get(f'/api/comments/{cos_id}?since_id={ids[1]}').get_json()
+    assert [c['id'] for c in page['comments']] == [ids[2]]
+    assert page['next_cursor'] is None
+
+
+def test_comments_need_a_team_member(client, login, make_team):
+    team = make_team('page_auth')
+    url = f'/api/comments/{team.cos_id}?archived=1'
+    assert client.get(url).status_code == 401
+    login(client, team.outsider_id)
+    assert client.get(url).status_code == 403
+    assert client.get('/api/comments/999999').status_code == 404
+    login(client, team.writer_id)
+    assert client.get(url).status_code == 200
+
+
+def test_comment_scans_use_cospace_id_index(app):
+    with app.app_context():
+        plan = db.session.execute(text(
+            'EXPLAIN QUERY PLAN SELECT id FROM comment WHERE cospace_id = 1 AND id > 5 ORDER BY id LIMIT 10'
+        )).fetchall()
+    assert any('ix_comment_cospace_id_id' in row[-1] for row in plan)
+
+
+def make_busy_cospace(app, name, n_authors):
+    with app.app_context():
+        authors = [User(username=f'{name}_a{i}', github_id=f'{name}_g{i}') for i in range(n_authors)]
+        team = Team(name=f'{name}_team', owner=authors[0])
+        cos = CoSpace(name=name, team=team)
+        db.session.add_all(authors + [team, cos])
+        db.session.add_all([Comment(cospace=cos, author=a, selector='body', text=a.username) for a in authors])
+        db.session.commit()
+        return cos.id, authors[0].id
+
+
+def test_listing_endpoints_load_authors_in_constant_queries(client, app, count_queries, github_stub, wait_for_job):
+    cos_id, user_id = make_busy_cospace(app, 'n_plus_one', 20)
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    with count_queries() as statements:
+        page = client.get(f'/api/comments/{cos_id}').get_json()
+    assert {c['author'] for c in page['comments']} == {f'n_plus_one_a{i}' for i in range(20)}
+    # user, cospace team and role lookups + ETag validator + comment rows
+    assert len(statements) == 5
+
+    with count_queries() as statements:
+        batch = client.get(f'/api/comments/longpoll/{cos_id}?since_id=0&timeout=1').get_json()
+    assert len(batch) == 20 and all(c['author'] for c in batch)
+    assert len(statements) == 4
+
+    with count_queries() as statements:
+        res = client.post('/api/export/github', json={'cospace_id': cos_id, 'github_token': 't'})
+        wait_for_job(res.get_json()['job_id'])
+    exported = json.loads(next(iter(github_stub.calls[0]['json']['files'].values()))['content'])
+    assert len(exported) == 20 and all(c['author'] for c in exported)
+    # user, cospace, cospace team and role lookups + one page of comment rows and archived rows,
+    # independent of the number of authors
+    assert len(statements) == 6
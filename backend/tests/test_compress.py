@@ -0,0 +1,100 @@
+import gzip
+import json
+import pytest
+from backend.app import create_app
+from backend.compress import choose_encoding
+from backend.jsonprovider import OrjsonProvider
+from backend.serializers import COMMENT_FIELDS
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+
+
+@pytest.fixture
+def make_cospace(app, login, make_team):
+    """A cospace with ``comments`` comments posted by its owner."""
+    def make(name, comments):
+        team = make_team(name)
+        client = app.test_client()
+        login(client, team.owner_id)
+        for i in range(comments):
+            client.post('/api/comments', json={'cospace_id': team.cos_id, 'selector': f'p:nth-child({i})',
+                                               'text': f'comment {i} ünïcode', 'url': 'https://example.com/a'})
+        return team.owner_id, team.cos_id
+    return make
+
+
+def test_choose_encoding():
+    def choose(header, brotli_available=True):
+        return choose_encoding(parse_accept_header(header, Accept), brotli_available)
+
+    assert choose('gzip, br') == 'br'
+    assert choose('gzip, br;q=0.1') == 'gzip'
+    assert choose('br;q=0.9, gzip;q=0.5') == 'br'
+    assert choose('gzip, br', brotli_available=False) == 'gzip'
+    assert choose('br', brotli_available=False) is None
+    assert choose('*') == 'br'
+    assert choose('gzip;q=0, br;q=0') is None
+    assert choose('identity') is None
+
+
+def test_large_listing_is_gzipped_with_weak_etag(client, login, make_cospace):
+    user_id, cos_id = make_cospace('compress_big', 20)
+    login(client, user_id)
+    url = f'/api/comments/{cos_id}'
+
+    plain = client.get(url)
+    assert 'Content-Encoding' not in plain.headers and 'Accept-Encoding' in plain.headers['Vary']
+
+    res = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(res.data)) == plain.get_json()
+    assert len(res.data) < len(plain.data)
+    assert res.headers['ETag'] == 'W/' + plain.headers['ETag']
+
+    # either validator revalidates either representation
+    for etag in (res.headers['ETag'], plain.headers['ETag']):
+        again = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        assert again.status_code == 304 and not again.data
+
+
+def test_small_responses_are_not_compressed(client, login, make_cospace):
+    user_id, cos_id = make_cospace('compress_small', 1)
+    login(client, user_id)
+    res = client.get(f'/api/comments/{cos_id}', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in res.headers and res.get_json()['comments']
+
+
+def test_brotli_when_available(client, login, make_cospace):
+    brotli = pytest.importorskip('brotli')
+    user_id, cos_id = make_cospace('compress_br', 20)
+    login(client, user_id)
+    res = client.get(f'/api/comments/{cos_id}', headers={'Accept-Encoding': 'gzip, br'})
+    assert res.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(res.data))['comments']
+
+
+def test_compact_format(client, login, make_cospace):
+    user_id, cos_id = make_cospace('compress_compact', 3)
+    login(client, user_id)
+    full = client.get(f'/api/comments/{cos_id}').get_json()
+    compact = client.get(f'/api/comments/{cos_id}?format=compact').get_json()
+    assert compact['fields'] == list(COMMENT_FIELDS)
+    assert compact['next_cursor'] == full['next_cursor']
+    assert [dict(zip(compact['fields'], row)) for row in compact['comments']] == [
+        {f: c[f] for f in COMMENT_FIELDS} for c in full['comments']]
+
+    poll = client.get(f'/api/comments/longpoll/{cos_id}?format=compact&timeout=0').get_json()
+    # the listing is newest first, the long-poll oldest first
+    assert poll['fields'] == list(COMMENT_FIELDS) and poll['comments'] == compact['comments'][::-1]
+
+
+def test_orjson_provider(app):
+    pytest.importorskip('orjson')
+    assert isinstance(app.json, OrjsonProvider)
+    with app.test_request_context():
+        res = app.json.response({'b': 1, 'a': 'ü'})
+    assert res.data == '{"a":"ü","b":1}\n'.encode()
+    assert app.json.loads(b'{"x": [1, 2]}') == {'x': [1, 2]}
+
+    fallback = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'JSON_ENCODER': 'default'})
+    assert not isinstance(fallback.json, OrjsonProvider)
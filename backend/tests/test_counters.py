@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from backend.counters import recount
+from backend.db import db
+from backend.models import CoSpace, CoSpaceAuthor, Comment
+from backend.retention import apply_policies
+
+
+def counters(app, cos_id):
+    with app.app_context():
+        cos = db.session.get(CoSpace, cos_id)
+        authors = db.session.execute(select(CoSpaceAuthor.author_id, CoSpaceAuthor.comment_count)
+                                     .where(CoSpaceAuthor.cospace_id == cos_id)
+                                     .order_by(CoSpaceAuthor.author_id)).all()
+        return cos.comment_count, cos.last_comment_id, [tuple(a) for a in authors]
+
+
+def test_counters_follow_posts_and_deletes(client, app, login, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('count_ops')
+    login(client, writer_id)
+    first = client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'one'}).get_json()['id']
+    batch = client.post('/api/comments/batch', json={'comments': [{'cospace_id': cos_id, 'text': t} for t in 'ab']})
+    ids = [first] + [r['id'] for r in batch.get_json()['results']]
+    login(client, owner_id)
+    client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'mine'})
+    assert counters(app, cos_id)[0] == 4
+
+    # deleting the newest comment moves last_comment back
+    last = client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'oops'}).get_json()['id']
+    client.delete(f'/api/comments/{cos_id}/{last}')
+    login(client, writer_id)
+    client.delete(f'/api/comments/{cos_id}/{ids[0]}')
+    client.put(f'/api/comments/{cos_id}/{ids[1]}', json={'text': 'edited'})
+    count, last_id, authors = counters(app, cos_id)
+    assert count == 3 and last_id == last - 1
+    assert authors == [(owner_id, 1), (writer_id, 2)]
+
+    with app.app_context():
+        recount(db.session.connection(), cos_id)
+        db.session.commit()
+    assert counters(app, cos_id) == (count, last_id, authors)
+
+
+def test_archived_comments_still_count(client, app, login, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('count_archive')
+    login(client, writer_id)
+    client.post('/api/comments/batch', json={'comments': [{'cospace_id': cos_id, 'text': t} for t in 'abc']})
+    before = counters(app, cos_id)
+    with app.app_context():
+        db.session.execute(update(Comment).where(Comment.cospace_id == cos_id)
+                           .values(created_at=datetime.utcnow() - timedelta(days=9)))
+        db.session.get(CoSpace, cos_id).retention_days = 1
+        db.session.commit()
+        assert apply_policies(app.config, cospace_id=cos_id)['archived'] == 3
+        recount(db.session.connection(), cos_id)
+        db.session.commit()
+    assert counters(app, cos_id) == before == (3, before[1], [(writer_id, 3)])
+
+
+def test_segment_archives_stop_counting(client, app, tmp_path, login, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('count_segments')
+    login(client, writer_id)
+    client.post('/api/comments/batch', json={'comments': [{'cospace_id': cos_id, 'text': t} for t in 'ab']})
+    login(client, owner_id)
+    kept = client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'kept'}).get_json()['id']
+    newest = client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'newest'}).get_json()['id']
+    with app.app_context():
+        db.session.execute(update(Comment).where(Comment.cospace_id == cos_id, Comment.id != kept)
+                           .values(created_at=datetime.utcnow() - timedelta(days=9)))
+        db.session.get(CoSpace, cos_id).retention_days = 1
+        db.session.commit()
+        assert apply_policies(app.config, cospace_id=cos_id, segment_dir=str(tmp_path))['archived'] == 3
+    # the writer's comments and the newest one went to segment files
+    assert counters(app, cos_id) == (1, kept, [(owner_id, 1)])
+    with app.app_context():
+        recount(db.session.connection(), cos_id)
+        db.session.commit()
+    assert counters(app, cos_id) == (1, kept, [(owner_id, 1)])
+    assert newest > kept
+
+
+def test_summary_and_listing_show_counters(client, count_queries, login, make_team):
+    owner_id, writer_id, outsider_id, _, cos_id, (_, empty_id) = make_team('count_summary', cospaces=2)
+    login(client, writer_id)
+    client.post('/api/comments/batch', json={'comments': [{'cospace_id': cos_id, 'text': t} for t in 'ab']})
+    login(client, owner_id)
+    last = client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'c'}).get_json()['id']
+
+    with count_queries() as statements:
+        summary = client.get(f'/api/cospaces/{cos_id}/summary').get_json()
+    assert len(statements) <= 4
+    assert summary['comment_count'] == 3 and summary['last_comment_id'] == last and summary['last_comment_at']
+    assert summary['authors'] == [{'author': 'count_summary_writer', 'comment_count': 2},
+                                  {'author': 'count_summary_owner', 'comment_count': 1}]
+
+    listing = client.get('/api/cospaces?limit=500').get_json()['cospaces']
+    (entry,) = [c for c in listing if c['id'] == cos_id]
+    assert entry['comment_count'] == 3 and entry['last_comment_id'] == last
+
+    assert client.get(f'/api/cospaces/{empty_id}/summary').get_json()['authors'] == []
+
+    login(client, outsider_id)
+    assert client.get(f'/api/cospaces/{cos_id}/summary').status_code == 403
@@ -0,0 +1,52 @@
+import threading
+from sqlalchemy import text
+from backend.app import create_app
+from backend.db import database_url, db, engine_options
+from backend.migrations import upgrade
+from backend.models import User, Team, CoSpace, TeamMember
+
+
+def test_engine_options():
+    config = {'DB_POOL_SIZE': 4, 'DB_MAX_OVERFLOW': 2, 'DB_POOL_TIMEOUT': 5, 'DB_POOL_RECYCLE': 60}
+    pg = engine_options(dict(config, SQLALCHEMY_DATABASE_URI='postgresql://u@db/codocs',
+                             SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 8}))
+    assert pg == {'pool_size': 8, 'max_overflow': 2, 'pool_timeout': 5, 'pool_recycle': 60, 'pool_pre_ping': True}
+    assert engine_options(dict(config, SQLALCHEMY_DATABASE_URI='sqlite:///x.db')) == {}
+    assert database_url('postgres://u@db/codocs') == 'postgresql://u@db/codocs'
+    assert database_url('sqlite:///x.db') == 'sqlite:///x.db'
+
+
+def test_sqlite_file_uses_wal_and_concurrent_writers_queue(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'wal.db'}",
+                      'SOCKETIO_COALESCE_MS': 0})
+    with app.app_context():
+        with db.engine.begin() as conn:
+            upgrade(conn)
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert db.session.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+        users = [User(username=f'wal{i}') for i in range(8)]
+        team = Team(name='wal', owner=users[0])
+        cos = CoSpace(name='wal', team=team)
+        db.session.add_all(users + [team, cos] + [TeamMember(team=team, user=u, role='member') for u in users])
+        db.session.commit()
+        user_ids, cos_id = [u.id for u in users], cos.id
+
+    statuses = []
+
+    def post(user_id):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        for i in range(10):
+            statuses.append(client.post('/api/comments', json={'cospace_id': cos_id, 'text': str(i)}).status_code)
+
+    threads = [threading.Thread(target=post, args=(uid,)) for uid in user_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+    assert statuses == [200] * 80
+    with app.app_context():
+        seqs = db.session.execute(text('SELECT seq FROM comment ORDER BY seq')).scalars().all()
+        assert seqs == list(range(1, 81))
+        db.engine.dispose()
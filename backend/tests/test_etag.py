@@ -0,0 +1,47 @@
+def revalidate(client, url, etag):
+    return client.get(url, headers={'If-None-Match': f'"{etag}"'})
+
+
+def test_comment_listing_answers_304_until_a_comment_is_added(client, count_queries, login, make_team):
+    owner_id, _, _, _, cos_id, _ = make_team('etag_comments')
+    login(client, owner_id)
+    client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'first'})
+    url = f'/api/comments/{cos_id}'
+    first = client.get(url)
+    etag = first.get_etag()[0]
+    assert etag and first.headers['Cache-Control'] == 'private, no-cache'
+    with count_queries() as statements:
+        res = revalidate(client, url, etag)
+    assert res.status_code == 304 and res.data == b''
+    # the membership check and the high-water mark; no comment rows are loaded
+    assert len(statements) == 4
+    # other pages are different representations
+    assert client.get(url + '?limit=1').get_etag()[0] != etag
+
+    client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'second'})
+    res = revalidate(client, url, etag)
+    assert res.status_code == 200
+    assert [c['text'] for c in res.get_json()['comments']] == ['second', 'first']
+
+
+def test_team_listings_change_etag_on_membership_changes(client, login, make_team):
+    owner_id, _, other_id, team_id, _, _ = make_team('etag_teams')
+    login(client, owner_id)
+    members_url = f'/api/teams/{team_id}/members'
+    members_etag = client.get(members_url).get_etag()[0]
+    teams_etag = client.get('/api/teams').get_etag()[0]
+    assert revalidate(client, members_url, members_etag).status_code == 304
+    assert revalidate(client, '/api/teams', teams_etag).status_code == 304
+
+    client.post(members_url, json={'github_username': 'etag_teams_outsider'})
+    res = revalidate(client, members_url, members_etag)
+    assert res.status_code == 200 and len(res.get_json()) == 3
+    members_etag = res.get_etag()[0]
+
+    client.put(f'{members_url}/{other_id}', json={'role': 'admin'})
+    res = revalidate(client, members_url, members_etag)
+    assert res.status_code == 200
+    assert {m['username']: m['role'] for m in res.get_json()}['etag_teams_outsider'] == 'admin'
+
+    # the owner's own team list did not change
+    assert revalidate(client, '/api/teams', teams_etag).status_code == 304
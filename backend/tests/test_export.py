@@ -0,0 +1,100 @@
+import json
+import time
+import pytest
+from backend import export
+from backend.db import db
+from backend.export import iter_gist_files
+from backend.models import Comment
+
+
+@pytest.fixture
+def make_cospace(app, login, make_team):
+    """A cospace owned by a new user, who is logged in."""
+    def make(client, name, texts):
+        team = make_team(name)
+        with app.app_context():
+            db.session.add_all([Comment(cospace_id=team.cos_id, author_id=team.owner_id, selector='body', text=t)
+                                for t in texts])
+            db.session.commit()
+        login(client, team.owner_id)
+        return team.cos_id
+    return make
+
+
+def test_gist_files_are_valid_json_within_size_limit():
+    items = [json.dumps({'n': i, 'text': 'x' * 40}) for i in range(10)]
+    files = list(iter_gist_files(iter(items), 200))
+    assert len(files) > 1
+    assert all(len(f.encode()) <= 200 for f in files)
+    assert [d['n'] for f in files for d in json.loads(f)] == list(range(10))
+    assert json.loads(next(iter_gist_files(iter([]), 200))) == []
+
+
+def test_export_runs_in_background_and_splits_files(client, app, make_cospace, github_stub, wait_for_job):
+    cos_id = make_cospace(client, 'export_split', [f'comment {i} ' + 'y' * 100 for i in range(12)])
+    app.config.update(GIST_FILE_MAX_BYTES=600, EXPORT_BATCH_SIZE=5)
+    try:
+        res = client.post('/api/export/github', json={'cospace_id': cos_id, 'github_token': 'tok', 'public': True})
+        assert res.status_code == 202
+        job = wait_for_job(res.get_json()['job_id'])
+    finally:
+        app.config.update(GIST_FILE_MAX_BYTES=1_000_000, EXPORT_BATCH_SIZE=500)
+    assert job['status'] == 'done'
+    assert job['gist']['id'] == 'gist1'
+    create, *patches = github_stub.calls
+    assert create['method'] == 'POST' and create['path'] == '/gists'
+    assert create['json']['public'] is True
+    assert create['headers']['Authorization'] == 'token tok'
+    assert patches and all(c['method'] == 'PATCH' and c['path'] == '/gists/gist1' for c in patches)
+    assert job['files'] == len(github_stub.calls)
+    texts = []
+    for call in github_stub.calls:
+        (name, f), = call['json']['files'].items()
+        assert name.startswith(f'cospace_{cos_id}_comments')
+        texts += [c['text'] for c in json.loads(f['content'])]
+    assert texts == [f'comment {i} ' + 'y' * 100 for i in range(12)]
+
+
+def test_export_reports_github_errors(client, make_cospace, github_stub, wait_for_job):
+    cos_id = make_cospace(client, 'export_error', ['a'])
+    github_stub.responses.append((401, {'message': 'Bad credentials'}))
+    res = client.post('/api/export/github', json={'cospace_id': cos_id, 'github_token': 'bad'})
+    job = wait_for_job(res.get_json()['job_id'])
+    assert job['status'] == 'error'
+    assert job['error']['status'] == 401
+    assert job['error']['details'] == {'message': 'Bad credentials'}
+
+
+def test_unknown_export_job_is_404(client):
+    assert client.get('/api/export/jobs/nope').status_code == 404
+
+
+def test_export_needs_a_member_and_only_its_owner_reads_the_job(client, make_cospace, github_stub, wait_for_job):
+    cos_id = make_cospace(client, 'export_owner', ['a'])
+    other_cos_id = make_cospace(client, 'export_other', ['b'])
+    assert client.post('/api/export/github', json={'cospace_id': cos_id, 'github_token': 't'}).status_code == 403
+    job_id = client.post('/api/export/github', json={'cospace_id': other_cos_id, 'github_token': 't'}).get_json()['job_id']
+    assert wait_for_job(job_id)['status'] == 'done'
+
+    # another user, or nobody
+    make_cospace(client, 'export_stranger', [])
+    assert client.get(f'/api/export/jobs/{job_id}').status_code == 404
+    with client.session_transaction() as sess:
+        sess.clear()
+    assert client.get(f'/api/export/jobs/{job_id}').status_code == 404
+    assert client.post('/api/export/github', json={'cospace_id': cos_id, 'github_token': 't'}).status_code == 401
+
+
+def test_finished_jobs_expire(client, app, make_cospace, github_stub):
+    cos_id = make_cospace(client, 'export_ttl', ['a'])
+    app.config.update(EXPORT_JOB_TTL=0)
+    try:
+        job_id = client.post('/api/export/github', json={'cospace_id': cos_id, 'github_token': 't'}).get_json()['job_id']
+        deadline = time.time() + 5
+        while export._jobs[job_id]['status'] in ('pending', 'running') and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        app.config.update(EXPORT_JOB_TTL=3600)
+    assert export._jobs[job_id]['status'] == 'done'
+    assert client.get(f'/api/export/jobs/{job_id}').status_code == 404
+    assert job_id not in export._jobs
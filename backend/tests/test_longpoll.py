@@ -6,7 +6,7 @@ from backend.db import db
 from backend.models import User, Team, CoSpace, Comment, TeamMember
 
 
-def test_longpoll_returns_immediately_if_new_comment(client, app):
+def test_longpoll_returns_immediately_if_new_comment(client, app, login):
     with app.app_context():
         # create user, team, cospace
         user = User(username='u1', github_id='1')
@@ -22,6 +22,7 @@ def test_longpoll_returns_immediately_if_new_comment(client, app):
         c = Comment(cospace=cos, author=user, selector='body', text='hello')
         db.session.add(c)
         db.session.commit()
+        login(client, user.id)
         # call longpoll with since_id less than comment id
         res = client.get(f'/api/comments/longpoll/{cos.id}?since_id=0&timeout=1')
         assert res.status_code == 200
@@ -31,7 +32,7 @@ def test_longpoll_returns_immediately_if_new_comment(client, app):
         assert any(x['text'] == 'hello' for x in data)
 
 
-def test_longpoll_waits_and_returns_when_comment_created(client, app):
+def test_longpoll_waits_and_returns_when_comment_created(client, app, login):
     with app.app_context():
         user = User(username='u2', github_id='2')
         db.session.add(user)
@@ -41,6 +42,7 @@ def test_longpoll_waits_and_returns_when_comment_created(client, app):
         db.session.add(cos)
         db.session.commit()
         cos_id = cos.id
+        login(client, user.id)
 
     # create a thread to insert a comment after a short delay
     def insert_comment():
@@ -59,3 +61,13 @@ def test_longpoll_waits_and_returns_when_comment_created(client, app):
     assert isinstance(data, list)
     assert any(x['text'] == 'delayed' for x in data)
     t.join()
+
+
+def test_longpoll_needs_a_team_member(client, login, make_team):
+    team = make_team('longpoll_auth')
+    url = f'/api/comments/longpoll/{team.cos_id}?since_id=0&timeout=0'
+    assert client.get(url).status_code == 401
+    login(client, team.outsider_id)
+    assert client.get(url).status_code == 403
+    login(client, team.writer_id)
+    assert client.get(url).get_json() == []
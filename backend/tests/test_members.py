@@ -4,12 +4,7 @@ from backend.db import db
 from backend.models import User, Team, CoSpace, TeamMember
 
 
-def login(client, user_id):
-    with client.session_transaction() as sess:
-        sess['user_id'] = user_id
-
-
-def test_owner_can_add_and_remove_member(client, app):
+def test_owner_can_add_and_remove_member(client, app, login):
     with app.app_context():
         owner = User(username='owner', github_id='10')
         alice = User(username='alice', github_id='11')
@@ -19,8 +14,9 @@ def test_owner_can_add_and_remove_member(client, app):
         db.session.add_all([team, tm])
         db.session.commit()
         team_id = team.id
+        owner_id = owner.id
 
-    login(client, owner.id)
+    login(client, owner_id)
     # add alice
     res = client.post(f'/api/teams/{team_id}/members', json={'github_username': 'alice', 'role': 'member'})
     assert res.status_code == 200
@@ -47,7 +43,7 @@ def test_owner_can_add_and_remove_member(client, app):
     assert not any(m['username']=='alice' for m in members)
 
 
-def test_non_admin_cannot_add_member(client, app):
+def test_non_admin_cannot_add_member(client, app, login):
     with app.app_context():
         owner = User(username='owner2', github_id='20')
         bob = User(username='bob', github_id='21')
@@ -59,13 +55,14 @@ def test_non_admin_cannot_add_member(client, app):
         db.session.add_all([team, tm_owner, tm_bob])
         db.session.commit()
         team_id = team.id
+        bob_id = bob.id
 
-    login(client, bob.id)
+    login(client, bob_id)
     res = client.post(f'/api/teams/{team_id}/members', json={'github_username':'carol','role':'member'})
     assert res.status_code == 403
 
 
-def test_admin_can_add_member(client, app):
+def test_admin_can_add_member(client, app, login):
     with app.app_context():
         owner = User(username='owner3', github_id='30')
         admin = User(username='admin', github_id='31')
@@ -77,8 +74,9 @@ def test_admin_can_add_member(client, app):
         db.session.add_all([team, tm_owner, tm_admin])
         db.session.commit()
         team_id = team.id
+        admin_id = admin.id
 
-    login(client, admin.id)
+    login(client, admin_id)
     res = client.post(f'/api/teams/{team_id}/members', json={'github_username':'carol2','role':'member'})
     assert res.status_code == 200
     j = res.get_json(); assert j.get('ok')
@@ -0,0 +1,76 @@
+import os
+import pytest
+from backend.app import create_app
+from backend.db import db
+from backend.metrics import _profiling
+from backend.models import User, Team, CoSpace, Comment
+
+
+@pytest.fixture
+def metrics_app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'METRICS_ENABLED': True,
+        'PROFILE_SLOW_REQUEST_MS': 0,
+        'PROFILE_SAMPLE_RATE': 1.0,
+        'PROFILE_DIR': str(tmp_path / 'profiles'),
+    })
+    with app.app_context():
+        db.create_all()
+        user = User(username='m1', github_id='m1')
+        team = Team(name='mt', owner=user)
+        cos = CoSpace(name='mc', team=team)
+        db.session.add_all([user, team, cos, Comment(cospace=cos, author=user, text='x')])
+        db.session.commit()
+        app.config['cospace_id'] = cos.id
+        app.config['user_id'] = user.id
+    return app
+
+
+def test_metrics_endpoint_reports_latency_sql_and_parked_longpolls(metrics_app, login):
+    client = metrics_app.test_client()
+    login(client, metrics_app.config['user_id'])
+    cos_id = metrics_app.config['cospace_id']
+    assert client.get(f'/api/comments/{cos_id}').status_code == 200
+    assert client.get(f'/api/comments/{cos_id}').status_code == 200
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'codocs_requests_total{endpoint="api.get_comments",method="GET",status="200"} 2' in body
+    assert 'codocs_request_duration_seconds_count{endpoint="api.get_comments",method="GET"} 2' in body
+    assert 'codocs_request_duration_seconds_bucket{endpoint="api.get_comments",method="GET",le="+Inf"} 2' in body
+    assert 'codocs_db_statements_total{endpoint="api.get_comments"} 10' in body
+    assert 'codocs_db_seconds_total{endpoint="api.get_comments"}' in body
+    assert 'codocs_longpoll_parked 0' in body
+
+
+def test_slow_requests_are_profiled(metrics_app, login):
+    client = metrics_app.test_client()
+    login(client, metrics_app.config['user_id'])
+    client.get(f"/api/comments/{metrics_app.config['cospace_id']}")
+    profiles = os.listdir(metrics_app.config['PROFILE_DIR'])
+    assert any(p.startswith('api.get_comments-') and p.endswith('.prof') for p in profiles)
+
+
+def test_one_request_is_profiled_at_a_time(metrics_app):
+    @metrics_app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    metrics_app.config['PROPAGATE_EXCEPTIONS'] = False
+    client = metrics_app.test_client()
+    with _profiling:
+        client.get(f"/api/comments/{metrics_app.config['cospace_id']}")
+    assert not os.path.exists(metrics_app.config['PROFILE_DIR'])
+    # a failed request lets go of the profiler too
+    assert client.get('/boom').status_code == 500
+    assert not _profiling.locked()
+    client.get(f"/api/comments/{metrics_app.config['cospace_id']}")
+    assert os.listdir(metrics_app.config['PROFILE_DIR'])
+
+
+def test_profiling_samples_few_requests_by_default(app):
+    assert app.config['PROFILE_SAMPLE_RATE'] == 0.01
+
+
+def test_metrics_are_off_by_default(client):
+    assert client.get('/metrics').status_code == 404
@@ -0,0 +1,77 @@
+from sqlite3 import dbapi2
+from sqlalchemy import create_engine, inspect, text
+from backend.anchors import selector_key
+from backend.db import db
+from backend.migrations import REVISIONS, _number_comments, applied, upgrade
+
+# the schema as the first release created it with db.create_all()
+LEGACY_SCHEMA = [
+    'CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, '
+    'github_id VARCHAR(80) UNIQUE, github_token_encrypted VARCHAR(1024))',
+    'CREATE TABLE team (id INTEGER PRIMARY KEY, name VARCHAR(120) NOT NULL, owner_id INTEGER REFERENCES user(id))',
+    'CREATE TABLE team_member (id INTEGER PRIMARY KEY, team_id INTEGER NOT NULL REFERENCES team(id), '
+    'user_id INTEGER NOT NULL REFERENCES user(id), role VARCHAR(32))',
+    'CREATE TABLE co_space (id INTEGER PRIMARY KEY, name VARCHAR(120) NOT NULL, '
+    'team_id INTEGER NOT NULL REFERENCES team(id), description TEXT)',
+    'CREATE TABLE comment (id INTEGER PRIMARY KEY, cospace_id INTEGER NOT NULL REFERENCES co_space(id), '
+    'author_id INTEGER REFERENCES user(id), selector VARCHAR(512), text TEXT, metadata TEXT, created_at DATETIME)',
+]
+
+
+def test_upgrade_brings_a_legacy_database_up_to_date(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO user (id, username) VALUES (1, 'old')"))
+        conn.execute(text("INSERT INTO team (id, name, owner_id) VALUES (1, 'old', 1)"))
+        conn.execute(text("INSERT INTO team_member (team_id, user_id, role) VALUES (1, 1, 'owner'), (1, 1, 'member')"))
+        conn.execute(text("INSERT INTO co_space (id, name, team_id) VALUES (1, 'a', 1), (2, 'b', 1)"))
+        conn.execute(text("INSERT INTO comment (cospace_id, author_id, text, selector) VALUES "
+                          "(1, 1, 'hello there', 'div>p'), (2, 1, 'other', NULL), (1, 1, 'second', NULL), "
+                          "(1, 1, 'third', NULL)"))
+
+    with engine.begin() as conn:
+        assert upgrade(conn) == [version for version, _ in REVISIONS]
+    with engine.begin() as conn:
+        assert upgrade(conn) == []
+        assert applied(conn) == [version for version, _ in REVISIONS]
+        assert conn.execute(text('SELECT role FROM team_member')).scalars().all() == ['owner']
+        seqs = conn.execute(text('SELECT cospace_id, seq FROM comment ORDER BY id')).all()
+        assert [tuple(r) for r in seqs] == [(1, 1), (2, 1), (1, 2), (1, 3)]
+        assert conn.execute(text('SELECT change_seq FROM co_space ORDER BY id')).scalars().all() == [3, 1]
+        assert conn.execute(text('SELECT pruned_seq FROM co_space ORDER BY id')).scalars().all() == [0, 0]
+        assert inspect(conn).has_table('comment_archive') and inspect(conn).has_table('anchor_failure')
+        assert conn.execute(text('SELECT comment_count, last_comment_id FROM co_space ORDER BY id')).all() == [(3, 4), (1, 2)]
+        assert conn.execute(text('SELECT selector_key FROM comment WHERE id = 1')).scalar() == selector_key('div > p')
+        assert conn.execute(text('SELECT cospace_id, author_id, comment_count FROM co_space_author '
+                                 'ORDER BY cospace_id')).all() == [(1, 1, 3), (2, 1, 1)]
+        assert conn.execute(text("SELECT rowid FROM comment_fts WHERE comment_fts MATCH 'hello'")).scalars().all() == [1]
+        indexes = {i['name'] for i in inspect(conn).get_indexes('comment')}
+        assert {'ix_comment_cospace_id_id', 'ix_comment_cospace_id_page_url_id', 'ix_comment_cospace_id_seq',
+            'ix_comment_cospace_id_page_url_selector_key'} <= indexes
+    engine.dispose()
+
+
+def test_upgrade_creates_a_fresh_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    with engine.begin() as conn:
+        assert len(upgrade(conn)) == len(REVISIONS)
+        tables = set(inspect(conn).get_table_names())
+        # every revision runs from the first release's schema to the models' schema
+        columns = {t: {c['name'] for c in inspect(conn).get_columns(t)} for t in db.metadata.tables}
+    assert {'user', 'team', 'team_member', 'co_space', 'comment', 'comment_fts', 'comment_archive', 'co_space_author', 'anchor_status', 'anchor_failure', 'schema_version'} <= tables
+    assert columns == {name: {c.name for c in table.columns} for name, table in db.metadata.tables.items()}
+    engine.dispose()
+
+
+def test_comments_are_numbered_without_update_from(tmp_path, monkeypatch):
+    # SQLite before 3.33 has no UPDATE ... FROM
+    monkeypatch.setattr(dbapi2, 'sqlite_version_info', (3, 31, 1))
+    engine = create_engine(f"sqlite:///{tmp_path / 'old_sqlite.db'}")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE comment (id INTEGER PRIMARY KEY, cospace_id INTEGER, seq INTEGER)'))
+        conn.execute(text('INSERT INTO comment (cospace_id) VALUES (2), (1), (2), (1), (1)'))
+        _number_comments(conn, batch_size=2)
+        assert conn.execute(text('SELECT seq FROM comment ORDER BY id')).scalars().all() == [1, 1, 2, 2, 3]
+    engine.dispose()
@@ -0,0 +1,102 @@
+import threading
+import time
+from sqlalchemy import event
+from backend.db import db
+from backend.models import User, Team, CoSpace, Comment, TeamMember
+from backend.notify import NotificationHub, BrokerBackend, LocalBroker, hub
+
+
+def test_broker_backend_fans_out_across_hubs():
+    broker = LocalBroker()
+    # two hubs on one broker behave like two worker processes
+    worker_a = NotificationHub(BrokerBackend(broker))
+    worker_b = NotificationHub(BrokerBackend(broker))
+    with worker_b.listen(7) as waiter, worker_b.listen(8) as other:
+        worker_a.publish(7)
+        assert waiter.wait(1)
+        assert not other.wait(0.05)
+    assert worker_b.waiting() == 0
+
+
+def test_slow_subscribe_does_not_block_the_hub():
+    subscribing, release = threading.Event(), threading.Event()
+
+    class SlowBroker(LocalBroker):
+        def subscribe(self, channel, callback):
+            subscribing.set()
+            release.wait(5)
+            super().subscribe(channel, callback)
+
+    worker = NotificationHub(BrokerBackend(SlowBroker()))
+    def park():
+        with worker.listen(1) as waiter:
+            waiter.wait(0.1)
+    first = threading.Thread(target=park)
+    first.start()
+    assert subscribing.wait(1)
+    # counting waiters and waking them go on while the first waiter subscribes
+    start = time.time()
+    assert worker.waiting() == 0
+    worker._wake(1)
+    assert time.time() - start < 1
+    release.set()
+    first.join(2)
+    assert worker.waiting() == 0
+
+
+def test_commit_wakes_waiter_only_for_its_cospace(app):
+    with app.app_context():
+        user = User(username='n1', github_id='n1')
+        team = Team(name='nt1', owner=user)
+        cos_a = CoSpace(name='na', team=team)
+        cos_b = CoSpace(name='nb', team=team)
+        db.session.add_all([user, team, cos_a, cos_b])
+        db.session.commit()
+        with hub.listen(cos_a.id) as waiter_a, hub.listen(cos_b.id) as waiter_b:
+            db.session.add(Comment(cospace=cos_a, author=user, text='x'))
+            db.session.commit()
+            assert waiter_a.wait(0)
+            assert not waiter_b.wait(0)
+
+
+def test_parked_longpoll_issues_no_queries_and_wakes_on_post(client, app, login):
+    with app.app_context():
+        user = User(username='n2', github_id='n2')
+        team = Team(name='nt2', owner=user)
+        tm = TeamMember(team=team, user=user, role='owner')
+        cos = CoSpace(name='nc', team=team)
+        db.session.add_all([user, team, tm, cos])
+        db.session.commit()
+        cos_id, user_id = cos.id, user.id
+        engine = db.engine
+    login(client, user_id)
+
+    statements = []
+    def count(conn, cursor, statement, *args):
+        if threading.current_thread() is threading.main_thread():
+            statements.append(statement)
+
+    def post_later():
+        deadline = time.time() + 5
+        while hub.waiting() == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.3)
+        poster = app.test_client()
+        with poster.session_transaction() as sess:
+            sess['user_id'] = user_id
+        posted.append(time.time())
+        poster.post('/api/comments', json={'cospace_id': cos_id, 'selector': 'body', 'text': 'woke'})
+
+    posted = []
+    t = threading.Thread(target=post_later)
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        t.start()
+        res = client.get(f'/api/comments/longpoll/{cos_id}?since_id=0&timeout=5')
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+        t.join()
+    assert [c['text'] for c in res.get_json()] == ['woke']
+    # one query before parking and one after the wakeup
+    assert len([s for s in statements if 'FROM comment' in s]) == 2
+    assert time.time() - posted[0] < 0.5
@@ -0,0 +1,91 @@
+import socket
+import threading
+import pytest
+import requests
+from backend.outbound import ClientBusy, HTTPClient, server_wait
+
+
+def make_client(**kwargs):
+    waits = []
+    kwargs.setdefault('backoff', 0.01)
+    return HTTPClient(sleep=waits.append, **kwargs), waits
+
+
+def url(stub, path='/gists'):
+    return f'http://127.0.0.1:{stub.server_port}{path}'
+
+
+def test_server_wait_headers():
+    assert server_wait({'Retry-After': '7'}) == 7
+    assert server_wait({'Retry-After': 'Thu, 01 Jan 1970 00:01:40 GMT'}, now=90) == 10
+    assert server_wait({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '130'}, now=100) == 30
+    assert server_wait({'X-RateLimit-Remaining': '5', 'X-RateLimit-Reset': '130'}) is None
+
+
+def test_rate_limits_are_retried_after_the_requested_wait(github_stub):
+    http, waits = make_client()
+    github_stub.responses += [(429, {}, {'Retry-After': '2'}),
+                              (403, {'message': 'rate limited'}, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '1'})]
+    res = http.post(url(github_stub), json={})
+    assert res.status_code == 201 and len(github_stub.calls) == 3
+    assert waits == [2.0, 0.0]
+
+
+def test_server_errors_are_retried_only_when_idempotent(github_stub):
+    http, waits = make_client(max_retries=2)
+    github_stub.responses += [(502, {})]
+    assert http.post(url(github_stub), json={}).status_code == 502
+    github_stub.responses += [(502, {}), (503, {}), (502, {})]
+    assert http.patch(url(github_stub, '/gists/1'), json={}, idempotent=True).status_code == 502
+    assert len(github_stub.calls) == 4 and len(waits) == 2
+
+
+def test_long_waits_and_plain_forbidden_are_not_retried(github_stub):
+    http, waits = make_client(max_retry_wait=5)
+    github_stub.responses += [(429, {}, {'Retry-After': '600'}), (403, {'message': 'no access'})]
+    assert http.post(url(github_stub), json={}).status_code == 429
+    assert http.post(url(github_stub), json={}).status_code == 403
+    assert waits == []
+
+
+def test_read_timeout_raises_after_retries(github_stub):
+    http, waits = make_client(read_timeout=0.1, max_retries=1)
+    github_stub.delay = 0.3
+    with pytest.raises(requests.ReadTimeout):
+        http.get(url(github_stub))
+    assert len(waits) == 1
+    with pytest.raises(requests.ReadTimeout):
+        http.post(url(github_stub), json={})
+    assert len(waits) == 1
+
+
+def test_refused_connections_are_retried_even_for_post():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    http, waits = make_client(max_retries=2)
+    with pytest.raises(requests.ConnectionError):
+        http.post(f'http://127.0.0.1:{port}/gists', json={})
+    assert len(waits) == 2
+
+
+def test_concurrency_is_limited(github_stub):
+    http, _ = make_client(max_concurrency=2, queue_timeout=5)
+    github_stub.delay = 0.1
+    threads = [threading.Thread(target=http.get, args=(url(github_stub),)) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert len(github_stub.calls) == 6 and github_stub.peak <= 2
+
+    busy, _ = make_client(max_concurrency=1, queue_timeout=0.05)
+    github_stub.delay = 0.3
+    holder = threading.Thread(target=busy.get, args=(url(github_stub),))
+    holder.start()
+    while github_stub.active == 0:
+        pass
+    with pytest.raises(ClientBusy):
+        busy.get(url(github_stub))
+    holder.join(5)
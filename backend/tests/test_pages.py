@@ -0,0 +1,49 @@
+import json
+from backend.db import db
+from backend.models import CoSpace, Comment
+from backend.pages import backfill_page_urls, normalize_page_url
+
+
+def test_normalize_page_url():
+    assert normalize_page_url('HTTPS://Example.COM:443/docs?b=2&utm_source=x&a=1#intro') == 'https://example.com/docs?a=1&b=2'
+    assert normalize_page_url('http://example.com') == 'http://example.com/'
+    assert normalize_page_url('http://example.com:8080/a') == 'http://example.com:8080/a'
+    assert normalize_page_url('javascript:alert(1)') is None
+    assert normalize_page_url('not a url') is None
+    assert normalize_page_url(None) is None
+
+
+def test_comments_filtered_by_page_url(client, login, make_team):
+    team = make_team('pages_filter')
+    cos_id = team.cos_id
+    login(client, team.owner_id)
+    client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'on a', 'metadata': {'href': 'https://site.test/a#top'}})
+    client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'on b', 'url': 'https://site.test/b'})
+    client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'on a again', 'metadata': json.dumps({'url': 'https://SITE.test/a'})})
+    client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'anywhere'})
+
+    # comments saved without a page show on every page, in the listing and the long-poll
+    page = client.get(f'/api/comments/{cos_id}?url=https://site.test/a').get_json()
+    assert [c['text'] for c in page['comments']] == ['anywhere', 'on a again', 'on a']
+    assert {c['page_url'] for c in page['comments']} == {'https://site.test/a', None}
+    batch = client.get(f'/api/comments/longpoll/{cos_id}?since_id=0&timeout=1&url=https%3A%2F%2Fsite.test%2Fb').get_json()
+    assert [c['text'] for c in batch] == ['on b', 'anywhere']
+    assert client.get(f'/api/comments/{cos_id}?url=ftp://nope').status_code == 400
+
+
+def test_backfill_populates_page_urls_from_metadata(app, make_team):
+    cos_id = make_team('pages_backfill').cos_id
+    with app.app_context():
+        db.session.add_all([
+            Comment(cospace_id=cos_id, text='old', meta=json.dumps({'href': 'https://old.test/x?utm_medium=y'})),
+            Comment(cospace_id=cos_id, text='no url', meta='free text'),
+            Comment(cospace_id=cos_id, text='no metadata'),
+        ])
+        db.session.commit()
+        change_seq = db.session.get(CoSpace, cos_id).change_seq
+        assert backfill_page_urls(batch_size=1) == 1
+        urls = dict(db.session.query(Comment.text, Comment.page_url).filter(Comment.cospace_id == cos_id))
+        # the update is a change: listings revalidate and delta sync sees it
+        assert db.session.get(CoSpace, cos_id).change_seq == change_seq + 1
+        assert db.session.query(Comment.seq).filter(Comment.text == 'old').scalar() == change_seq + 1
+    assert urls == {'old': 'https://old.test/x', 'no url': None, 'no metadata': None}
@@ -0,0 +1,71 @@
+"""Runs against the Postgres database named by TEST_DATABASE_URL (its tables
+are dropped and recreated); skipped when it is not set."""
+import os
+import threading
+import pytest
+from sqlalchemy import text
+from backend.app import create_app
+from backend.db import db
+from backend.migrations import upgrade, version_table
+from backend.models import User, Team, CoSpace, TeamMember
+
+pytestmark = pytest.mark.skipif(not os.environ.get('TEST_DATABASE_URL'), reason='TEST_DATABASE_URL is not set')
+
+
+@pytest.fixture(scope='module')
+def pg_app():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': os.environ.get('TEST_DATABASE_URL'),
+                      'SOCKETIO_COALESCE_MS': 0, 'DB_POOL_SIZE': 4})
+    with app.app_context():
+        db.drop_all()
+        version_table.drop(db.engine, checkfirst=True)
+        with db.engine.begin() as conn:
+            upgrade(conn)
+        users = [User(username=f'pg{i}') for i in range(8)]
+        team = Team(name='pg', owner=users[0])
+        cos = CoSpace(name='pg', team=team)
+        db.session.add_all(users + [team, cos] + [TeamMember(team=team, user=u, role='member') for u in users])
+        db.session.commit()
+        app.config['PG_FIXTURE'] = ([u.id for u in users], cos.id)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_pool_is_configured(pg_app):
+    with pg_app.app_context():
+        assert db.engine.dialect.name == 'postgresql'
+        assert db.engine.pool.size() == 4
+
+
+def test_concurrent_posts_get_gapless_sequence(pg_app):
+    user_ids, cos_id = pg_app.config['PG_FIXTURE']
+    statuses = []
+
+    def post(user_id):
+        client = pg_app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        for i in range(10):
+            statuses.append(client.post('/api/comments', json={'cospace_id': cos_id, 'text': f'postgres {i}'}).status_code)
+
+    threads = [threading.Thread(target=post, args=(uid,)) for uid in user_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(60)
+    assert statuses == [200] * 80
+    with pg_app.app_context():
+        seqs = db.session.execute(text('SELECT seq FROM comment WHERE cospace_id = :c ORDER BY seq'), {'c': cos_id}).scalars().all()
+        assert seqs == list(range(1, 81))
+
+
+def test_search_uses_tsvector(pg_app):
+    user_ids, cos_id = pg_app.config['PG_FIXTURE']
+    client = pg_app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_ids[0]
+    client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'pgsearch needle'})
+    res = client.get(f'/api/comments/search?q=needle&cospace_id={cos_id}').get_json()
+    assert [c['text'] for c in res['comments']] == ['pgsearch needle']
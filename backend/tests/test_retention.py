@@ -0,0 +1,104 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+from backend.db import db
+from backend.models import CoSpace, Comment, CommentArchive
+from backend.retention import apply_policies
+
+
+def post(client, cos_id, texts):
+    items = [{'cospace_id': cos_id, 'text': t} for t in texts]
+    return [r['id'] for r in client.post('/api/comments/batch', json={'comments': items}).get_json()['results']]
+
+
+def age(app, ids, days, column='created_at'):
+    with app.app_context():
+        db.session.execute(update(Comment).where(Comment.id.in_(ids))
+                           .values({column: datetime.utcnow() - timedelta(days=days)}))
+        db.session.commit()
+
+
+def test_retention_policy_requires_owner_or_admin(client, login, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('ret_policy')
+    login(client, writer_id)
+    assert client.put(f'/api/cospaces/{cos_id}/retention', json={'retention_days': 30}).status_code == 403
+    login(client, owner_id)
+    assert client.put(f'/api/cospaces/{cos_id}/retention', json={'retention_days': 0}).status_code == 400
+    assert client.put(f'/api/cospaces/{cos_id}/retention', json={'retention_days': 30}).get_json() == \
+        {'id': cos_id, 'retention_days': 30}
+    assert client.put(f'/api/cospaces/{cos_id}/retention', json={'retention_days': None}).status_code == 200
+
+
+def test_old_comments_move_to_the_archive_and_read_through(client, app, login, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('ret_archive')
+    login(client, writer_id)
+    ids = post(client, cos_id, [str(i) for i in range(6)])
+    age(app, ids[:4], 90)
+    # edited recently, so it stays hot although it is old
+    age(app, ids[1:2], 1, 'updated_at')
+    login(client, owner_id)
+    client.put(f'/api/cospaces/{cos_id}/retention', json={'retention_days': 30})
+    before = client.get(f'/api/comments/{cos_id}')
+
+    with app.app_context():
+        assert apply_policies(app.config, cospace_id=cos_id) == {'archived': 3, 'purged': 0}
+        hot = db.session.scalars(select(Comment.id).where(Comment.cospace_id == cos_id)).all()
+        archived = db.session.scalars(select(CommentArchive.id).where(CommentArchive.cospace_id == cos_id)).all()
+    assert sorted(hot) == [ids[1], ids[4], ids[5]]
+    assert sorted(archived) == [ids[0], ids[2], ids[3]]
+
+    res = client.get(f'/api/comments/{cos_id}', headers={'If-None-Match': before.headers['ETag']})
+    assert res.status_code == 200
+    assert [c['text'] for c in res.get_json()['comments']] == ['5', '4', '1']
+
+    first = client.get(f'/api/comments/{cos_id}?archived=1&limit=4').get_json()
+    assert [c['text'] for c in first['comments']] == ['5', '4', '3', '2']
+    assert all(c['author'] == 'ret_archive_writer' for c in first['comments'])
+    rest = client.get(f"/api/comments/{cos_id}?archived=1&limit=4&before_id={first['next_cursor']}").get_json()
+    assert [c['text'] for c in rest['comments']] == ['1', '0'] and rest['next_cursor'] is None
+    forward = client.get(f'/api/comments/{cos_id}?archived=1&after_id={ids[0]}').get_json()
+    assert [c['text'] for c in forward['comments']] == ['1', '2', '3', '4', '5']
+    # archived comments are read-only
+    assert client.delete(f'/api/comments/{cos_id}/{ids[0]}').status_code == 404
+
+
+def test_purged_tombstones_force_a_full_resync(client, app, login, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('ret_purge')
+    login(client, writer_id)
+    ids = post(client, cos_id, ['keep', 'gone'])
+    seq = client.delete(f'/api/comments/{cos_id}/{ids[1]}').get_json()['seq']
+    age(app, ids[1:], 60, 'deleted_at')
+
+    with app.app_context():
+        assert apply_policies(app.config, cospace_id=cos_id) == {'archived': 0, 'purged': 1}
+        assert db.session.get(Comment, ids[1]) is None
+        assert db.session.get(CoSpace, cos_id).pruned_seq == seq
+
+    res = client.get(f'/api/cospaces/{cos_id}/changes?since_seq=1')
+    assert res.status_code == 410 and res.get_json()['pruned_seq'] == seq
+    assert client.get(f'/api/cospaces/{cos_id}/changes?since_seq={seq}').status_code == 200
+    full = client.get(f'/api/cospaces/{cos_id}/changes?since_seq=0').get_json()
+    assert [c['text'] for c in full['changes']] == ['keep']
+
+
+def test_cli_writes_jsonl_segments(client, app, tmp_path, login, make_team):
+    owner_id, writer_id, _, _, cos_id, _ = make_team('ret_segments')
+    login(client, writer_id)
+    ids = post(client, cos_id, ['a', 'b', 'c'])
+    age(app, ids[:2], 10)
+    with app.app_context():
+        db.session.get(CoSpace, cos_id).retention_days = 5
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['archive-comments', '--cospace-id', str(cos_id),
+                                                '--segments', str(tmp_path), '--vacuum'])
+    assert 'archived 2 comments' in result.output
+    (segment,) = tmp_path.iterdir()
+    assert segment.name == f'cospace_{cos_id}_{ids[0]}-{ids[1]}.jsonl.gz'
+    with gzip.open(segment, 'rt') as f:
+        rows = [json.loads(line) for line in f]
+    assert [(r['id'], r['text'], r['cospace_id']) for r in rows] == [(ids[0], 'a', cos_id), (ids[1], 'b', cos_id)]
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).where(CommentArchive.cospace_id == cos_id)) == 0
+        assert db.session.scalars(select(Comment.id).where(Comment.cospace_id == cos_id)).all() == [ids[2]]
@@ -0,0 +1,81 @@
+import pytest
+from backend.db import db
+from backend.models import Comment
+
+
+@pytest.fixture
+def make_teams(app, make_team):
+    """Two cospaces of one team with comments, plus a cospace of another team."""
+    def make(name):
+        team = make_team(name, cospaces=2)
+        other = make_team(f'{name}_other')
+        user_id, (cos_a, cos_b) = team.writer_id, team.cos_ids
+        with app.app_context():
+            db.session.add_all([
+                Comment(cospace_id=cos_a, author_id=user_id, selector='div#banner', text='the banner colour is wrong'),
+                Comment(cospace_id=cos_a, author_id=user_id, selector='p', text='banner banner banner: fix the banner'),
+                Comment(cospace_id=cos_b, author_id=user_id, selector='footer', text='footer links are broken'),
+                Comment(cospace_id=cos_b, author_id=user_id, selector='header', text='unrelated'),
+                Comment(cospace_id=other.cos_id, author_id=other.owner_id, selector='div', text='secret banner'),
+            ])
+            db.session.commit()
+        return user_id, other.owner_id, team.team_id, cos_a, cos_b, other.cos_id
+    return make
+
+
+def test_search_ranks_and_scopes_results(client, login, make_teams):
+    user_id, _, team_id, cos_a, cos_b, hidden = make_teams('search_rank')
+    login(client, user_id)
+    res = client.get('/api/comments/search?q=banner')
+    texts = [c['text'] for c in res.get_json()['comments']]
+    # the denser match ranks first; the other team's cospace is not searched
+    assert texts == ['banner banner banner: fix the banner', 'the banner colour is wrong']
+    assert client.get(f'/api/comments/search?q=footer&cospace_id={cos_a}').get_json()['comments'] == []
+    res = client.get(f'/api/comments/search?q=footer&team_id={team_id}').get_json()
+    assert [(c['cospace_id'], c['author']) for c in res['comments']] == [(cos_b, 'search_rank_writer')]
+    # selectors are indexed too
+    assert len(client.get('/api/comments/search?q=header').get_json()['comments']) == 1
+    assert client.get(f'/api/comments/search?q=banner&cospace_id={hidden}').status_code == 403
+    # FTS syntax in the query is treated as plain words
+    assert client.get('/api/comments/search?q=%22banner%22%20OR%20*').get_json()['comments'] == []
+    assert client.get('/api/comments/search?q=%22*').status_code == 400
+
+
+def test_search_pages_with_cursor(client, app, login, make_teams):
+    user_id, _, _, cos_a, _, _ = make_teams('search_page')
+    with app.app_context():
+        db.session.add_all([Comment(cospace_id=cos_a, author_id=user_id, text=f'needle {i}') for i in range(5)])
+        db.session.commit()
+    login(client, user_id)
+    seen, cursor = [], None
+    while True:
+        page = client.get(f'/api/comments/search?q=needle&cospace_id={cos_a}&limit=2' + (f'&cursor={cursor}' if cursor else '')).get_json()
+        seen += [c['text'] for c in page['comments']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert sorted(seen) == [f'needle {i}' for i in range(5)]
+
+
+def test_search_index_follows_updates_and_deletes(client, app, login, make_teams):
+    user_id, _, _, cos_a, _, _ = make_teams('search_sync')
+    login(client, user_id)
+    with app.app_context():
+        comment = Comment.query.filter_by(cospace_id=cos_a, text='the banner colour is wrong').first()
+        comment.text = 'the logo shade is off'
+        db.session.commit()
+    url = f'/api/comments/search?cospace_id={cos_a}&q='
+    assert client.get(url + 'colour').get_json()['comments'] == []
+    assert len(client.get(url + 'shade').get_json()['comments']) == 1
+    with app.app_context():
+        Comment.query.filter_by(cospace_id=cos_a).delete()
+        db.session.commit()
+    assert client.get(url + 'banner').get_json()['comments'] == []
+
+
+def test_rebuild_search_index_command(client, app, login, make_teams):
+    user_id, _, _, cos_a, _, _ = make_teams('search_rebuild')
+    result = app.test_cli_runner().invoke(args=['rebuild-search-index'])
+    assert result.exit_code == 0, result.output
+    login(client, user_id)
+    assert len(client.get(f'/api/comments/search?q=footer').get_json()['comments']) == 1
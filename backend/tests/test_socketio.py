@@ -0,0 +1,49 @@
+import socketio as sio_pkg
+from backend.socketio import LocalManager, local_broker, queue_options, socketio
+
+
+def test_join_requires_team_role_and_receives_comments(client, app, login, make_team):
+    member_id, _, outsider_id, _, cos_id, _ = make_team('sio_join')
+    login(client, member_id)
+    member = socketio.test_client(app, flask_test_client=client)
+    assert member.emit('join_cospace', {'cospace_id': cos_id}, callback=True) == {'ok': True}
+
+    other = app.test_client()
+    login(other, outsider_id)
+    outsider = socketio.test_client(app, flask_test_client=other)
+    assert outsider.emit('join_cospace', {'cospace_id': cos_id}, callback=True) == {'error': 'not a team member'}
+    assert outsider.emit('join_cospace', {'cospace_id': 999999}, callback=True) == {'error': 'cospace not found'}
+
+    client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'live'})
+    events = member.get_received()
+    assert [(e['name'], [c[5] for c in e['args'][0]['comments']]) for e in events] == [('comment_changes', ['live'])]
+    assert outsider.get_received() == []
+
+    assert member.emit('leave_cospace', {'cospace_id': cos_id}, callback=True) == {'ok': True}
+    client.post('/api/comments', json={'cospace_id': cos_id, 'text': 'gone'})
+    assert member.get_received() == []
+    member.disconnect()
+    outsider.disconnect()
+
+
+def test_queue_options():
+    assert queue_options(None) == {'message_queue': None, 'client_manager': None}
+    assert queue_options('redis://localhost:6379/0') == {'message_queue': 'redis://localhost:6379/0'}
+    manager = queue_options('local://opts')['client_manager']
+    assert isinstance(manager, LocalManager) and manager.broker is local_broker('local://opts')
+
+
+def test_local_queue_fans_emits_out_to_other_servers():
+    url = 'local://fanout'
+    workers = [sio_pkg.Server(async_mode='threading', **queue_options(url)) for _ in range(2)]
+    sent = []
+    for i, worker in enumerate(workers):
+        worker._send_eio_packet = lambda eio_sid, pkt, i=i: sent.append((i, eio_sid, pkt.data))
+        worker.manager_initialized = True
+        worker.manager.initialize()
+    sid = workers[0].manager.connect('eio-a', '/')
+    workers[0].manager.enter_room(sid, '/', 'cospace_1')
+
+    workers[1].emit('new_comment', {'id': 1}, room='cospace_1')
+    workers[1].emit('new_comment', {'id': 2}, room='cospace_2')
+    assert sent == [(0, 'eio-a', '2["new_comment",{"id":1}]')]
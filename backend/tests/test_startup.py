@@ -0,0 +1,103 @@
+"""Worker boot: importing the app and building it in fresh interpreters.
+The wall-clock budget is only checked when ``STARTUP_BUDGET_MS`` is set."""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from sqlalchemy import func, select
+from backend import outbound
+from backend.app import _apps, create_app
+from backend.db import db
+from backend.migrations import upgrade
+from backend.models import User
+from backend.notify import hub
+
+ROOT = Path(__file__).resolve().parents[2]
+# opt-in: wall-clock timings flake on loaded CI runners
+BUDGET_MS = os.environ.get('STARTUP_BUDGET_MS')
+# only needed by exports, profiling or the eventlet server
+LAZY_MODULES = ('backend.export', 'cProfile', 'eventlet')
+
+BOOT = '''
+import json, sys, time
+start = time.perf_counter()
+from backend.app import create_app
+create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+print(json.dumps({'ms': (time.perf_counter() - start) * 1000, 'modules': sorted(sys.modules)}))
+'''
+
+
+def boot(*flags):
+    env = dict(os.environ, SOCKETIO_ASYNC_MODE='threading', PYTHONPATH=str(ROOT))
+    res = subprocess.run([sys.executable, *flags, '-c', BOOT], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(res.stdout.splitlines()[-1]), res.stderr
+
+
+def slowest_imports(importtime, n=10):
+    """The ``n`` modules with the largest cumulative ``-X importtime``."""
+    rows = []
+    for line in importtime.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                rows.append((int(cumulative), name.strip()))
+    return [f'{name} {us / 1000:.0f}ms' for us, name in sorted(rows, reverse=True)[:n]]
+
+
+@pytest.fixture(scope='module')
+def boots():
+    # bytecode is already compiled by this process importing the app
+    return [boot()[0] for _ in range(2)]
+
+
+@pytest.mark.skipif(not BUDGET_MS, reason='set STARTUP_BUDGET_MS to check boot time')
+def test_boot_stays_within_budget(boots):
+    budget = float(BUDGET_MS)
+    best = min(b['ms'] for b in boots)
+    if best > budget:
+        _, importtime = boot('-X', 'importtime')
+        raise AssertionError(f'boot took {best:.0f}ms (budget {budget:.0f}ms); slowest imports: '
+                             + ', '.join(slowest_imports(importtime)))
+
+
+def test_boot_leaves_optional_modules_unloaded(boots):
+    assert [m for m in LAZY_MODULES if m in boots[0]['modules']] == []
+
+
+def test_forked_worker_gets_fresh_connections(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'fork.db'}",
+                      'SOCKETIO_COALESCE_MS': 0})
+    with app.app_context():
+        with db.engine.begin() as conn:
+            upgrade(conn)
+        db.session.add(User(username='forked'))
+        db.session.commit()
+        parent_pool = db.engine.pool
+    parent_client = outbound.client(app)
+    # the process-wide fork hook resets every app built here
+    assert app in _apps
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            with app.app_context():
+                users = db.session.scalar(select(func.count(User.id)))
+                new_pool = db.engine.pool is not parent_pool
+            child = {'users': users, 'new_pool': new_pool, 'waiters': hub.waiting(),
+                     'new_client': outbound.client(app) is not parent_client}
+            os.write(write, json.dumps(child).encode())
+        finally:
+            os._exit(0)
+    os.close(write)
+    os.waitpid(pid, 0)
+    with os.fdopen(read) as f:
+        child = json.loads(f.read())
+    assert child == {'users': 1, 'new_pool': True, 'waiters': 0, 'new_client': True}
+    assert outbound.client(app) is parent_client
+    with app.app_context():
+        assert db.session.scalar(select(func.count(User.id))) == 1
+        db.engine.dispose()
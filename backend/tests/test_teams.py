@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+from backend.db import db
+from backend.models import User, Team, CoSpace, TeamMember
+
+
+def make_member_of(app, name, n_teams):
+    with app.app_context():
+        user = User(username=name, github_id=name)
+        db.session.add(user)
+        for i in range(n_teams):
+            team = Team(name=f'{name}_t{i}', owner=user)
+            db.session.add_all([team, TeamMember(team=team, user=user, role='member'),
+                                CoSpace(name=f'{name}_c{i}', team=team)])
+        db.session.commit()
+        return user.id
+
+
+def collect(client, url, key):
+    items, cursor = [], None
+    while True:
+        page = client.get(url + (f'&after_id={cursor}' if cursor else '')).get_json()
+        items += page[key]
+        cursor = page['next_cursor']
+        if not cursor:
+            return items
+
+
+def test_team_and_cospace_listings_are_single_paginated_queries(client, app, count_queries, login):
+    user_id = make_member_of(app, 'lister', 30)
+    make_member_of(app, 'someone_else', 3)
+    login(client, user_id)
+    # current user (+ ETag validator for teams) + one joined listing query, regardless of team count
+    for url, key, queries in (('/api/teams', 'teams', 3), ('/api/cospaces', 'cospaces', 2)):
+        with count_queries() as statements:
+            page = client.get(url).get_json()
+        assert len(statements) == queries
+        assert len(page[key]) == 30 and page['next_cursor'] is None
+        items = collect(client, url + '?limit=7', key)
+        assert [i['name'] for i in items] == [f'lister_{key[0]}{i}' for i in range(30)]
+
+
+def test_team_membership_is_unique(app):
+    user_id = make_member_of(app, 'dupe', 1)
+    with app.app_context():
+        team = Team.query.filter_by(name='dupe_t0').first()
+        db.session.add(TeamMember(team_id=team.id, user_id=user_id, role='admin'))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
@@ -131,6 +131,45 @@
   const mo = new MutationObserver(scheduleUpdate);
   mo.observe(document.body, { attributes:true, childList:true, subtree:true });
 
+  // elements of the page's anchors, resolved once per selector and reused across batches
+  const anchorElements = new Map();
+  function resolveAnchor(selector){
+    const cached = anchorElements.get(selector);
+    if(cached && cached.isConnected) return cached;
+    let el = null;
+    try{ el = document.querySelector(selector); } catch(e){}
+    if(el) anchorElements.set(selector, el); else anchorElements.delete(selector);
+    return el;
+  }
+
+  // how long to wait for late-rendered content before calling an anchor unresolved
+  const ANCHOR_RETRY_MS = 3000;
+
+  // resolve every anchor of the page once it has rendered and tell the server
+  // which ones are missing, so anchors that go stale can be flagged for review
+  async function checkAnchors(cospaceId){
+    if(document.readyState !== 'complete') await new Promise(r=>window.addEventListener('load', r, {once:true}));
+    const res = await fetch('http://localhost:5000/api/cospaces/' + cospaceId + '/anchors?url=' + encodeURIComponent(location.href), {credentials:'include'});
+    if(!res.ok) return;
+    const selectors = (await res.json()).anchors.map(a => a.selector).filter(Boolean);
+    let unresolved = selectors.filter(s => !resolveAnchor(s));
+    if(unresolved.length){
+      await new Promise(r=>setTimeout(r, ANCHOR_RETRY_MS));
+      unresolved = unresolved.filter(s => !resolveAnchor(s));
+    }
+    if(!selectors.length) return;
+    const resolved = selectors.filter(s => !unresolved.includes(s));
+    await fetch('http://localhost:5000/api/cospaces/' + cospaceId + '/anchors/report', {
+      method:'POST', credentials:'include', headers:{'Content-Type':'application/json'},
+      body: JSON.stringify({url: location.href, resolved, unresolved})
+    });
+  }
+
+  // the server only knows pages of these schemes (not chrome:, about:, data: ...)
+  function pageUrl(){
+    return ['http:', 'https:', 'file:'].includes(location.protocol) ? location.href : null;
+  }
+
   async function longPollLoop(){
     // abort previous loop if any
     if(longPollAbort){ try{ longPollAbort.abort(); } catch(e){} }
@@ -138,18 +177,22 @@
     const signal = longPollAbort.signal;
     const cospaceId = await getActiveCospaceId();
     if(!cospaceId) return;
+    if(pageUrl()) checkAnchors(cospaceId).catch(()=>{});
     while(true){
       try{
-        const res = await fetch('http://localhost:5000/api/comments/longpoll/' + cospaceId + '?since_id=' + lastSeenId + '&timeout=25', {credentials:'include', signal});
-        if(!res.ok) break;
+        // only ask for comments anchored to this page (and those without a page)
+        const url = pageUrl();
+        const res = await fetch('http://localhost:5000/api/comments/longpoll/' + cospaceId + '?since_id=' + lastSeenId + '&timeout=25' + (url ? '&url=' + encodeURIComponent(url) : ''), {credentials:'include', signal});
+        // signed out, not a member or the cospace is gone: polling again will not help
+        if(res.status === 401 || res.status === 403 || res.status === 404) break;
+        if(!res.ok){ await new Promise(r=>setTimeout(r, 2000)); continue; }
         const items = await res.json();
         if(items && items.length){
           for(const c of items){
             if(c.id > lastSeenId) lastSeenId = c.id;
             showToast((c.author||'Anonymous') + ': ' + (c.text.length>120? c.text.slice(0,120)+'...': c.text), ()=>{ window.open(chrome.runtime.getURL('dashboard.html'), '_blank'); });
-            if(c.selector){
-              try{ const el = document.querySelector(c.selector); if(el) attachBadgeToElement(el, c); } catch(e){}
-            }
+            const el = c.selector && resolveAnchor(c.selector);
+            if(el) attachBadgeToElement(el, c);
           }
         }
         // continue loop immediately for next batch